@@ -1,6 +1,5 @@
 import type { HeatmapData } from '@/components/charts/MatrixHeatmap.vue'
-import { getFinalPositionFromIndexAndAxes, getGraphAxesForPlane } from '@/lib/simulation/graphAxis'
-import type { TimeSeriesPoint } from '@/stores/simulation/scenarios'
+import type { ScenarioPlane, TimeSeriesPoint } from '@/stores/simulation/scenarios'
 import type { SimulationResultPlaneAtomicData } from '@/stores/simulation/simulationResultPlane'
 
 export type DisplayMode = 'scenarioA' | 'scenarioB' | 'difference'
@@ -13,31 +12,20 @@ export interface HeatmapMetadata {
 export function getMetadataForDataIndex(
   indexX: number,
   indexY: number,
-  planeSlug: string,
+  plane: ScenarioPlane,
   timeSeriesPointsList?: TimeSeriesPoint[] | null
 ): HeatmapMetadata | undefined {
-  if (!timeSeriesPointsList) return undefined
+  const pointIndex = plane.points[`${indexX};${indexY}`]
+  if (pointIndex === undefined) return undefined
 
-  const { x: trueX, y: trueY } = getFinalPositionFromIndexAndAxes(
-    indexX,
-    indexY,
-    getGraphAxesForPlane(planeSlug),
-    false
-  )
-  const point = timeSeriesPointsList.find(
-    (point) => point.c[0] === trueX && point.c[1] === trueY && point.p === planeSlug
-  )
-  if (point) {
-    return { pointSlug: point.s, pointName: point.n }
-  }
-
-  return undefined
+  const point = timeSeriesPointsList?.[pointIndex]
+  return point ? { pointSlug: point.s, pointName: point.n } : undefined
 }
 
 export function dataToHeatmapData(
   data: (number | null)[][],
   flipX: boolean,
-  planeSlug: string,
+  plane: ScenarioPlane,
   timeSeriesPointsList?: TimeSeriesPoint[] | null
 ): HeatmapData[] {
   const heatmapData: HeatmapData[] = []
@@ -46,7 +34,7 @@ export function dataToHeatmapData(
       const x = flipX ? data.length - 1 - i : i
       heatmapData.push({
         value: [x, j, data[i][j]],
-        metadata: getMetadataForDataIndex(i, j, planeSlug, timeSeriesPointsList)
+        metadata: getMetadataForDataIndex(i, j, plane, timeSeriesPointsList)
       })
     }
   }
@@ -0,0 +1,54 @@
+import { cdnUrl } from '@/config/layerTypes'
+import { KeyedCache } from '@/lib/utils/cache'
+
+export interface ScenarioManifestEntry {
+  hash: string // truncated sha256 of the file content
+  size: number // bytes
+}
+
+export interface ScenarioManifest {
+  blobs?: boolean // true when every file also exists as blobs/<hash[0:2]>/<hash>.json, shared by all scenarios
+  files: { [path: string]: ScenarioManifestEntry } // path relative to the scenario directory
+}
+
+async function fetchScenarioManifest(scenarioSlug: string): Promise<ScenarioManifest | null> {
+  // The manifest is the only scenario file that is revalidated, every other file is versioned by its hash
+  const response = await fetch(`${cdnUrl}/simulation/scenarios/${scenarioSlug}/manifest.json`, {
+    cache: 'no-cache'
+  })
+  if (!response.ok) {
+    // Scenarios processed before manifests existed
+    return null
+  }
+  return response.json()
+}
+
+const scenarioManifestCache = new KeyedCache<ScenarioManifest | null, Error>(fetchScenarioManifest)
+
+// null for scenarios without a manifest
+export async function getScenarioManifest(scenarioSlug: string): Promise<ScenarioManifest | null> {
+  return scenarioManifestCache.get(scenarioSlug).catch(() => null)
+}
+
+function versionedUrl(url: string, path: string, manifest: ScenarioManifest): string | null {
+  const entry = manifest.files[path]
+  if (!entry) {
+    return null
+  }
+  if (manifest.blobs) {
+    // Identical files of different scenarios have the same URL, so they are fetched and cached once
+    return `${cdnUrl}/simulation/blobs/${entry.hash.slice(0, 2)}/${entry.hash}.json`
+  }
+  return `${url}?v=${entry.hash}`
+}
+
+export async function fetchScenarioFile(scenarioSlug: string, path: string): Promise<Response> {
+  const url = `${cdnUrl}/simulation/scenarios/${scenarioSlug}/${path}`
+  const manifest = await getScenarioManifest(scenarioSlug)
+  const cachedUrl = manifest ? versionedUrl(url, path, manifest) : null
+  if (cachedUrl) {
+    // The URL changes with the content, so any cached copy is up to date
+    return fetch(cachedUrl, { cache: 'force-cache' })
+  }
+  return fetch(url, { cache: 'no-store' })
+}
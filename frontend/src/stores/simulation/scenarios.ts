@@ -1,6 +1,8 @@
 import { cdnUrl } from '@/config/layerTypes'
-import { KeyedCache } from '@/lib/utils/cache'
+import type { GraphAxes } from '@/lib/simulation/graphAxis'
+import { KeyedCache, makeCompositeKey, parseCompositeKey } from '@/lib/utils/cache'
 import { defineStore } from 'pinia'
+import { fetchScenarioFile } from './scenarioManifest'
 
 export interface BuildingPart {
   x: number
@@ -40,9 +42,7 @@ export type ScenarioMap = {
 }
 
 async function fetchBuilding(key: string): Promise<BuildingMap> {
-  const response = await fetch(`${cdnUrl}/simulation/scenarios/${key}/buildingMap.json`, {
-    cache: 'no-store'
-  })
+  const response = await fetchScenarioFile(key, 'buildingMap.json')
   if (!response.ok) {
     throw new Error(`Failed to fetch building map: ${response.statusText}`)
   }
@@ -50,9 +50,7 @@ async function fetchBuilding(key: string): Promise<BuildingMap> {
 }
 
 async function fetchSoilMap(key: string): Promise<SoilMap> {
-  const response = await fetch(`${cdnUrl}/simulation/scenarios/${key}/soilMap.json`, {
-    cache: 'no-store'
-  })
+  const response = await fetchScenarioFile(key, 'soilMap.json')
   if (!response.ok) {
     throw new Error(`Failed to fetch soil map: ${response.statusText}`)
   }
@@ -60,9 +58,7 @@ async function fetchSoilMap(key: string): Promise<SoilMap> {
 }
 
 async function fetchObjectsMap(key: string): Promise<SimulationObjectMap> {
-  const response = await fetch(`${cdnUrl}/simulation/scenarios/${key}/objectsMap.json`, {
-    cache: 'no-store'
-  })
+  const response = await fetchScenarioFile(key, 'objectsMap.json')
   if (!response.ok) {
     throw new Error(`Failed to fetch objects map: ${response.statusText}`)
   }
@@ -103,7 +99,7 @@ export interface ScenarioCollection {
 
 async function fetchScenarioDescriptions(): Promise<ScenarioCollection> {
   const response = await fetch(`${cdnUrl}/simulation/scenarios/scenarios.json`, {
-    cache: 'no-store'
+    cache: 'no-cache'
   })
   if (!response.ok) {
     throw new Error(`Failed to fetch scenario descriptions: ${response.statusText}`)
@@ -120,15 +116,51 @@ export interface TimeSeriesPoint {
 }
 
 async function fetchScenarioTimeSeriesPoints(scenario: string): Promise<TimeSeriesPoint[]> {
-  const response = await fetch(`${cdnUrl}/simulation/scenarios/${scenario}/timeSeriesPoints.json`, {
-    cache: 'no-store'
-  })
+  const response = await fetchScenarioFile(scenario, 'timeSeriesPoints.json')
   if (!response.ok) {
     throw new Error(`Failed to fetch scenario descriptions: ${response.statusText}`)
   }
   return response.json()
 }
 
+// Heatmap axes of each plane of a scenario, and the heatmap cell of each time series point on it:
+// { [planeSlug]: { axes, points: { 'i;j': index in the time series points list } } }
+export interface ScenarioPlane {
+  axes: GraphAxes
+  points: Record<string, number>
+}
+
+export type ScenarioPlanes = Record<string, ScenarioPlane>
+
+async function fetchScenarioPlanes(scenario: string): Promise<ScenarioPlanes> {
+  const response = await fetchScenarioFile(scenario, 'planes.json')
+  if (!response.ok) {
+    throw new Error(`Failed to fetch scenario planes: ${response.statusText}`)
+  }
+  return response.json()
+}
+
+// Wall elevation of the façade planes of one orientation (facade_X, facade_Y, facade_Z): the
+// coordinates of its columns, the walls side by side along wall_axis, and of its levels, with the
+// heatmap axes of the elevation
+export interface FacadeIndex {
+  orientation: string
+  axes: [string, string] // along the walls, levels
+  wall_axis: string
+  columns: Record<string, number[]>
+  levels: number[]
+  graphAxes: GraphAxes
+}
+
+async function fetchFacadeIndex(key: string): Promise<FacadeIndex> {
+  const [scenario, orientation] = parseCompositeKey(key)
+  const response = await fetchScenarioFile(scenario!, `facades/${orientation}.json`)
+  if (!response.ok) {
+    throw new Error(`Failed to fetch façade index: ${response.statusText}`)
+  }
+  return response.json()
+}
+
 export const useScenariosStore = defineStore('scenarios', () => {
   const scenarioDescriptionsCache = new KeyedCache<ScenarioCollection, Error>(
     fetchScenarioDescriptions
@@ -137,6 +169,8 @@ export const useScenariosStore = defineStore('scenarios', () => {
   const scenarioTimeSeriesCache = new KeyedCache<TimeSeriesPoint[], Error>(
     fetchScenarioTimeSeriesPoints
   )
+  const scenarioPlanesCache = new KeyedCache<ScenarioPlanes, Error>(fetchScenarioPlanes)
+  const facadeIndexCache = new KeyedCache<FacadeIndex, Error>(fetchFacadeIndex)
 
   async function getScenarioDescriptions(): Promise<ScenarioCollection> {
     return scenarioDescriptionsCache.get('all') // TODO: make cache without key ?
@@ -161,6 +195,30 @@ export const useScenariosStore = defineStore('scenarios', () => {
     return scenarioTimeSeriesCache.get(slug ?? 'S0')
   }
 
+  async function getPlanesForScenario(slug?: string): Promise<ScenarioPlanes> {
+    return scenarioPlanesCache.get(slug ?? 'S0')
+  }
+
+  async function getFacadeIndexForScenario(
+    slug: string,
+    orientation: string
+  ): Promise<FacadeIndex> {
+    return facadeIndexCache.get(makeCompositeKey([slug, orientation]))
+  }
+
+  // The façade planes have their axes in their façade index and no time series point
+  async function getScenarioPlane(slug: string, planeSlug: string): Promise<ScenarioPlane> {
+    if (planeSlug.startsWith('facade_')) {
+      const facadeIndex = await getFacadeIndexForScenario(slug, planeSlug.slice('facade_'.length))
+      return { axes: facadeIndex.graphAxes, points: {} }
+    }
+    const plane = (await getPlanesForScenario(slug))[planeSlug]
+    if (!plane) {
+      throw new Error(`Plane ${planeSlug} not found for scenario ${slug}`)
+    }
+    return plane
+  }
+
   async function getDefaultTimeSeriesPoints(): Promise<TimeSeriesPoint[]> {
     return getAvailableTimeSeriesPointsForScenario()
   }
@@ -188,6 +246,9 @@ export const useScenariosStore = defineStore('scenarios', () => {
     getScenarioDescriptionBySlug,
     getDefaultTimeSeriesPoints,
     getAvailableTimeSeriesPointsForScenario,
+    getPlanesForScenario,
+    getFacadeIndexForScenario,
+    getScenarioPlane,
     getFullTimeSeriesPointFromSlug,
     getFullTimeSeriesPointFromSlugOrNull
   }
@@ -1,7 +1,7 @@
 import { getMinMaxAcrossMultipleScenarios } from '@/components/simulation/heatmap/heatmapUtils'
-import { cdnUrl } from '@/config/layerTypes'
 import { KeyedCache, makeCompositeKey, parseCompositeKey } from '@/lib/utils/cache'
 import { defineStore } from 'pinia'
+import { fetchScenarioFile, getScenarioManifest } from './scenarioManifest'
 
 export type SimulationResultPlaneAtomicData = (number | null)[][]
 
@@ -9,6 +9,26 @@ export type SimulationResultPlaneData = {
   data: SimulationResultPlaneAtomicData
 }
 
+// Plane file as written by the processing: the valid values in row order, the null cells are
+// described by a mask shared by every variable and time of the scenario
+type MaskedPlaneFile = {
+  mask: string // hash, the mask is at masks/<hash>.json
+  values: number[]
+}
+
+// Plane of a variant scenario stored as its differences with the same plane of its baseline scenario
+type DeltaPlaneFile = {
+  baseline: { scenario: string; hash: string } // hash of the baseline plane file it was encoded against
+  shape: [number, number] // rows, columns
+  cells: number[] // indices in row order of the cells that differ from the baseline
+  values: (number | null)[] // values of these cells
+}
+
+type PlaneMask = {
+  shape: [number, number] // rows, columns
+  runs: number[] // lengths of alternating null and valid runs in row order, starting with nulls
+}
+
 export interface SimulationResultPlaneValues {
   axisX: {
     name: string
@@ -25,6 +45,25 @@ export interface SimulationResultPlaneValues {
   }
 }
 
+export type PlaneDistribution = {
+  count: number
+  mean: number | null
+  counts: number[] | null // one per bin
+  quantiles: number[] | null // at the levels of SimulationResultPlaneStats.quantiles
+}
+
+export type SimulationResultPlaneStats = {
+  quantiles: number[] // levels, from 0 to 1
+  planes: Record<
+    string,
+    {
+      edges: number[] | null // bin edges shared by all the times of the plane
+      times: Record<string, PlaneDistribution> // key is the time slice slug
+      all: PlaneDistribution
+    }
+  > // key is the plane slug
+}
+
 function getDifferenceData(
   a: SimulationResultPlaneAtomicData,
   b: SimulationResultPlaneAtomicData
@@ -48,19 +87,104 @@ function getDifferenceData(
   return diff
 }
 
+// key is in the form `${scenarioSlug};${maskHash}`
+async function fetchPlaneMask(key: string): Promise<PlaneMask> {
+  const [scenarioSlug, maskHash] = parseCompositeKey(key)
+  const response = await fetchScenarioFile(scenarioSlug!, `masks/${maskHash}.json`)
+  if (!response.ok) {
+    throw new Error(`Failed to fetch plane mask: ${response.statusText}`)
+  }
+  return response.json()
+}
+
+const planeMaskCache = new KeyedCache<PlaneMask, Error>(fetchPlaneMask)
+
+function decodeMaskedPlane(mask: PlaneMask, values: number[]): SimulationResultPlaneAtomicData {
+  const [rows, columns] = mask.shape
+  const data: SimulationResultPlaneAtomicData = Array.from({ length: rows }, () =>
+    new Array<number | null>(columns).fill(null)
+  )
+  let cell = 0
+  let valueIndex = 0
+  mask.runs.forEach((run, runIndex) => {
+    if (runIndex % 2 === 1) {
+      for (let c = cell; c < cell + run; c++) {
+        data[Math.floor(c / columns)][c % columns] = values[valueIndex++]
+      }
+    }
+    cell += run
+  })
+  return data
+}
+
+function applyPlaneDelta(
+  baseline: SimulationResultPlaneAtomicData,
+  delta: DeltaPlaneFile
+): SimulationResultPlaneAtomicData {
+  const [rows, columns] = delta.shape
+  if (baseline.length !== rows || baseline.some((row) => row.length !== columns)) {
+    throw new Error(
+      `Plane delta of shape ${rows}x${columns} does not match its baseline of shape ` +
+        `${baseline.length}x${baseline[0]?.length ?? 0}`
+    )
+  }
+  // Copied, the baseline data may be displayed at the same time
+  const data = baseline.map((row) => row.slice())
+  delta.cells.forEach((cell, index) => {
+    data[Math.floor(cell / columns)][cell % columns] = delta.values[index]
+  })
+  return data
+}
+
 async function fetchSimulationResultForScenarioPlaneTimeAndVariable(
   scenarioSlug: string,
   planeSlug: string,
   timeSliceSlug: string,
   variableSlug: string
 ): Promise<SimulationResultPlaneData> {
-  const response = await fetch(
-    `${cdnUrl}/simulation/scenarios/${scenarioSlug}/${variableSlug}/${timeSliceSlug}/${planeSlug}.json`,
-    { cache: 'no-store' }
+  const response = await fetchScenarioFile(
+    scenarioSlug,
+    `${variableSlug}/${timeSliceSlug}/${planeSlug}.json`
   )
   if (!response.ok) {
     throw new Error(`Failed to fetch simulation result: ${response.statusText}`)
   }
+  const plane: SimulationResultPlaneData | MaskedPlaneFile | DeltaPlaneFile = await response.json()
+  if ('data' in plane) {
+    // Planes processed before masks existed
+    return plane
+  }
+  if ('baseline' in plane) {
+    // The differences only apply to the baseline plane they were computed against
+    const path = `${variableSlug}/${timeSliceSlug}/${planeSlug}.json`
+    const baselineManifest = await getScenarioManifest(plane.baseline.scenario)
+    if (baselineManifest?.files[path]?.hash !== plane.baseline.hash) {
+      throw new Error(
+        `${scenarioSlug}/${path} was encoded against another version of ${plane.baseline.scenario}`
+      )
+    }
+    const baseline = await fetchSimulationResultForScenarioPlaneTimeAndVariable(
+      plane.baseline.scenario,
+      planeSlug,
+      timeSliceSlug,
+      variableSlug
+    )
+    return { data: applyPlaneDelta(baseline.data, plane) }
+  }
+  const mask = await planeMaskCache.get(makeCompositeKey([scenarioSlug, plane.mask]))
+  return { data: decodeMaskedPlane(mask, plane.values) }
+}
+
+// key is in the form `${scenarioSlug};${variableSlug}`
+async function fetchSimulationResultPlaneStats(
+  key: string
+): Promise<SimulationResultPlaneStats | null> {
+  const [scenarioSlug, variableSlug] = parseCompositeKey(key)
+  const response = await fetchScenarioFile(scenarioSlug!, `${variableSlug}/planeStats.json`)
+  if (!response.ok) {
+    // Scenarios processed before plane statistics existed
+    return null
+  }
   return response.json()
 }
 
@@ -98,6 +222,9 @@ export const useSimulationResultPlaneStore = defineStore('simulationResultPlane'
   const scenarioDataCache = new KeyedCache<SimulationResultPlaneData, Error>(
     fetchSimulationResultPlaneData
   )
+  const planeStatsCache = new KeyedCache<SimulationResultPlaneStats | null, Error>(
+    fetchSimulationResultPlaneStats
+  )
 
   const simulationResultPlaneCache = new KeyedCache<SimulationResultPlaneValues, Error>(
     // key is in the form `${scenarioASlug};${scenarioBSlug};${planeSlug};${timeSliceSlug};${variableSlug}`
@@ -161,18 +288,31 @@ export const useSimulationResultPlaneStore = defineStore('simulationResultPlane'
     )
   }
 
+  async function getPlaneStatsForScenario(
+    scenarioSlug: string,
+    variableSlug: string
+  ): Promise<SimulationResultPlaneStats | null> {
+    return planeStatsCache.get(makeCompositeKey([scenarioSlug, variableSlug])).catch(() => null)
+  }
+
   async function getMinMaxForMultipleScenariosSlugs(
     scenarioSlugs: string[],
     planeSlug: string,
     timeSliceSlug: string,
     variableSlug: string
   ): Promise<{ min: number; max: number }> {
+    // The extreme quantiles of the plane statistics, the full plane only for scenarios without them
     const allData: SimulationResultPlaneAtomicData[] = await Promise.all(
-      scenarioSlugs.map((scenarioSlug) =>
-        getPlaneDataForScenario(scenarioSlug, planeSlug, timeSliceSlug, variableSlug).then(
+      scenarioSlugs.map(async (scenarioSlug) => {
+        const stats = await getPlaneStatsForScenario(scenarioSlug, variableSlug)
+        const quantiles = stats?.planes[planeSlug]?.times[timeSliceSlug]?.quantiles
+        if (quantiles) {
+          return [[quantiles[0], quantiles[quantiles.length - 1]]]
+        }
+        return getPlaneDataForScenario(scenarioSlug, planeSlug, timeSliceSlug, variableSlug).then(
           (res) => res.data
         )
-      )
+      })
     )
 
     return getMinMaxAcrossMultipleScenarios(allData)
@@ -180,6 +320,7 @@ export const useSimulationResultPlaneStore = defineStore('simulationResultPlane'
 
   return {
     getPlaneDataForScenario,
+    getPlaneStatsForScenario,
     getSimulationResultPlane,
     getMinMaxForMultipleScenariosSlugs
   }
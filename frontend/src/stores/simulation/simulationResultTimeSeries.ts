@@ -1,6 +1,6 @@
-import { cdnUrl } from '@/config/layerTypes'
 import { KeyedCache, makeCompositeKey, parseCompositeKey } from '@/lib/utils/cache'
 import { defineStore } from 'pinia'
+import { fetchScenarioFile, getScenarioManifest } from './scenarioManifest'
 
 export type TimeSeriesDataPoint = {
   t: string
@@ -34,6 +34,29 @@ export type SimulationResultTimeSeriesMultiVariableData = {
   variables: Record<string, TimeSeriesDataPoint[]> // key is slug
 }
 
+export type PointSeriesData = {
+  requested_coords: { x: number; y: number; z: number }
+  times: string[]
+  variables: Record<
+    string,
+    { true_coords: { x: number; y: number; z: number | null }; v: (number | null)[] }
+  > // key is slug
+}
+
+export type ScenarioComparisonData = {
+  times: string[]
+  scenarios: Record<
+    string,
+    {
+      requested_coords: { x: number; y: number; z: number }
+      true_coords: { x: number; y: number; z: number | null }
+      times?: string[] // only when it differs from the shared time axis
+      v: (number | null)[]
+      source?: string // hash of the pointSeries file of the scenario the series was merged from
+    }
+  > // key is slug
+}
+
 export type TimeSeriesDepthDataPoint = {
   d: number
   v: number[]
@@ -51,9 +74,9 @@ async function fetchSimulationResultTimeSeriesForScenarioVariableAndPoint(
   variableSlug: string,
   pointSlug: string
 ): Promise<TimeSeriesData> {
-  const response = await fetch(
-    `${cdnUrl}/simulation/scenarios/${scenarioSlug}/${variableSlug}/timeSeries/${pointSlug}.json`,
-    { cache: 'no-store' }
+  const response = await fetchScenarioFile(
+    scenarioSlug,
+    `${variableSlug}/timeSeries/${pointSlug}.json`
   )
   if (!response.ok) {
     throw new Error(`Failed to fetch simulation result: ${response.statusText}`)
@@ -66,9 +89,9 @@ async function fetchSimulationResultDepthTemporalVariationsForScenarioVariableAn
   variableSlug: string,
   pointSlug: string
 ): Promise<SimulationResultTimeSeriesMultiPointData> {
-  const response = await fetch(
-    `${cdnUrl}/simulation/scenarios/${scenarioSlug}/${variableSlug}/depthTemporalVariations/${pointSlug}.json`,
-    { cache: 'no-store' }
+  const response = await fetchScenarioFile(
+    scenarioSlug,
+    `${variableSlug}/depthTemporalVariations/${pointSlug}.json`
   )
   if (!response.ok) {
     throw new Error(`Failed to fetch simulation result: ${response.statusText}`)
@@ -76,6 +99,38 @@ async function fetchSimulationResultDepthTemporalVariationsForScenarioVariableAn
   return response.json()
 }
 
+async function fetchPointSeriesForScenarioAndPoint(key: string): Promise<PointSeriesData | null> {
+  const [scenarioSlug, pointSlug] = parseCompositeKey(key)
+  const response = await fetchScenarioFile(scenarioSlug!, `pointSeries/${pointSlug}.json`)
+  if (!response.ok) {
+    // Scenarios processed before point series files existed
+    return null
+  }
+  return response.json()
+}
+
+// key is in the form `${variableSlug};${pointSlug}`
+async function fetchScenarioComparison(key: string): Promise<ScenarioComparisonData | null> {
+  const [variableSlug, pointSlug] = parseCompositeKey(key)
+  const response = await fetchScenarioFile('comparisons', `${variableSlug}/${pointSlug}.json`)
+  if (!response.ok) {
+    // Outputs merged before comparison files existed
+    return null
+  }
+  return response.json()
+}
+
+// The scenario may have been processed again since the comparison files were merged
+async function isComparisonUpToDate(
+  scenarioSlug: string,
+  pointSlug: string,
+  source: string | undefined
+): Promise<boolean> {
+  const manifest = await getScenarioManifest(scenarioSlug)
+  const entry = manifest?.files[`pointSeries/${pointSlug}.json`]
+  return !!entry && entry.hash === source
+}
+
 function formatPointCoordinate(value: number): string {
   if (Number.isInteger(value)) {
     return value.toString() + '_0'
@@ -164,6 +219,39 @@ async function fetchSimulationResultTemporalVariations(
 
 export const useSimulationResultTimeSeriesStore = defineStore('simulationResultTimeSeries', () => {
   const scenarioDataCache = new KeyedCache<TimeSeriesData, Error>(fetchSimulationResultTimeSeries)
+  const pointSeriesCache = new KeyedCache<PointSeriesData | null, Error>(
+    fetchPointSeriesForScenarioAndPoint
+  )
+  const scenarioComparisonCache = new KeyedCache<ScenarioComparisonData | null, Error>(
+    fetchScenarioComparison
+  )
+
+  // Series of a variable at a point for several scenarios, from the merged comparison file when
+  // it holds the scenario as currently processed and from the scenario's own file otherwise
+  async function getScenariosData(
+    scenarioSlugs: string[],
+    variableSlug: string,
+    pointSlug: string
+  ): Promise<TimeSeriesData[]> {
+    const comparison = await scenarioComparisonCache
+      .get(makeCompositeKey([variableSlug, pointSlug]))
+      .catch(() => null)
+
+    return Promise.all(
+      scenarioSlugs.map(async (slug) => {
+        const series = comparison?.scenarios[slug]
+        if (comparison && series && (await isComparisonUpToDate(slug, pointSlug, series.source))) {
+          const times = series.times ?? comparison.times
+          return {
+            requested_coords: series.requested_coords,
+            true_coords: series.true_coords,
+            data: times.map((t, i) => ({ t, v: series.v[i] as number }))
+          } as TimeSeriesData
+        }
+        return scenarioDataCache.get(makeSlugForSingleScenario(slug, variableSlug, pointSlug))
+      })
+    )
+  }
 
   const simulationResultTimeSeriesCache = new KeyedCache<
     SimulationResultTimeSeriesComparison,
@@ -173,14 +261,11 @@ export const useSimulationResultTimeSeriesStore = defineStore('simulationResultT
     async (key: string) => {
       const [scenarioASlug, scenarioBSlug, variableSlug, pointSlug] = parseCompositeKey(key)
 
-      const [scenarioAData, scenarioBData] = await Promise.all([
-        scenarioDataCache.get(makeSlugForSingleScenario(scenarioASlug!, variableSlug!, pointSlug!)),
-        scenarioBSlug
-          ? scenarioDataCache.get(
-              makeSlugForSingleScenario(scenarioBSlug, variableSlug!, pointSlug!)
-            )
-          : null
-      ])
+      const [scenarioAData, scenarioBData = null] = await getScenariosData(
+        scenarioBSlug ? [scenarioASlug!, scenarioBSlug] : [scenarioASlug!],
+        variableSlug!,
+        pointSlug!
+      )
 
       const differenceData = scenarioBData
         ? getDifferenceData(scenarioBData.data, scenarioAData.data) // b - a so that it's positive when scenarioB > scenarioA
@@ -204,14 +289,10 @@ export const useSimulationResultTimeSeriesStore = defineStore('simulationResultT
     async (key: string) => {
       const [scenariosSlugs, variableSlug, pointSlug] = parseCompositeKey(key)
 
-      const scenariosData: [string, TimeSeriesData][] = await Promise.all(
-        scenariosSlugs!.split('-').map(async (slug) => {
-          return [
-            slug,
-            await scenarioDataCache.get(makeSlugForSingleScenario(slug, variableSlug!, pointSlug!))
-          ]
-        })
-      )
+      const slugs = scenariosSlugs!.split('-')
+      const scenariosData: [string, TimeSeriesData][] = (
+        await getScenariosData(slugs, variableSlug!, pointSlug!)
+      ).map((data, i) => [slugs[i], data])
 
       const scenarioAData = scenariosData[0]
 
@@ -231,8 +312,24 @@ export const useSimulationResultTimeSeriesStore = defineStore('simulationResultT
     async (key: string) => {
       const [scenarioSlug, variablesSlug, pointSlug] = parseCompositeKey(key)
 
+      // One request for all the variables of the point, falling back to one request per variable
+      const pointSeries = await pointSeriesCache
+        .get(makeCompositeKey([scenarioSlug!, pointSlug!]))
+        .catch(() => null)
+
       const variablesData: [string, TimeSeriesData][] = await Promise.all(
         variablesSlug!.split('-').map(async (slug) => {
+          const series = pointSeries?.variables[slug]
+          if (pointSeries && series) {
+            return [
+              slug,
+              {
+                requested_coords: pointSeries.requested_coords,
+                true_coords: series.true_coords,
+                data: pointSeries.times.map((t, i) => ({ t, v: series.v[i] as number }))
+              } as TimeSeriesData
+            ]
+          }
           return [
             slug,
             await scenarioDataCache.get(makeSlugForSingleScenario(scenarioSlug!, slug, pointSlug!))
@@ -1,6 +1,6 @@
-import { cdnUrl } from '@/config/layerTypes'
 import { KeyedCache, makeCompositeKey, parseCompositeKey } from '@/lib/utils/cache'
 import { defineStore } from 'pinia'
+import { fetchScenarioFile } from './scenarioManifest'
 
 export type TimeSeriesDepthDataPoint = {
   t: string // time
@@ -31,9 +31,9 @@ async function fetchSimulationResultTimeSeriesDepthForScenarioVariableAndPoint(
   variableSlug: string,
   pointSlug: string
 ): Promise<TimeSeriesDepthData> {
-  const response = await fetch(
-    `${cdnUrl}/simulation/scenarios/${scenarioSlug}/${variableSlug}/depthSeries/${pointSlug}.json`,
-    { cache: 'no-store' }
+  const response = await fetchScenarioFile(
+    scenarioSlug,
+    `${variableSlug}/depthSeries/${pointSlug}.json`
   )
   if (!response.ok) {
     throw new Error(`Failed to fetch simulation result: ${response.statusText}`)
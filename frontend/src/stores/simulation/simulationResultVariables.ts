@@ -37,7 +37,7 @@ export type SluggedVariableAttributes = {
 
 async function fetchVariablesAttributes(): Promise<VariableAttributes> {
   const response = await fetch(`${cdnUrl}/simulation/variablesAttributes.json`, {
-    cache: 'no-store'
+    cache: 'no-cache'
   })
   if (!response.ok) {
     throw new Error(`Failed to fetch variable attributes: ${response.statusText}`)
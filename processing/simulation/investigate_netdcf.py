@@ -1,295 +1,247 @@
-# This file is for exploring the NetCDF data and is not used to process the data as expected by the frontend.
-# It is kept here for reference and potential future use.
-# For actual data processing, please refer to process_netdcf.py in the same directory.
-
-
-import xarray as xr
-import pandas as pd
-import numpy as np
+# Profile raw NetCDF datasets: per variable null ratio, min/max, distinct values, coordinate ranges and on-disk
+# chunking/compression. This is not used to process the data for the frontend, see process_netcdf.py for that, and
+# its Scenario class to explore the processed products (planes, series, depth, maps) interactively.
+#
+# Variables are streamed in blocks along their first dimension (and the next ones when a single row is too large), so
+# a file of any size is profiled in bounded memory.
+# Reports are cached per file content hash, profiling the same file again is instant.
+
+import hashlib
 import json
+import sys
+import time
 from pathlib import Path
-import math
-
-scenario = "S4_1_Hedges"
-# scenario = "S3_3_Grass_Cover"
-
-file_path = f"./raw_data/{scenario}.nc"
-ds = xr.open_dataset(file_path)
-print(ds.data_vars)
-
-var_keys = ["T", "RelHum", "WindSpd"]
-
-def explore_variable(variable_name):
-    variable = ds.data_vars[variable_name]
-    print(variable)
-    print(variable.attrs)
-    print(variable.dims)
-    print(variable.shape)
-    print(variable.isel(Time=0))
-    my_df = variable.sel(GridsI = 1.0, GridsJ = 1.0).to_dataframe()
-    print(my_df.head(29))
-    return
-
-    values = variable.values.flatten()
-    unique_values = np.unique(values)
-    print(f"Unique values for {variable_name}: {unique_values}")
-    print(f"Number of unique values for {variable_name}: {len(unique_values)}")
-
-    """print("querying non-null values...")
-    query = variable.where(variable.notnull(), drop=True)
-    print("time_0 GridsK=1.45 non-null coordinates:")
-    time_0 = query.isel(Time=0).sel(GridsJ=121, GridsI=93, method="nearest")
-    print(f"Number of non-null coordinates for {variable_name} at Time=0 and GridsK=1.45: {len(time_0)}")
-    coords_df = time_0.to_dataframe().reset_index().drop(columns=["Time"])
-    print(f"Coordinates with non-null values for {variable_name} (total {len(coords_df)}):")
-    
-    with pd.option_context("display.max_rows", 350):
-        print(coords_df.head(350))
-
-    return
-
-    slice = variable.isel(Time=0).sel(GridsJ=89, GridsK=0.2, method="nearest")
-    print(f"Slice at GridsJ=89 for {variable_name} at Time=0:")
-    print(slice)
-    slice_df = slice.to_dataframe().reset_index()
-    print(slice_df.head(100))
-
-    return"""
-    target_value = 13.0
-    mask = variable.notnull() & (variable == target_value)
-
-    # Extract the indices (or coordinates) where this is true
-    coords = variable.where(mask, drop=True)
-
-    if coords.count() == 0:
-        print(f"No coordinates found with value {target_value} in {variable_name}.")
-        return None
-
-    # Convert to a dataframe for easier inspection
-    df = coords.to_dataframe().reset_index().dropna(subset=[variable_name])
-    
-    print(f"Found {len(df)} points with value {target_value} in {variable_name}.")
-    print("head")
-    print(df.head())  # show first few rows
-    print("tail")
-    print(df.tail())  # show last few rows
-
-    print("All GridsK values at these points:")
-    print(df["GridsK"].unique())
-
-
-explore_variable("SoilTemp")
-
-def prettify_unit(unit: str) -> str:
-    unit_mappings = {
-        "degree Celsius": "°C",
-        "m s-1": "m/s",
-    }
-    return unit_mappings.get(unit, unit)
+import argparse
 
-def get_variable_attributes_in_dict(ds, variable_name):
-    variable = ds.data_vars[variable_name]
-    attrs = variable.attrs
-    return {k: prettify_unit(attrs[k]) for k in attrs}
+from process_netcdf import LazyModule, file_hash, save_json, to_json_compatible, format_bytes
 
-def export_variable_attributes(variable_names=var_keys):
-    vars = {}
-    for variable_name in variable_names:
-        attrs_dict = get_variable_attributes_in_dict(ds, variable_name)
-        vars[variable_name] = attrs_dict
+xr = LazyModule("xarray", globals())
+np = LazyModule("numpy", globals())
 
-    save_json_for_scenario(to_json_compatible(vars), scenario, "", "variable_attributes")
+# Bump when the content of the report changes, so that cached reports are recomputed
+report_version = 1
 
 
+# Report cache
 
+def load_json_or_empty(path: Path):
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
 
-def get_variable_at_time(ds, variable_name, time_index=0):
-    variable = ds.data_vars[variable_name]
-    time_slice = variable.isel(Time=time_index)
-    df = time_slice.to_dataframe().reset_index().drop(columns=["Time"]).rename(columns={"GridsI": "x", "GridsJ": "y", "GridsK": "z", variable_name: "value"})
-    return df
 
-def slice_xy_plane_at_z(df, z_value):
-    return df[df["z"] == z_value]
+# Profiling
 
-def slice_yz_plane_at_x(df, x_value):
-    return df[df["x"] == x_value]
-
-def get_plane_slicers_for_scenario(scenario: str):
-    return [
-        {
-            "slug": "horizontal_ground",
-            "slicer": lambda df: slice_xy_plane_at_z(df, 0.2),
-        },
-        {
-            "slug": "horizontal_human_height",
-            "slicer": lambda df: slice_xy_plane_at_z(df, 1.4000000953674316),
-        },
-        {
-            "slug": "horizontal_building_canopy",
-            "slicer": lambda df: slice_xy_plane_at_z(df, 31.0 if scenario == "S1_Tall_Canyon_Scenario" else 17.0),
-        },
-        {
-            "slug": "vertical_mid_canyon",
-            "slicer": lambda df: slice_yz_plane_at_x(df, 99.0),
-            "index_column": "y",
-            "columns": "z",
-        },
-        {
-            "slug": "vertical_mid_building",
-            "slicer": lambda df: slice_yz_plane_at_x(df, 73.0 if scenario == "S2_Wide_Canyon" else 79.0),
-            "index_column": "y",
-            "columns": "z",
-        },
-    ]
-
-
-def to_json_compatible(value):
-    """Recursively convert numpy types and arrays to JSON-compatible types."""
-    if isinstance(value, (np.floating,)):
-        return float(value)
-    elif isinstance(value, (np.integer,)):
-        return int(value)
-    elif isinstance(value, (np.ndarray, list, tuple)):
-        return [to_json_compatible(v) for v in value]
-    elif isinstance(value, dict):
-        return {k: to_json_compatible(v) for k, v in value.items()}
-    elif isinstance(value, float):
-        if math.isnan(value) or math.isinf(value):
-            return None
-        else:
-            return value
-    else:
-        return value
-
-def clean_nans(obj):
-    """Recursively replace NaN or inf with None for JSON safety."""
-    if isinstance(obj, list):
-        return [clean_nans(x) for x in obj]
-    if isinstance(obj, float):
-        if math.isnan(obj):
-            return None
-    return obj
-
-def slice_to_array_of_arrays(df, index_column="y", columns="x", value_column="value"):
-    to_2d = df.pivot(index=index_column, columns=columns, values=value_column)
-    return to_2d.where(pd.notna(to_2d), None).values.tolist()
-
-def save_plane_slices_for_var_at_time(variable_name="T", time_index=0):
-    variable_at_time = get_variable_at_time(ds, variable_name, time_index)
-    slicers = get_plane_slicers_for_scenario(scenario)
-
-    for slicer in slicers:
-        # print(f"--- {slicer['slug']} ---")
-        sliced = slicer["slicer"](variable_at_time)
-        # print(sliced)
-        array_2d = slice_to_array_of_arrays(df=sliced, index_column=slicer.get("index_column", "y"), columns=slicer.get("columns", "x"), value_column="value")
-        dict = {
-            "data": clean_nans(array_2d),
+def profile_dataset(path: Path, variable_names: list[str] = None, block_mb: float = 64.0, max_distinct: int = 65536):
+    started_at = time.time()
+    with xr.open_dataset(path) as ds:
+        variable_names = variable_names or list(ds.data_vars)
+        report = {
+            "version": report_version,
+            "file": str(path),
+            "size": path.stat().st_size,
+            "dimensions": dict(ds.sizes),
+            "coordinates": {name: profile_coordinate(ds[name]) for name in ds.coords},
+            "variables": {},
         }
-        save_slice_to_json(scenario, "potential_air_temperature", 0, slicer["slug"], dict)
-
-def save_json_for_scenario(dict, scenario, dir_path, filename):
-    output_dir = Path(f"./processed_data/{scenario}/{dir_path}")
-    output_dir.mkdir(parents=True, exist_ok=True)
-    output_path = output_dir / f"{filename}.json"
-    with open(output_path, "w") as f:
-        json.dump(dict, f, allow_nan=False, separators=(',', ':'))
-
-def save_slice_to_json(scenario, variable_name, time_index, slicer_slug, dict):
-    save_json_for_scenario(dict, scenario, f"{variable_name}/time_{time_index}", slicer_slug)
-
-def save_plane_slices_for_multiple_vars_at_multiple_times(variable_names=["T", "RH", "WS", "WD"], time_indices=[0, 6, 12, 18]):
-    for variable_name in variable_names:
-        for time_index in time_indices:
-            save_plane_slices_for_var_at_time(variable_name, time_index)
-
-# save_plane_slices_for_var_at_time()
-
-def hardcoded_side_color():
-    if scenario == "S2_Wide_Canyon":
-        return "#d4d4d4"
-    return "#aaaaaa"
-
-# The building Height seems to be stored in the BuildingHeight variable
-building_heights = ds.data_vars["BuildingHeight"]
-soil_profile_type = ds.data_vars["SoilProfileType"]
-
-def cleanedup_building_height():
-    first_time_slice = building_heights.isel(Time=0)
-    dataframe = first_time_slice.to_dataframe().reset_index().drop(columns=["Time"]).rename(columns={"GridsI": "x", "GridsJ": "y", "BuildingHeight": "h"})
-    dataframe_cleaned = dataframe[dataframe["h"].notna()]
-
-    for col in ["x", "y", "h"]:
-        dataframe_cleaned[col] = dataframe_cleaned[col].apply(lambda v: int(v) if float(v).is_integer() else v)
-
-    most_common_building_height = dataframe_cleaned["h"].mode()[0]
-    
-    # Convert to list of dicts and remove 'h' if equal to most_common_building_height, reduces size of JSON by about 29%
-    records = []
-    for record in dataframe_cleaned.to_dict(orient="records"):
-        if record["h"] == most_common_building_height:
-            record = {k: v for k, v in record.items() if k != "h"}
-        records.append(record)
-    
-    return {
-        "defaultHeight": float(most_common_building_height),
-        "defaultSideColor": hardcoded_side_color(),
-        "buildingsParts": records
+        for variable_name in variable_names:
+            print(f"Profiling {variable_name} {tuple(ds[variable_name].shape)}")
+            report["variables"][variable_name] = profile_variable(ds[variable_name], block_mb, max_distinct)
+    report["seconds"] = round(time.time() - started_at, 3)
+    return report
+
+def profile_coordinate(coordinate):
+    values = coordinate.values
+    profile = {"size": int(values.size), "dtype": str(values.dtype)}
+    if values.size and np.issubdtype(values.dtype, np.number):
+        steps = np.unique(np.diff(values)) if values.size > 1 else []
+        profile.update({"min": values.min(), "max": values.max(), "uniform_step": steps[0] if len(steps) == 1 else None})
+    elif values.size:
+        profile.update({"min": str(values.min()), "max": str(values.max())})
+    return to_json_compatible(profile)
+
+def profile_variable(variable, block_mb: float, max_distinct: int):
+    encoding = variable.encoding
+    profile = {
+        "dims": list(variable.dims),
+        "shape": list(variable.shape),
+        "dtype": str(variable.dtype),
+        "attrs": {key: str(value) for key, value in variable.attrs.items()},
+        "storage": {
+            "dtype": str(encoding.get("dtype", variable.dtype)),
+            "chunks": encoding.get("chunksizes"),
+            "contiguous": encoding.get("contiguous"),
+            "compression": storage_compression(encoding),
+            "shuffle": encoding.get("shuffle"),
+            "fill_value": encoding.get("_FillValue"),
+        },
     }
-
-def cleanedup_soiltype():
-    first_time_slice = soil_profile_type.isel(Time=0)
-    dataframe = first_time_slice.to_dataframe().reset_index().drop(columns=["Time"]).rename(columns={"GridsI": "x", "GridsJ": "y", "SoilProfileType": "t"})
-    for col in ["x", "y", "t"]:
-        dataframe[col] = dataframe[col].apply(lambda v: int(v) if float(v).is_integer() else v)
-
-    most_common_soil_type = dataframe["t"].mode()[0]
-    dataframe_anomalies = dataframe[dataframe["t"] != most_common_soil_type]
-
-    anomalies_dict = {}
-    for _, row in dataframe_anomalies.iterrows():
-        key = f"{row['x']};{row['y']}"
-        anomalies_dict[key] = int(row["t"])
-
-    return {
-        "defaultSoilType": int(most_common_soil_type),
-        "anomalies": anomalies_dict
+    if not np.issubdtype(variable.dtype, np.number):
+        return to_json_compatible(profile)
+
+    count = 0
+    null_count = 0
+    minimum = None
+    maximum = None
+    total = 0.0
+    distinct = DistinctValues(max_distinct)
+    for block in iter_blocks(variable, block_mb):
+        values = block.ravel()
+        valid = values[~np.isnan(values)] if np.issubdtype(values.dtype, np.floating) else values
+        count += values.size
+        null_count += values.size - valid.size
+        if valid.size:
+            minimum = valid.min() if minimum is None else min(minimum, valid.min())
+            maximum = valid.max() if maximum is None else max(maximum, valid.max())
+            total += float(valid.sum(dtype="float64"))
+            distinct.add(valid)
+
+    valid_count = count - null_count
+    profile["stats"] = {
+        "count": count,
+        "null_count": null_count,
+        "null_ratio": null_count / count if count else None,
+        "min": minimum,
+        "max": maximum,
+        "mean": total / valid_count if valid_count else None,
+        "distinct": distinct.count(),
+        "distinct_exact": distinct.is_exact(),
     }
-
-def save_json(dict, path, pretty=False):
-    with open(path, "w") as f:
-        if pretty:
-            json.dump(dict, f, indent=4)
+    return to_json_compatible(profile)
+
+def storage_compression(encoding: dict):
+    for name in ["zlib", "zstd", "bzip2", "szip", "blosc"]:
+        if encoding.get(name):
+            return {"codec": name, "level": encoding.get("complevel")}
+    return None
+
+def iter_blocks(variable, block_mb: float):
+    # Blocks in storage order, as large as fits in block_mb: rows along the first dimension, and when a single row does
+    # not fit (a large grid at one time step), the rows split the same way along the next dimensions
+    if variable.ndim == 0:
+        yield np.asarray(variable.values)
+        return
+    max_values = max(1, int(block_mb * (1 << 20) // variable.dtype.itemsize))
+    yield from iter_blocks_of_values(variable, max_values)
+
+def iter_blocks_of_values(variable, max_values: int):
+    first_dimension = variable.dims[0]
+    row_values = variable.size // max(1, variable.shape[0])
+    if row_values > max_values and variable.ndim > 1:
+        for index in range(variable.shape[0]):
+            yield from iter_blocks_of_values(variable.isel({first_dimension: index}), max_values)
+        return
+    rows_per_block = max(1, max_values // max(1, row_values))
+    for start in range(0, variable.shape[0], rows_per_block):
+        yield variable.isel({first_dimension: slice(start, start + rows_per_block)}).values
+
+
+# Distinct values: the k smallest 64-bit hashes of the values seen so far (KMV sketch). As long as fewer than k
+# distinct values were seen the sketch holds all of them and the count is exact, after that it is an estimate
+# with a relative error around 1 / sqrt(k).
+
+class DistinctValues:
+    def __init__(self, k: int):
+        self.k = k
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.saturated = False
+
+    def add(self, values):
+        hashes = np.unique(np.concatenate([self.hashes, hash_values(values)]))
+        self.saturated = self.saturated or hashes.size > self.k
+        self.hashes = hashes[:self.k]
+
+    def is_exact(self):
+        return not self.saturated
+
+    def count(self):
+        if self.is_exact():
+            return int(self.hashes.size)
+        return int((self.k - 1) / (float(self.hashes[-1]) / 2.0 ** 64))
+
+def hash_values(values):
+    # splitmix64 finalizer of the bit patterns, -0.0 is folded into 0.0 so that they count once
+    if np.issubdtype(values.dtype, np.floating):
+        values = values + 0.0
+    bits = np.ascontiguousarray(values).view(f"u{values.dtype.itemsize}").astype(np.uint64)
+    z = bits + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+# Report
+
+def print_report(report: dict):
+    print(f"{report['file']} ({format_bytes(report['size'])}), dimensions {report['dimensions']}")
+    for name, coordinate in report["coordinates"].items():
+        step = coordinate.get("uniform_step")
+        print(f"  {name:<12} {coordinate['size']:>6} values  {coordinate.get('min')} .. {coordinate.get('max')}  step {'-' if step is None else step}")
+    print(f"  {'variable':<36} {'nulls':>7} {'min':>12} {'max':>12} {'distinct':>10}  storage")
+    for name, variable in report["variables"].items():
+        stats = variable.get("stats")
+        storage = variable["storage"]
+        compression = storage["compression"]
+        storage_text = f"{storage['dtype']} chunks {storage['chunks']} {compression['codec'] + str(compression['level']) if compression else 'uncompressed'}"
+        if stats is None:
+            print(f"  {name:<36} {'-':>7} {'-':>12} {'-':>12} {'-':>10}  {storage_text}")
+            continue
+        null_ratio = f"{100 * stats['null_ratio']:.1f}%" if stats["null_ratio"] is not None else "-"
+        distinct = f"{'' if stats['distinct_exact'] else '~'}{stats['distinct']}"
+        print(f"  {name:<36} {null_ratio:>7} {format_number(stats['min']):>12} {format_number(stats['max']):>12} {distinct:>10}  {storage_text}")
+
+def format_number(value):
+    return "-" if value is None else f"{value:.6g}"
+
+
+# CLI
+
+def main(argv: list[str]):
+    parser = argparse.ArgumentParser(
+        description="Profile NetCDF files variable by variable in bounded memory and write a JSON report per file, cached by file content hash."
+    )
+    parser.add_argument(
+        "files", type=str, nargs="+", help="Paths of the .nc files to profile"
+    )
+    parser.add_argument(
+        "--variable", type=str, action="append", dest="variable_names", help="Only profile this variable, can be repeated (default: every data variable)"
+    )
+    parser.add_argument(
+        "--output-dir", type=str, help="Also copy each report to <output-dir>/<file name>.profile.json"
+    )
+    parser.add_argument(
+        "--cache-dir", type=str, default="./.profile_cache", help="Directory of the cached reports and file hashes"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Profile again even if a cached report exists"
+    )
+    parser.add_argument(
+        "--block-mb", type=float, default=64.0, help="Size of the blocks variables are streamed in"
+    )
+    parser.add_argument(
+        "--max-distinct", type=int, default=65536, help="Above this many distinct values the count is estimated"
+    )
+
+    args = parser.parse_args(argv)
+    cache_directory = Path(args.cache_dir)
+    for file in args.files:
+        path = Path(file)
+        report_key = f"{file_hash(path, cache_directory)}-v{report_version}-k{args.max_distinct}"
+        if args.variable_names:
+            report_key += "-" + hashlib.sha1(",".join(args.variable_names).encode()).hexdigest()[:8]
+        report_path = cache_directory / f"{report_key}.json"
+
+        if report_path.exists() and not args.force:
+            print(f"Using cached report {report_path}")
+            report = load_json_or_empty(report_path)
         else:
-            json.dump(dict, f, separators=(',', ':'))
-
-def export_dataframe_to_formats(df, base_path, base_filename):
-    csv_path = Path(base_path) / f"{base_filename}.csv"
-    json_pretty_path = Path(base_path) / f"{base_filename}_pretty.json"
-    json_path = Path(base_path) / f"{base_filename}.json"
-    
-    df.to_csv(csv_path, index=False)
-    df.to_json(json_path, orient="records")
-    df.to_json(json_pretty_path, orient="records", indent=4)
-
-
-
-# export_variable_attributes()
-
-# Check if building heights are constant over time
-def check_constant_over_time():
-    # get the mean building height per time slice
-    mean_building_heights_per_time = building_heights_filled.mean(dim=["GridsJ", "GridsI"])
-    print("Mean building heights per time slice: ", mean_building_heights_per_time)
-
-    # get the sum of building heights per time slice
-    sum_building_heights_per_time = building_heights_filled.sum(dim=["GridsJ", "GridsI"])
-    print("Sum of building heights per time slice: ", sum_building_heights_per_time)
+            report = profile_dataset(path, args.variable_names, args.block_mb, args.max_distinct)
+            save_json(report, report_path, pretty=True)
 
-    # diff of build heights across time slices
-    diff_building_heights_per_time = abs(building_heights_filled - building_heights_filled.isel(Time=0))
-    print("Diff of building heights per time slice: ", diff_building_heights_per_time)
-    max_diff_building_heights_per_time = diff_building_heights_per_time.max()
-    print("Max diff of building heights per time slice: ", max_diff_building_heights_per_time)
+        print_report(report)
+        if args.output_dir is not None:
+            save_json(report, Path(args.output_dir) / f"{path.stem}.profile.json", pretty=True)
 
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,15 +1,68 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from itertools import islice
+from urllib.parse import parse_qs, unquote, urlsplit
+import hashlib
+import importlib
+import importlib.util
+import os
 import re
-import xarray as xr
+import socket
+import sys
+import threading
+import time
+import traceback
 import json
 from pathlib import Path
+from types import SimpleNamespace
 import argparse
-import pandas as pd
-import numpy as np
+import filecmp
+import shutil
 import math
 
+class LazyModule:
+    # The scientific stack takes most of the startup time, so it is only imported on first attribute access.
+    # This keeps --help, --list-scenarios, --dry-run and skipped incremental runs instant. Once imported, the module
+    # replaces the proxy in the namespace that declared it, so the hot loops look its attributes up directly.
+    def __init__(self, module_name: str, namespace: dict):
+        self._module_name = module_name
+        self._namespace = namespace
+
+    def _import_module(self):
+        module = importlib.import_module(self._module_name)
+        for name, value in list(self._namespace.items()):
+            if value is self:
+                self._namespace[name] = module
+        return module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._import_module(), attribute)
+
+xr = LazyModule("xarray", globals())
+pd = LazyModule("pandas", globals())
+np = LazyModule("numpy", globals())
+# Optional, only for the GeoTIFF export (the cog jobs)
+rasterio_io = LazyModule("rasterio.io", globals())
+rasterio_shutil = LazyModule("rasterio.shutil", globals())
+rasterio_transform = LazyModule("rasterio.transform", globals())
+# Only reads the headers of the input files when planning, see read_scenario_header
+netCDF4 = LazyModule("netCDF4", globals())
+
+def import_scientific_stack():
+    for module in (np, pd, xr):
+        if isinstance(module, LazyModule):
+            module._import_module()
+
 human_height = 1.4000000953674316
 
+# The grid coordinates are stored as float32 (human_height is the float32 closest to 1.4), a requested coordinate
+# matches a grid coordinate within this distance (m)
+coordinate_tolerance = 1e-3
+
+# Variables are sliced, reduced and exported in float32, as ENVI-met stores them, except those listed here
+float64_variables = []
+
 variable_categories = {
     "heat_fluxes": {
         "name": "Heat Fluxes",
@@ -132,54 +185,362 @@ building_data_variables = [
     "$Fac_WallSystemLWEnergyBalance",
 ]
 
-def process_netcdf(scenario_name: str, input_directory: str, output_directory: str):
+def process_netcdf(scenario_name: str, input_directory: str, output_directory: str, cache_directory: str = None, cache_max_gb: float = 20.0, store_directory: str = None, baseline: str = None, baseline_epsilon: float = 0.01):
     print(f"========= Processing scenario: {scenario_name} =========")
+    configure_variable_cache(cache_directory, cache_max_gb)
+    configure_processing_store(store_directory)
+    configure_baseline(baseline, baseline_epsilon)
 
-    input_path = Path(input_directory) / f"{scenario_name}.nc"
-    print(f"Processing NetCDF at : {input_path}")
+    input_paths = scenario_input_paths(scenario_name, input_directory)
+    print(f"Processing NetCDF at : {', '.join(str(path) for path in input_paths)}")
 
-    ds = xr.open_dataset(input_path)
+    ds = open_scenario_dataset(scenario_name, input_directory)
     print(ds)
 
-    print("Processing building heights, soil types, and objects...")
-    export_buildings_and_soil_maps_and_objects(scenario_name, ds, output_directory)
-    print("Done processing building heights, soil types, and objects.", end="\n\n")
+    try:
+        jobs = plan_scenario(scenario_name, ds)
+        points = get_time_series_points_list(scenario_name, get_variable_names())
+        stage_timings = run_jobs(jobs, ds, points, input_directory, output_directory)
+    finally:
+        # Serve workers process many scenarios in one process, nothing of this one is kept for the next
+        release_dataset(ds)
 
-    var_keys = underground_level_variables + ground_level_variables + surface_level_variables + building_data_variables
+    if stage_timings:
+        save_json(stage_timings, timings_path(scenario_name, output_directory), pretty=True)
+    write_scenario_manifest(scenario_name, output_directory)
+    remove_unreferenced_blobs(output_directory)
+    save_json(processing_stamp(scenario_name, input_directory) | baseline_stamp(baseline, output_directory), stamp_path(scenario_name, output_directory), pretty=True)
 
-    print("Exporting variable attributes...")
-    export_variable_attributes(var_keys, ds, output_directory)
-    print("Done exporting variable attributes.", end="\n\n")
+    print("Done !", end="\n\n\n\n")
 
-    print("Processing simulation results slices...")
-    save_plane_slices_for_multiple_vars_at_multiple_times(scenario_name, ds, output_directory, variable_names=var_keys, time_indices=[0, 4, 8, 12, 16, 20])
-    print("Done processing simulation results slices.", end="\n\n")
 
-    print("Exporting time series points list...") # defined in make_horizontal_time_series_points
-    export_time_series_points_list(scenario_name, var_keys, output_directory)
-    print("Done exporting time series points list.", end="\n\n")
+# Incremental processing helpers, these must not touch the scientific stack
 
-    print("Exporting depth series points...")
-    depth_points = get_time_series_points_list(scenario_name, underground_level_variables)
-    export_depth_series_for_time_series_points(scenario_name, ds, depth_points, output_directory)
-    print("Done exporting depth time series points.", end="\n\n")
+def list_scenarios(input_directory: str):
+    # <scenario>.nc files, and <scenario>/ directories of .nc parts
+    input_directory = Path(input_directory)
+    names = {path.stem for path in input_directory.glob("*.nc")}
+    names |= {path.name for path in input_directory.iterdir() if path.is_dir() and not path.name.startswith(".") and any(path.glob("*.nc"))}
+    return sorted(names)
 
-    print("Exporting depth temporal variations points...")
-    depth_points = filter(lambda x: x["c"][2] > -0.5, get_time_series_points_list(scenario_name, underground_level_variables))
-    export_depth_temporal_variations_for_time_series_points(scenario_name, ds, depth_points, output_directory)
-    print("Done exporting depth temporal variations points.", end="\n\n")
+def scenario_input_paths(scenario_name: str, input_directory: str):
+    # ENVI-met can split a run by time or by output group (atmosphere, soil, building), the parts of such a run go in
+    # a <scenario>/ directory and are combined when the scenario is opened
+    input_path = Path(input_directory) / f"{scenario_name}.nc"
+    if input_path.exists():
+        return [input_path]
+    parts_directory = Path(input_directory) / scenario_name
+    input_paths = sorted(parts_directory.glob("*.nc"))
+    if not input_paths:
+        raise FileNotFoundError(f"Neither {input_path} nor .nc parts in {parts_directory}")
+    return input_paths
+
+def scenario_input_stat(scenario_name: str, input_directory: str):
+    # Total size and newest modification time of the parts
+    stats = [path.stat() for path in scenario_input_paths(scenario_name, input_directory)]
+    return sum(stat.st_size for stat in stats), max(stat.st_mtime_ns for stat in stats)
+
+def script_hash():
+    with open(__file__, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def processing_stamp(scenario_name: str, input_directory: str):
+    size, mtime_ns = scenario_input_stat(scenario_name, input_directory)
+    stamp = {
+        "size": size,
+        "mtime_ns": mtime_ns,
+        "script": script_hash(),
+    }
+    input_paths = scenario_input_paths(scenario_name, input_directory)
+    if len(input_paths) > 1:
+        # A removed part does not always change the total size nor the newest mtime
+        stamp["parts"] = [path.name for path in input_paths]
+    return stamp
+
+def file_hash(path: Path, cache_directory: Path):
+    # sha256 of the file content, remembered per (path, size, mtime) in cache_directory so that unchanged files are not read again
+    stat = path.stat()
+    key = f"{path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}"
+    index_path = Path(cache_directory) / "hashes.json"
+    index = {}
+    if index_path.exists():
+        with open(index_path) as f:
+            index = json.load(f)
+    if key not in index:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 24), b""):
+                sha.update(block)
+        index[key] = sha.hexdigest()
+        save_json(index, index_path, pretty=True)
+    return index[key]
+
+def scenario_input_hash(input_paths: list[Path], cache_directory: Path):
+    if len(input_paths) == 1:
+        return file_hash(input_paths[0], cache_directory)
+    parts = "\n".join(f"{path.name}:{file_hash(path, cache_directory)}" for path in input_paths)
+    return hashlib.sha256(parts.encode()).hexdigest()
+
+def stamp_path(scenario_name: str, output_directory: str):
+    return Path(output_directory) / ".stamps" / f"{scenario_name}.json"
+
+def is_scenario_up_to_date(scenario_name: str, input_directory: str, output_directory: str, baseline: str = None):
+    path = stamp_path(scenario_name, output_directory)
+    if not path.exists():
+        return False
+    with open(path) as f:
+        return json.load(f) == processing_stamp(scenario_name, input_directory) | baseline_stamp(baseline, output_directory)
+
+# Job plan: every output of a scenario, derived from the dataset metadata without reading variable data. The plan
+# is the same on every machine, jobs needing an optional dependency are listed and skipped where it is missing.
+
+plane_time_indices = [0, 4, 8, 12, 16, 20]
+
+# Rough size of the serialized outputs, used only to estimate the plan
+estimated_bytes_per_value = 19
+estimated_bytes_per_time_series_record = 40
+
+def get_variable_names():
+    return underground_level_variables + ground_level_variables + surface_level_variables + building_data_variables
+
+def make_job(scenario_name: str, stage: str, outputs: list, estimated_bytes: int, variable_name: str = None, time_index: int = None, requires: str = None):
+    job_id = "/".join(part for part in [scenario_name, stage, variable_name, None if time_index is None else f"time_{time_index}"] if part is not None)
+    return {
+        "id": job_id,
+        "scenario": scenario_name,
+        "stage": stage,
+        "variable": variable_name,
+        "time_index": time_index,
+        "outputs": [str(output) for output in outputs],
+        "estimated_bytes": int(estimated_bytes),
+        "requires": requires,  # optional module the job needs
+    }
 
-    print("Exporting time series points...")
-    points = get_time_series_points_list(scenario_name, var_keys)
-    export_time_series_points(scenario_name, ds, points, output_directory)
-    print("Done exporting time series points.", end="\n\n")
+def is_job_supported(job: dict):
+    return job["requires"] is None or importlib.util.find_spec(job["requires"]) is not None
+
+class DatasetHeader:
+    # Dimension sizes and variable dimensions of a scenario, read from the headers of its files with netCDF4 alone.
+    # It stands for the dataset when planning, which then imports neither xarray nor pandas.
+    def __init__(self, sizes: dict, variable_dims: dict):
+        self.sizes = sizes
+        self.data_vars = {name: SimpleNamespace(dims=dims) for name, dims in variable_dims.items()}
+
+    def __getitem__(self, variable_name: str):
+        return self.data_vars[variable_name]
+
+def read_scenario_header(scenario_name: str, input_directory: str):
+    sizes = {}
+    variable_dims = {}
+    times = set()
+    for path in scenario_input_paths(scenario_name, input_directory):
+        with netCDF4.Dataset(path) as nc:
+            for name, dimension in nc.dimensions.items():
+                sizes[name] = max(sizes.get(name, 0), len(dimension))
+            for name, variable in nc.variables.items():
+                if name not in nc.dimensions:
+                    variable_dims[name] = variable.dimensions
+            # Parts split by time are concatenated along it, the other parts share their time steps
+            times.update(nc.variables["Time"][:].tolist())
+    sizes["Time"] = len(times)
+    return DatasetHeader(sizes, variable_dims)
+
+def plan_scenario(scenario_name: str, ds):
+    sizes = ds.sizes
+    variable_names = get_variable_names()
+    points = get_time_series_points_list(scenario_name, variable_names)
+    horizontal_cells = sizes["GridsI"] * sizes["GridsJ"]
+
+    jobs = [
+        make_job(scenario_name, "maps", [scenario_output_path(scenario_name, "", name) for name in ["buildingMap", "soilMap", "objectsMap"]], horizontal_cells * 4),
+        make_job(scenario_name, "attributes", ["variablesAttributes.json"], 300 * len(variable_names)),
+    ]
+
+    for variable_name in variable_names:
+        if variable_name in surface_level_variables or variable_name in building_data_variables:
+            continue
+
+        is_underground = variable_name in underground_level_variables
+        slicers = get_underground_plane_slicers_for_scenario(scenario_name) if is_underground else get_plane_slicers_for_scenario(scenario_name)
+        vertical_cells = sizes["GridsJ"] * sizes["SoilLevels" if is_underground else "GridsK"]
+        for time_index in plane_time_indices:
+            outputs = [scenario_output_path(scenario_name, f"{variable_name}/time_{time_index}", slicer["slug"]) for slicer in slicers]
+            cells = sum(vertical_cells if slicer.get("columns") == "z" else horizontal_cells for slicer in slicers)
+            jobs.append(make_job(scenario_name, "planes", outputs, cells * estimated_bytes_per_value, variable_name, time_index))
+        outputs = [cog_output_path(scenario_name, variable_name, slug) for slug in horizontal_plane_slugs(slicers)]
+        jobs.append(make_job(scenario_name, "cog", outputs, len(outputs) * len(plane_time_indices) * horizontal_cells * 3, variable_name, requires="rasterio"))
+        stats_bytes = len(slicers) * (len(plane_time_indices) + 1) * (plane_histogram_bins + len(plane_quantiles)) * estimated_bytes_per_value
+        jobs.append(make_job(scenario_name, "plane_stats", [scenario_output_path(scenario_name, variable_name, "planeStats")], stats_bytes, variable_name))
+
+    # The number of façade nodes is unknown without reading the data, one wall elevation per orientation is assumed
+    facade_cells = sizes["GridsJ"] * sizes["GridsK"]
+    jobs.append(make_job(scenario_name, "facade_index", [scenario_output_path(scenario_name, "facades", orientation) for orientation in facade_orientations], 3 * 4 * (sizes["GridsJ"] + sizes["GridsK"]) * 10))
+    for variable_name in building_data_variables:
+        outputs = [scenario_output_path(scenario_name, f"{variable_name}/time_{time_index}", f"facade_{orientation}") for time_index in plane_time_indices for orientation in facade_orientations]
+        jobs.append(make_job(scenario_name, "facade_planes", outputs, len(outputs) * facade_cells * estimated_bytes_per_value, variable_name))
+
+    jobs.append(make_job(scenario_name, "points_list", [scenario_output_path(scenario_name, "", name) for name in ["timeSeriesPoints", "planes"]], 270 * len(points) + 2000))
+
+    for variable_name in dict.fromkeys(variable_name for point in points for variable_name in point["d"]):
+        outputs = []
+        for point in points:
+            if variable_name in point["d"]:
+                outputs.append(scenario_output_path(scenario_name, f"{variable_name}/depthSeries", point["s"]))
+                if has_depth_temporal_variations(point):
+                    outputs.append(scenario_output_path(scenario_name, f"{variable_name}/depthTemporalVariations", point["s"]))
+        jobs.append(make_job(scenario_name, "depth", outputs, len(outputs) * sizes["Time"] * sizes["SoilLevels"] * estimated_bytes_per_value, variable_name))
+
+    for variable_name in dict.fromkeys(variable_name for point in points for variable_name in get_vertical_profile_variables(ds, point)):
+        outputs = [scenario_output_path(scenario_name, f"{variable_name}/verticalProfiles", point["s"]) for point in points if variable_name in get_vertical_profile_variables(ds, point)]
+        jobs.append(make_job(scenario_name, "vertical_profiles", outputs, len(outputs) * sizes["Time"] * sizes["GridsK"] * estimated_bytes_per_value, variable_name))
+
+    for variable_name in dict.fromkeys(variable_name for point in points for variable_name in point["v"]):
+        outputs = [scenario_output_path(scenario_name, f"{variable_name}/timeSeries", point["s"]) for point in points if variable_name in point["v"]]
+        jobs.append(make_job(scenario_name, "time_series", outputs, len(outputs) * sizes["Time"] * estimated_bytes_per_time_series_record, variable_name))
+
+    outputs = [scenario_output_path(scenario_name, "pointSeries", point["s"]) for point in points]
+    jobs.append(make_job(scenario_name, "point_series", outputs, sum(len(point["v"]) + 1 for point in points) * sizes["Time"] * estimated_bytes_per_value))
+
+    # Compressed columns, values and times are the bulk of it
+    jobs.append(make_job(scenario_name, "parquet", [parquet_output_path(scenario_name)], sum(len(point["v"]) for point in points) * sizes["Time"] * 6, requires="pyarrow"))
+
+    return jobs
+
+def run_jobs(jobs, ds, points, input_directory: str, output_directory: str, lease=None):
+    # Jobs whose outputs are all up to date are skipped, so an interrupted run resumes where it stopped. In work mode,
+    # the jobs stop as soon as the lease of their unit was taken over by another worker.
+    stage_timings = {}
+    for job_index, job in enumerate(jobs):
+        if lease is not None:
+            lease.check()
+        if not is_job_supported(job):
+            print(f"[{job_index + 1}/{len(jobs)}] {job['id']} skipped, {job['requires']} is not installed")
+            continue
+        if is_job_cached(job, input_directory, output_directory):
+            print(f"[{job_index + 1}/{len(jobs)}] {job['id']} cached")
+            continue
+        print(f"[{job_index + 1}/{len(jobs)}] {job['id']}")
+        started_at = time.time()
+        # Taken before running, an input changed meanwhile leaves the job stale
+        stamp = job_stamp(job, input_directory, output_directory)
+        run_job(job, ds, points, output_directory)
+        save_json(stamp, job_stamp_path(job, output_directory))
+        timing = stage_timings.setdefault(job["stage"], {"jobs": 0, "seconds": 0.0})
+        timing["jobs"] += 1
+        timing["seconds"] += time.time() - started_at
+    return stage_timings
+
+def run_job(job: dict, ds, points, output_directory: str):
+    scenario_name = job["scenario"]
+    stage = job["stage"]
+    if stage == "maps":
+        export_buildings_and_soil_maps_and_objects(scenario_name, ds, output_directory)
+    elif stage == "attributes":
+        export_variable_attributes(get_variable_names(), ds, output_directory)
+    elif stage == "planes":
+        save_plane_slices_for_var_at_time(scenario_name, ds, output_directory, variable_slug=job["variable"], time_index=job["time_index"])
+    elif stage == "plane_stats":
+        export_plane_stats_for_var(scenario_name, ds, job["variable"], output_directory)
+    elif stage == "cog":
+        export_plane_cogs_for_var(scenario_name, ds, job["variable"], output_directory)
+    elif stage == "facade_index":
+        export_facade_index(scenario_name, ds, output_directory)
+    elif stage == "facade_planes":
+        export_facade_planes_for_var(scenario_name, ds, job["variable"], output_directory)
+    elif stage == "points_list":
+        export_time_series_points_list(scenario_name, get_variable_names(), output_directory)
+    elif stage == "depth":
+        export_depth_series_and_temporal_variations_for_var(scenario_name, ds, job["variable"], points, output_directory)
+    elif stage == "vertical_profiles":
+        export_vertical_profiles_for_var(scenario_name, ds, job["variable"], points, output_directory)
+    elif stage == "time_series":
+        export_time_series_points_for_var(scenario_name, ds, job["variable"], points, output_directory)
+    elif stage == "point_series":
+        export_point_series(scenario_name, ds, points, output_directory)
+    elif stage == "parquet":
+        export_points_parquet(scenario_name, ds, points, output_directory)
+    else:
+        raise ValueError(f"Unknown stage '{stage}' for job {job['id']}")
+
+def is_job_cached(job: dict, input_directory: str, output_directory: str):
+    # A job is cached when all its outputs exist and its stamp matches the current input files, script and baseline
+    # manifest. Output mtimes are not compared: a deduplicated output is a hard link to an older blob.
+    path = job_stamp_path(job, output_directory)
+    if not path.exists() or not all((Path(output_directory) / output).exists() for output in job["outputs"]):
+        return False
+    with open(path) as f:
+        return json.load(f) == job_stamp(job, input_directory, output_directory)
+
+def job_stamp_path(job: dict, output_directory: str):
+    return Path(output_directory) / ".stamps" / "jobs" / f"{job['id']}.json"
+
+def job_stamp(job: dict, input_directory: str, output_directory: str):
+    return processing_stamp(job["scenario"], input_directory) | baseline_stamp(baseline_scenario, output_directory)
+
+def timings_path(scenario_name: str, output_directory: str):
+    return Path(output_directory) / ".stamps" / f"{scenario_name}.timings.json"
+
+def load_seconds_per_job(output_directory: str):
+    # Average duration of a job per stage, over every previously processed scenario
+    totals = {}
+    for path in (Path(output_directory) / ".stamps").glob("*.timings.json"):
+        with open(path) as f:
+            for stage, timing in json.load(f).items():
+                total = totals.setdefault(stage, {"jobs": 0, "seconds": 0.0})
+                total["jobs"] += timing["jobs"]
+                total["seconds"] += timing["seconds"]
+    return {stage: total["seconds"] / total["jobs"] for stage, total in totals.items() if total["jobs"] > 0}
+
+def print_plan(jobs, input_directory: str, output_directory: str):
+    seconds_per_job = load_seconds_per_job(output_directory)
+    summary = {}
+    for job in jobs:
+        job["cached"] = is_job_cached(job, input_directory, output_directory)
+        stage_summary = summary.setdefault(job["stage"], {"jobs": 0, "cached": 0, "files": 0, "bytes": 0})
+        stage_summary["jobs"] += 1
+        stage_summary["cached"] += job["cached"]
+        stage_summary["files"] += len(job["outputs"])
+        stage_summary["bytes"] += job["estimated_bytes"]
+
+    total = {"jobs": 0, "cached": 0, "files": 0, "bytes": 0, "seconds": 0.0}
+    name_width = max(len(name) for name in ["stage", "total", *summary]) + 2
+    print(f"{'stage':<{name_width}}{'jobs':>7}{'cached':>8}{'files':>8}{'est. size':>12}{'est. time':>12}")
+    for stage, stage_summary in summary.items():
+        # Durations are estimated from the jobs of previous runs, unknown until a scenario has been processed once
+        remaining_jobs = stage_summary["jobs"] - stage_summary["cached"]
+        stage_summary["seconds"] = remaining_jobs * seconds_per_job.get(stage, math.nan) if remaining_jobs else 0.0
+        print_plan_row(stage, stage_summary, name_width)
+        for key in total:
+            total[key] += stage_summary[key]
+    print_plan_row("total", total, name_width)
+
+    for requirement in sorted({job["requires"] for job in jobs if not is_job_supported(job)}):
+        stages = ", ".join(sorted({job["stage"] for job in jobs if job["requires"] == requirement}))
+        print(f"{requirement} is not installed here, the {stages} jobs would be skipped")
+
+def print_plan_row(name: str, row: dict, name_width: int):
+    estimated_time = "?" if math.isnan(row["seconds"]) else format_duration(row["seconds"])
+    print(f"{name:<{name_width}}{row['jobs']:>7}{row['cached']:>8}{row['files']:>8}{format_bytes(row['bytes']):>12}{estimated_time:>12}")
+
+def format_bytes(n):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+def format_duration(seconds):
+    return f"{seconds:.1f} s" if seconds < 120 else f"{seconds / 60:.1f} min"
 
-    print("Done !", end="\n\n\n\n")
 
 
 # Building heights and soil types helpers
 
 def export_buildings_and_soil_maps_and_objects(scenario_name: str, ds, output_directory: str = "processed_data"):
+    maps = get_scenario(scenario_name, ds).maps()
+    for name, map_dict in maps.items():
+        save_json_for_scenario(map_dict, output_directory, scenario_name, "", name, pretty=False)
+
+def scenario_maps(scenario_name: str, ds):
     building_heights = ds.data_vars["BuildingHeight"]
     bh_dict = building_height_dict(building_heights)
     bh_dict["defaultSideColor"] = hardcoded_side_color(scenario_name)
@@ -193,10 +554,7 @@ def export_buildings_and_soil_maps_and_objects(scenario_name: str, ds, output_di
     objects = ds.data_vars["Objects"]
     obj_dict = objects_dict_scenarios(scenario_name, objects)
 
-    # Save the processed data
-    save_json_for_scenario(bh_dict, output_directory, scenario_name, "", "buildingMap", pretty=False)
-    save_json_for_scenario(st_dict, output_directory, scenario_name, "", "soilMap", pretty=False)
-    save_json_for_scenario(obj_dict, output_directory, scenario_name, "", "objectsMap", pretty=False)
+    return {"buildingMap": bh_dict, "soilMap": st_dict, "objectsMap": obj_dict}
 
 def hardcoded_side_color(scenario_name: str):
     if scenario_name.startswith("S2_1") or scenario_name.startswith("S6_2") or scenario_name.startswith("S6_3"):
@@ -270,7 +628,7 @@ def objects_dict_scenarios(scenario_name: str, objects):
     return objects_dict(objects)
 
 def objects_dict(objects):
-    first_time_slice = objects.isel(Time=0).sel(GridsK=0.2) # Only objects on the ground (on the 2m*2m square centered at height 1m so, so touching the ground)
+    first_time_slice = objects.isel(Time=0).sel(GridsK=0.2, method="nearest", tolerance=coordinate_tolerance) # Only objects on the ground (on the 2m*2m square centered at height 1m so, so touching the ground)
     dataframe = first_time_slice.to_dataframe().reset_index().drop(columns=["Time","GridsK"]).rename(columns={"GridsI": "x", "GridsJ": "y", "Objects": "o"})
     print(dataframe)
     dataframe_cleaned = dataframe[dataframe["o"].notna() & (dataframe["o"] > 1)] # 0 is no object and 1 is building, already taken into account in building heights
@@ -765,13 +1123,24 @@ def export_variable_attributes(variable_names, ds, output_directory):
 
 
 def get_variable_attributes_in_dict(ds, variable_name):
-    source_variable_name = variable_name.replace("$", "X")
-    variable = ds.data_vars[source_variable_name]
-    attrs = attach_category_slug_to_variable_attrs(variable_name, variable.attrs)
+    attrs = attach_category_slug_to_variable_attrs(variable_name, get_source_variable_attributes(ds, variable_name))
     overriden_attrs = hardcoded_overrides(variable_name, attrs.copy())
 
     return {k: prettify_unit(overriden_attrs[k]) for k in overriden_attrs}
 
+def get_source_variable_attributes(ds, variable_name):
+    if variable_name not in building_data_variables:
+        return dict(ds.data_vars[variable_name].attrs)
+    # The façade variables are stored per orientation: the attributes of the preferred orientation present (see
+    # facade_orientations), with the valid range of all of them
+    variants = [ds.data_vars[variable_name.replace("$", orientation)].attrs for orientation in facade_orientations if variable_name.replace("$", orientation) in ds.data_vars]
+    attrs = dict(variants[0])
+    for key, reduce in [("valid_min", min), ("valid_max", max)]:
+        values = [variant[key] for variant in variants if key in variant]
+        if values:
+            attrs[key] = reduce(values)
+    return attrs
+
 def attach_category_slug_to_variable_attrs(variable_name: str, attrs: dict):
     for category_slug, category in variable_categories.items():
         if variable_name in category["variables"]:
@@ -859,29 +1228,189 @@ def save_plane_slices_for_multiple_vars_at_multiple_times(scenario: str, ds, out
             save_plane_slices_for_var_at_time(scenario, ds, output_directory, variable_slug=variable_name, time_index=time_index)
 
 def save_plane_slices_for_var_at_time(scenario: str, ds, output_directory: str, variable_slug="T", time_index=0):
-    variable_at_time = get_variable_at_time(ds, variable_slug, time_index)
-    slicers = get_underground_plane_slicers_for_scenario(scenario) if variable_slug in underground_level_variables else get_plane_slicers_for_scenario(scenario)
-
-    for slicer in slicers:
-        sliced = slicer["slicer"](variable_at_time)
-        array_2d = slice_to_array_of_arrays(df=sliced, index_column=slicer.get("index_column", "y"), columns=slicer.get("columns", "x"), value_column="value")
-        dict = {
-            "data": to_json_compatible(array_2d),
+    for slicer_slug, grid in get_plane_grids_for_var_at_time(scenario, ds, variable_slug, time_index):
+        dict = None
+        if baseline_scenario is not None and get_scenario_slug(baseline_scenario) != get_scenario_slug(scenario):
+            dict = delta_plane_record(grid, output_directory, f"{variable_slug}/time_{time_index}/{slicer_slug}.json")
+        if dict is None:
+            dict = masked_plane_record(scenario, grid, output_directory)
+        save_slice_to_json(scenario, output_directory, variable_slug, time_index=time_index, slicer_slug=slicer_slug, dict=dict)
+
+def get_plane_grids_for_var_at_time(scenario: str, ds, variable_slug: str, time_index: int):
+    # Memoized, the cog and plane_stats stages reuse the grids of the planes stage
+    return get_scenario(scenario, ds).planes(variable_slug, time_index).items()
+
+
+# Null masks: buildings are null in every variable at every time, so each distinct mask is written once per scenario
+# in masks/<hash>.json as {"shape": [rows, columns], "runs": [...]}, the lengths of the alternating runs of null and
+# valid cells in row order, starting with a (possibly empty) null run. A plane slice is then {"mask": <hash>,
+# "values": [...]}, its valid values in the same row order.
+
+def masked_plane_record(scenario: str, grid, output_directory: str):
+    mask_hash, mask, record = masked_plane(grid)
+    mask_path = Path(output_directory) / scenario_output_path(scenario, "masks", mask_hash)
+    # Identical masks have identical names, concurrent workers writing the same one is harmless
+    if not mask_path.exists():
+        save_json(mask, mask_path)
+    return record
+
+def masked_plane(grid):
+    valid = ~np.isnan(grid)
+    mask = {"shape": list(grid.shape), "runs": mask_runs(valid)}
+    mask_hash = hashlib.sha1(json.dumps(mask).encode()).hexdigest()[:16]
+    return mask_hash, mask, {"mask": mask_hash, "values": to_json_compatible(grid[valid].tolist())}
+
+def mask_runs(valid):
+    flat = valid.ravel()
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    runs = np.diff(np.concatenate(([0], changes, [flat.size]))).tolist()
+    return [0] + runs if flat.size and flat[0] else runs
+
+# Baseline deltas: with --baseline, a plane of a variant scenario (a mitigation of its baseline, differing only in
+# part of the domain) stores only the cells that differ from the same plane of the baseline by more than
+# baseline_epsilon, when that is smaller than the full plane: {"baseline": {"scenario": <slug>, "hash": <content hash
+# of the baseline plane file>}, "shape": [rows, columns], "cells": [indices in row order], "values": [...]}, with null
+# values for cells that became null. The baseline has to be processed first, planes without a baseline file are full.
+
+max_delta_ratio = 0.5  # above this share of changed cells, the full plane is smaller
+
+# Set by configure_baseline, None means that every plane is stored in full
+baseline_scenario = None
+baseline_epsilon = 0.01
+
+def configure_baseline(baseline: str = None, epsilon: float = 0.01):
+    global baseline_scenario, baseline_epsilon
+    baseline_scenario = baseline
+    baseline_epsilon = epsilon
+
+def baseline_stamp(baseline: str, output_directory: str):
+    # Deltas are out of date once the baseline is processed again
+    if baseline is None:
+        return {}
+    manifest_path = Path(output_directory) / "scenarios" / get_scenario_slug(baseline) / "manifest.json"
+    return {"baseline": {"scenario": get_scenario_slug(baseline), "manifest": content_hash(manifest_path) if manifest_path.exists() else None}}
+
+def delta_plane_record(grid, output_directory: str, plane_path: str):
+    baseline_path = Path(output_directory) / "scenarios" / get_scenario_slug(baseline_scenario) / plane_path
+    if not baseline_path.exists():
+        return None
+    baseline_grid = read_plane(output_directory, get_scenario_slug(baseline_scenario), plane_path)
+    if baseline_grid.shape != grid.shape:
+        return None
+
+    changed = (np.isnan(grid) != np.isnan(baseline_grid)) | (np.abs(grid - baseline_grid) > baseline_epsilon)
+    cells = np.flatnonzero(changed)
+    if cells.size > max_delta_ratio * np.count_nonzero(~np.isnan(grid)):
+        return None
+    return {
+        "baseline": {"scenario": get_scenario_slug(baseline_scenario), "hash": content_hash(baseline_path)},
+        "shape": list(grid.shape),
+        "cells": cells.tolist(),
+        "values": to_json_compatible(grid.ravel()[cells].tolist()),
+    }
+
+def read_plane(output_directory: str, scenario_slug: str, plane_path: str):
+    # Full grid of an exported plane file (<variable>/time_<t>/<plane>.json) whatever its encoding, nan for null cells
+    with open(Path(output_directory) / "scenarios" / scenario_slug / plane_path) as f:
+        record = json.load(f)
+
+    if "baseline" in record:
+        baseline_slug = record["baseline"]["scenario"]
+        if content_hash(Path(output_directory) / "scenarios" / baseline_slug / plane_path) != record["baseline"]["hash"]:
+            raise ValueError(f"{scenario_slug}/{plane_path} was encoded against another version of {baseline_slug}, process {scenario_slug} again")
+        grid = read_plane(output_directory, baseline_slug, plane_path).copy()
+        if list(grid.shape) != record["shape"]:
+            raise ValueError(f"{scenario_slug}/{plane_path} has shape {record['shape']}, its baseline {list(grid.shape)}")
+        grid.ravel()[record["cells"]] = np.array(record["values"], dtype=np.float64)
+        return grid
+    if "mask" in record:
+        with open(Path(output_directory) / scenario_output_path(scenario_slug, "masks", record["mask"])) as f:
+            mask = json.load(f)
+        valid = np.repeat(np.arange(len(mask["runs"])) % 2 == 1, mask["runs"])
+        grid = np.full(valid.size, np.nan, dtype=np.float32)
+        grid[valid] = record["values"]
+        return grid.reshape(mask["shape"])
+    # Planes processed before masks existed
+    return np.array(record["data"], dtype=np.float64).astype(np.float32)
+
+# Cloud-optimized GeoTIFF export of the horizontal planes, one band per plane time, in the local grid coordinates (m).
+# rasterio is optional, only map layers streaming the planes need it.
+
+cog_nodata = -9999.0
+
+def cog_output_path(scenario: str, variable_name: str, plane_slug: str):
+    return Path("scenarios") / get_scenario_slug(scenario) / variable_name / f"{plane_slug}.tif"
+
+def horizontal_plane_slugs(slicers):
+    # Vertical planes are pivoted on z
+    return [slicer["slug"] for slicer in slicers if slicer.get("columns", "x") == "x"]
+
+def export_plane_cogs_for_var(scenario: str, ds, variable_name: str, output_directory: str, time_indices=plane_time_indices):
+    slicers = get_underground_plane_slicers_for_scenario(scenario) if variable_name in underground_level_variables else get_plane_slicers_for_scenario(scenario)
+    bands = {slug: [] for slug in horizontal_plane_slugs(slicers)}
+    for time_index in time_indices:
+        for slicer_slug, grid in get_plane_grids_for_var_at_time(scenario, ds, variable_name, time_index):
+            if slicer_slug in bands:
+                bands[slicer_slug].append(grid)
+
+    for slicer_slug, grids in bands.items():
+        # Raster rows run from north to south, the grid rows by increasing y
+        stack = np.stack(grids)[:, ::-1, :].astype("float32")
+        stack[np.isnan(stack)] = cog_nodata
+        path = Path(output_directory) / cog_output_path(scenario, variable_name, slicer_slug)
+        save_cog(stack, ds["GridsI"].values, ds["GridsJ"].values, [f"time_{time_index}" for time_index in time_indices], path)
+
+# Plane statistics: histograms and quantiles of every plane, so that legends and distribution charts do not need
+# the full planes. The bins of a plane are shared by all its times, their counts add up to the "all" aggregate.
+
+plane_histogram_bins = 32
+plane_quantiles = [0.0, 0.05, 0.25, 0.5, 0.75, 0.95, 1.0]
+
+def export_plane_stats_for_var(scenario: str, ds, variable_name: str, output_directory: str, time_indices=plane_time_indices):
+    plane_values = {}  # slicer slug -> {time slug: valid values}
+    for time_index in time_indices:
+        for slicer_slug, grid in get_plane_grids_for_var_at_time(scenario, ds, variable_name, time_index):
+            plane_values.setdefault(slicer_slug, {})[f"time_{time_index}"] = grid[~np.isnan(grid)]
+
+    planes = {}
+    for slicer_slug, values_per_time in plane_values.items():
+        all_values = np.concatenate(list(values_per_time.values()))
+        edges = np.histogram_bin_edges(all_values, bins=plane_histogram_bins) if all_values.size else None
+        planes[slicer_slug] = {
+            "edges": edges,
+            "times": {time_slug: distribution_stats(values, edges) for time_slug, values in values_per_time.items()},
+            "all": distribution_stats(all_values, edges),
         }
-        save_slice_to_json(scenario, output_directory, variable_slug, time_index=time_index, slicer_slug=slicer["slug"], dict=dict)
 
+    record = {"quantiles": plane_quantiles, "planes": planes}
+    save_json_for_scenario(to_json_compatible(record), output_directory, scenario, variable_name, "planeStats")
+
+def distribution_stats(values, edges):
+    if values.size == 0:
+        return {"count": 0, "mean": None, "counts": None, "quantiles": None}
+    return {
+        "count": int(values.size),
+        "mean": float(values.mean(dtype="float64")),
+        "counts": np.histogram(values, bins=edges)[0],
+        "quantiles": np.quantile(values, plane_quantiles),
+    }
 
 def get_variable_at_time(ds, variable_name, time_index=0):
-    variable = ds.data_vars[variable_name]
+    # The time slice is read once, in its compute dtype, and the planes are views of it
+    variable = get_data_variable(ds, variable_name)
     time_slice = variable.isel(Time=time_index)
-    df = time_slice.to_dataframe().reset_index().drop(columns=["Time"]).rename(columns={"GridsI": "x", "GridsJ": "y", "GridsK": "z", "SoilLevels": "z", variable_name: "value"})
-    return df
+    time_slice = time_slice.copy(data=as_compute_dtype(time_slice.values, variable_name))
+    return time_slice.rename({dim: axis for dim, axis in {"GridsI": "x", "GridsJ": "y", "GridsK": "z", "SoilLevels": "z"}.items() if dim in time_slice.dims})
 
-def slice_xy_plane_at_z(df, z_value):
-    return df[df["z"] == z_value]
+def slice_xy_plane_at_z(variable_at_time, z_value):
+    return variable_at_time.isel(z=coordinate_indices(variable_at_time["z"].values, z_value))
 
-def slice_yz_plane_at_x(df, x_value):
-    return df[df["x"] == x_value]
+def slice_yz_plane_at_x(variable_at_time, x_value):
+    return variable_at_time.isel(x=coordinate_indices(variable_at_time["x"].values, x_value))
+
+def coordinate_indices(values, value: float):
+    # Indices of the coordinates within coordinate_tolerance of value, none when the plane is not in the grid
+    return np.flatnonzero(np.abs(values - value) <= coordinate_tolerance)
 
 def get_plane_slicers_for_scenario(scenario: str):
     building_canopy_anomalies_per_scenario = {
@@ -981,150 +1510,1036 @@ def get_time_series_points_list(scenario: str, variables: list[str]):
 def export_time_series_points_list(scenario: str, variables: list[str], output_directory: str = "processed_data"):
     points = get_time_series_points_list(scenario, variables)
     save_json_for_scenario(points, output_directory, scenario, "", "timeSeriesPoints")
+    save_json_for_scenario(plane_graph_metadata(scenario, points), output_directory, scenario, "", "planes")
+
+# Heatmap axes of the planes, loaded by the frontend from planes.json: the cell (i, j) of a plane array is at
+# min + index * cellSize, or at valuesOverride[index], on the x and y axes
+
+vertical_plane_y_axis_override = [
+    0, 0.4, 0.8, 1.2, 1.6, 2, 4, 6, 8, 10, 12, 14, 16, 18, 20, 22, 24, 26, 28, 30, 32, 34, 36, 38, 40,
+    42, 44, 46, 48, 50, 52, 54, 56, 58, 60, 62, 64, 66, 68, 70, 72, 74, 76
+]
+vertical_underground_plane_y_axis_override = [
+    0.005, 0.015, 0.035, 0.05, 0.07, 0.09, 0.15, 0.25, 0.35, 0.45, 0.75, 1.25, 1.75, 2.25, 2.75, 3.25,
+    3.75, 4.5
+]
+
+def graph_axis(name: str, unit: str, cell_size: float, min: float, max: float, values_override=None, inversed: bool = False):
+    # A heatmap axis, as GraphAxis in frontend/src/lib/simulation/graphAxis.ts
+    axis = {"name": name, "unit": unit, "cellSize": cell_size, "min": min, "max": max}
+    if values_override is not None:
+        axis["valuesOverride"] = [round(float(value), 3) for value in values_override]
+    if inversed:
+        axis["inversed"] = True
+    return axis
+
+def get_graph_axes_for_plane(plane_slug: str):
+    if plane_slug.startswith("vertical"):
+        if "underground" in plane_slug:
+            return {
+                "x": graph_axis("Y", "m", 2, 0, 100),
+                "y": graph_axis("Z", "m", 2, 0, 19, vertical_underground_plane_y_axis_override, inversed=True),
+            }
+        return {"x": graph_axis("Y", "m", 2, 0, 100), "y": graph_axis("Z", "m", 2, 0, 41, vertical_plane_y_axis_override)}
+    return {"x": graph_axis("X", "m", 2, 0, 100), "y": graph_axis("Y", "m", 2, 0, 100)}
+
+def graph_axis_index(axis: dict, position: float):
+    # Inverse of getFinalPositionFromIndexAndAxes without cell centering, None when no cell is exactly at position
+    if "valuesOverride" in axis:
+        return axis["valuesOverride"].index(position) if position in axis["valuesOverride"] else None
+    index = (position - axis["min"]) / axis["cellSize"]
+    return int(index) if index >= 0 and index.is_integer() else None
+
+def plane_graph_metadata(scenario: str, points):
+    # {plane slug: {"axes": {"x": ..., "y": ...}, "points": {"i;j": index of the point in timeSeriesPoints}}} for every
+    # plane of the scenario, the points are used by the heatmap tooltips
+    plane_slugs = [slicer["slug"] for slicer in get_plane_slicers_for_scenario(scenario) + get_underground_plane_slicers_for_scenario(scenario)]
+    planes = {plane_slug: {"axes": get_graph_axes_for_plane(plane_slug), "points": {}} for plane_slug in plane_slugs}
+    for point_index, point in enumerate(points):
+        plane = planes.setdefault(point["p"], {"axes": get_graph_axes_for_plane(point["p"]), "points": {}})
+        i = graph_axis_index(plane["axes"]["x"], point["c"][0])
+        j = graph_axis_index(plane["axes"]["y"], point["c"][1])
+        if i is not None and j is not None:
+            plane["points"].setdefault(f"{i};{j}", point_index)
+    return planes
+
+
+# Façade index: orientation of every wall cell and its nearest valid node in each of the X/Y/Z façade arrays
+
+facade_orientations = ["Z", "X", "Y"]  # order of preference when a cell holds several façades (roof edges)
+
+class FacadeIndex:
+    def __init__(self, ds):
+        reference_variable_name = building_data_variables[0]
+        self.grid = [ds["GridsK"].values, ds["GridsJ"].values, ds["GridsI"].values]
+        grid_shape = tuple(len(axis) for axis in self.grid)
+
+        # Valid nodes of each orientation, in one pass over the time axis of one façade variable per orientation
+        self.nodes = {}
+        for orientation in facade_orientations:
+            variable = get_data_variable(ds, reference_variable_name.replace("$", orientation))
+            valid = variable.notnull().any("Time").transpose("GridsK", "GridsJ", "GridsI").values
+            self.nodes[orientation] = np.argwhere(valid)
+
+        # Wall cells are the cells holding at least one façade node, each one gets the preferred orientation it holds:
+        # the first occurrence of the cell in the nodes of all the orientations, in order of preference
+        all_cells = np.concatenate([self.nodes[orientation] for orientation in facade_orientations]).reshape(-1, 3)
+        all_orientations = np.repeat(np.arange(len(facade_orientations)), [len(self.nodes[orientation]) for orientation in facade_orientations])
+        flat_cells = np.ravel_multi_index(all_cells.T, grid_shape)
+        _, first_occurrences = np.unique(flat_cells, return_index=True)
+        first_occurrences.sort()
+        self.wall_cells = all_cells[first_occurrences]
+        self.wall_orientations = all_orientations[first_occurrences]
+        self.cell_to_wall = np.full(grid_shape, -1, dtype=np.int64)
+        self.cell_to_wall.flat[flat_cells[first_occurrences]] = np.arange(len(first_occurrences))
+
+        # Nearest valid node of every wall cell in every orientation, so that lookups do not search anymore
+        self.nearest_nodes = {
+            orientation: self.nearest(self.wall_cells, self.nodes[orientation])
+            for orientation in facade_orientations
+        }
+
+    def positions(self, cells):
+        return np.stack([axis[cells[:, dim]] for dim, axis in enumerate(self.grid)], axis=1).astype(np.float64)
+
+    def nearest(self, cells, candidates, block_size: int = 8, max_pairs: int = 1 << 22):
+        # Index in candidates of the nearest candidate (in metres) of every cell, lowest index first among ties, -1 when
+        # there is no candidate at all. Cells and candidates are bucketed in blocks of block_size³ grid cells, the
+        # candidates sorted by block so that each block is a range of them. All the cells look at the blocks at radius
+        # 0, 1, 2... around their own block at once, each radius only for the cells whose nearest candidate could still
+        # lie outside the blocks searched so far.
+        result = np.full(len(cells), -1, dtype=np.int64)
+        if len(candidates) == 0:
+            return result
+        positions = self.positions(cells)
+        candidate_positions = self.positions(candidates)
+        block_counts = np.array([len(axis) - 1 for axis in self.grid]) // block_size + 1
+        candidate_blocks = np.ravel_multi_index((candidates // block_size).T, block_counts)
+        by_block = np.argsort(candidate_blocks, kind="stable")
+        candidate_blocks = candidate_blocks[by_block]
+
+        cell_blocks = cells // block_size
+        best_distances = np.full(len(cells), np.inf)
+        query = np.arange(len(cells))
+        for radius in range(block_counts.max()):
+            # The blocks at exactly this radius, the closer ones were searched at the previous radii
+            offsets = np.indices((2 * radius + 1,) * 3).reshape(3, -1).T - radius
+            offsets = offsets[np.abs(offsets).max(axis=1) == radius]
+            chunk_size = max(1, max_pairs // (4 * len(offsets)))
+            for chunk_start in range(0, len(query), chunk_size):
+                chunk = query[chunk_start:chunk_start + chunk_size]
+                neighbours = cell_blocks[chunk, None, :] + offsets[None, :, :]
+                inside = ((neighbours >= 0) & (neighbours < block_counts)).all(axis=2)
+                neighbour_blocks = np.ravel_multi_index(np.moveaxis(np.clip(neighbours, 0, block_counts - 1), 2, 0), block_counts)
+                starts = np.searchsorted(candidate_blocks, neighbour_blocks, side="left")
+                counts = np.where(inside, np.searchsorted(candidate_blocks, neighbour_blocks, side="right") - starts, 0)
+
+                # (cell, candidate) pairs, about max_pairs at a time
+                pair_ends = np.cumsum(counts.sum(axis=1))
+                bounds = np.searchsorted(pair_ends, np.arange(1, pair_ends[-1] // max_pairs + 1) * max_pairs, side="right")
+                for low, high in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(chunk)]])):
+                    self.update_nearest(chunk[low:high], starts[low:high].ravel(), counts[low:high].ravel(), by_block, positions, candidate_positions, result, best_distances)
+
+            # A candidate outside the searched blocks is at least as far as their boundary
+            low = np.maximum(cell_blocks[query] - radius, 0)
+            high = np.minimum(cell_blocks[query] + radius, block_counts - 1)
+            margins = np.full(len(query), np.inf)
+            for dim, axis in enumerate(self.grid):
+                below = low[:, dim] > 0
+                margins[below] = np.minimum(margins[below], positions[query[below], dim] - axis[low[below, dim] * block_size - 1])
+                above = high[:, dim] < block_counts[dim] - 1
+                margins[above] = np.minimum(margins[above], axis[(high[above, dim] + 1) * block_size] - positions[query[above], dim])
+            resolved = np.isinf(margins) | (best_distances[query] < margins ** 2)
+            query = query[~resolved]
+            if query.size == 0:
+                break
+        return result
+
+    def update_nearest(self, cells, starts, counts, by_block, positions, candidate_positions, result, best_distances):
+        # Keep in result and best_distances the nearest of the candidates by_block[start:start + count] of each block
+        # range, ranges listed per cell (counts has one entry per cell and searched block)
+        total = counts.sum()
+        if total == 0:
+            return
+        pair_cells = np.repeat(np.repeat(cells, len(counts) // len(cells)), counts)
+        pair_ranks = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_candidates = by_block[np.repeat(starts, counts) + pair_ranks]
+        distances = ((positions[pair_cells] - candidate_positions[pair_candidates]) ** 2).sum(axis=1)
+
+        # The nearest pair of each cell, lowest candidate index first among ties
+        order = np.lexsort((pair_candidates, distances, pair_cells))
+        first = order[np.concatenate([[True], pair_cells[order][1:] != pair_cells[order][:-1]])]
+        nearest_cells, nearest_candidates, nearest_distances = pair_cells[first], pair_candidates[first], distances[first]
+        closer = (nearest_distances < best_distances[nearest_cells]) | (
+            (nearest_distances == best_distances[nearest_cells]) & (nearest_candidates < result[nearest_cells])
+        )
+        result[nearest_cells[closer]] = nearest_candidates[closer]
+        best_distances[nearest_cells[closer]] = nearest_distances[closer]
+
+    def wall_cell_for_coords(self, coords: list[float]):
+        # Grid cell of the coordinates, O(1) when it is a wall cell, otherwise the nearest wall cell
+        cell = np.array([[np.abs(axis - value).argmin() for axis, value in zip(self.grid, [coords[2], coords[1], coords[0]])]])
+        wall = self.cell_to_wall[tuple(cell[0])]
+        if wall == -1:
+            wall = self.nearest(cell, self.wall_cells)[0]
+        return wall
+
+    def resolve(self, coords: list[float], orientation: str = None):
+        # Orientation and (k, j, i) indices of the façade node to read for a point
+        wall = self.wall_cell_for_coords(coords)
+        orientation = orientation or facade_orientations[self.wall_orientations[wall]]
+        node = self.nearest_nodes[orientation][wall]
+        return orientation, tuple(self.nodes[orientation][node])
+
+# One index per input file, shared by all the façade variables of a scenario, for the scenarios of open_scenarios
+facade_indices = OrderedDict()
+
+def get_facade_index(ds):
+    key = dataset_key(ds)
+    if key not in facade_indices:
+        print("Building façade index...")
+        facade_indices[key] = FacadeIndex(ds)
+        while len(facade_indices) > max_open_scenarios:
+            facade_indices.popitem(last=False)
+    facade_indices.move_to_end(key)
+    return facade_indices[key]
+
+
+# Façade surface planes: the nodes of each wall orientation unfolded into a 2-D wall elevation. The first index of
+# the elevation runs over the walls side by side, one column per (wall axis, along axis) pair of the nodes, by wall then
+# along the wall, and the second index over the levels (heights, or y for the roofs), as in the vertical planes. Every
+# node gets its own cell and the cells without a node are null, so the elevations are stored as masked planes.
+
+# Axes of the 2-D wall elevation in which the nodes of each orientation unfold, and the axis the walls are stacked along
+facade_elevation_axes = {
+    "X": {"axes": ["y", "z"], "wall_axis": "x"},
+    "Y": {"axes": ["x", "z"], "wall_axis": "y"},
+    "Z": {"axes": ["x", "y"], "wall_axis": "z"},
+}
+
+facade_node_dims = {"z": 0, "y": 1, "x": 2}  # columns of the (k, j, i) façade nodes
+
+def facade_elevation(facade_index, orientation: str):
+    # Column and level of every node of the orientation, and the (wall, along) node indices of the columns and the
+    # level node indices of the levels
+    axes = facade_elevation_axes[orientation]
+    wall_dim, along_dim, level_dim = (facade_node_dims[axis] for axis in [axes["wall_axis"], *axes["axes"]])
+    nodes = facade_index.nodes[orientation]
+    columns, node_columns = np.unique(nodes[:, [wall_dim, along_dim]], axis=0, return_inverse=True)
+    levels, node_levels = np.unique(nodes[:, level_dim], return_inverse=True)
+    return node_columns.ravel(), node_levels.ravel(), columns, levels
+
+def export_facade_index(scenario: str, ds, output_directory: str):
+    # facades/<orientation>.json holds the coordinates of the columns and levels of the wall elevation of every façade
+    # plane, and the heatmap axes of the elevation
+    facade_index = get_facade_index(ds)
+    for orientation in facade_orientations:
+        axes = facade_elevation_axes[orientation]
+        wall_axis, along_axis, level_axis = axes["wall_axis"], *axes["axes"]
+        _, _, columns, levels = facade_elevation(facade_index, orientation)
+        wall_values = facade_index.grid[facade_node_dims[wall_axis]][columns[:, 0]]
+        along_values = facade_index.grid[facade_node_dims[along_axis]][columns[:, 1]]
+        level_values = facade_index.grid[facade_node_dims[level_axis]][levels]
+        record = {
+            "orientation": orientation,
+            **axes,
+            "columns": {wall_axis: wall_values.tolist(), along_axis: along_values.tolist()},
+            "levels": level_values.tolist(),
+            "graphAxes": {
+                "x": graph_axis(along_axis.upper(), "m", 1, 0, len(columns), along_values),
+                "y": graph_axis(level_axis.upper(), "m", 1, 0, len(levels), level_values),
+            },
+        }
+        save_json_for_scenario(to_json_compatible(record), output_directory, scenario, "facades", orientation)
+
+def export_facade_planes_for_var(scenario: str, ds, variable_name: str, output_directory: str, time_indices=plane_time_indices):
+    facade_index = get_facade_index(ds)
+    for orientation in facade_orientations:
+        nodes = facade_index.nodes[orientation]
+        node_columns, node_levels, columns, levels = facade_elevation(facade_index, orientation)
+        variable = get_data_variable(ds, variable_name.replace("$", orientation)).transpose("Time", "GridsK", "GridsJ", "GridsI")
+
+        # One vectorized read of every node at every exported time, scattered into the elevation of each time
+        block = variable.isel(Time=time_indices).values[:, nodes[:, 0], nodes[:, 1], nodes[:, 2]]
+        elevations = np.full((len(time_indices), len(columns), len(levels)), np.nan, dtype=block.dtype)
+        elevations[:, node_columns, node_levels] = block
+        for time_index, grid in zip(time_indices, elevations):
+            print(f"Exporting {orientation} façade plane for {variable_name} at time index {time_index}...")
+            save_slice_to_json(scenario, output_directory, variable_name, time_index=time_index, slicer_slug=f"facade_{orientation}", dict=masked_plane_record(scenario, grid, output_directory))
 
 
 # Export time series points
 
 def export_time_series_points(scenario: str, ds, points, output_directory: str):
+    variable_names = list(dict.fromkeys(variable_name for point in points for variable_name in point["v"]))
+    for variable_name in variable_names:
+        export_time_series_points_for_var(scenario, ds, variable_name, points, output_directory)
+
+def export_time_series_points_for_var(scenario: str, ds, variable_name: str, points, output_directory: str):
     for point in points:
-        coords = point["c"]
-        variable_names = point["v"]
-        for variable_name in variable_names:
-            print(f"Exporting time series for {variable_name} at {coords}")
-            is_building_data = "$" in variable_name
-            true_variable_name = variable_name
-
-            if is_building_data:
-                if coords[0] == 118.0 and coords[1] == 118.0:
-                    true_variable_name = variable_name.replace("$", "Z")
-                elif coords[1] == 118.0:
-                    true_variable_name = variable_name.replace("$", "X")
-                elif coords[0] == 118.0:
-                    true_variable_name = variable_name.replace("$", "Y")
-
-            time_series, true_coords = get_single_time_series_point_for_var_and_coords_dataframe(ds, true_variable_name, coords, filter_nan=is_building_data)
-            record = {
-                "requested_coords": {"x": coords[0], "y": coords[1], "z": coords[2]},
-                "true_coords": true_coords,
-                "data": to_json_compatible(time_series.to_dict(orient="records")),
-            }
-            save_json_for_scenario(record, output_directory, scenario, f"{variable_name}/timeSeries", point["s"])
+        if variable_name not in point["v"]:
+            continue
+
+        print(f"Exporting time series for {variable_name} at {point['c']}")
+        record = time_series_record(ds, variable_name, point["c"])
+        save_json_for_scenario(record, output_directory, scenario, f"{variable_name}/timeSeries", point["s"])
+
+def time_series_record(ds, variable_name: str, coords: list[float]):
+    if variable_name in building_data_variables:
+        time_series, true_coords = get_facade_time_series_point_for_var_and_coords_dataframe(ds, variable_name, coords)
+    else:
+        time_series, true_coords = get_single_time_series_point_for_var_and_coords_dataframe(ds, variable_name, coords)
+    return {
+        "requested_coords": {"x": coords[0], "y": coords[1], "z": coords[2]},
+        "true_coords": true_coords,
+        "data": to_json_compatible(time_series.to_dict(orient="records")),
+    }
 
-def get_single_time_series_point_for_var_and_coords_dataframe(ds, variable_name: str, coords: list[float], filter_nan: bool = False):
+def get_single_time_series_point_for_var_and_coords_dataframe(ds, variable_name: str, coords: list[float]):
     x = coords[0] + 1.0 if coords[0] % 2 != 0 else coords[0]
     y = coords[1] + 1.0 if coords[1] % 2 != 0 else coords[1]
 
-    variable = ds.data_vars[variable_name]
+    variable = get_data_variable(ds, variable_name)
 
     selection = {"GridsI": x, "GridsJ": y}
-    columns_to_drop = ["GridsI", "GridsJ"]
     if "GridsK" in variable.dims and len(coords) > 2:
         selection["GridsK"] = coords[2]
-        columns_to_drop.append("GridsK")
     elif "SoilLevels" in variable.dims and len(coords) > 2:
         selection["SoilLevels"] = abs(coords[2])
-        columns_to_drop.append("SoilLevels")
 
-    filtered = variable.where(variable.notnull(), drop=True) if filter_nan else variable
-    point_data = filtered.sel(method="nearest", **selection)
-    true_coords = {
-        "x": float(point_data["GridsI"].values),
-        "y": float(point_data["GridsJ"].values),
-        "z": float(point_data["GridsK"].values) if "GridsK" in point_data else None,
-    }
+    point_data = variable.sel(method="nearest", **selection)
+    point_data = point_data.copy(data=as_compute_dtype(point_data.values, variable_name))
+    return time_series_dataframe(point_data, variable_name)
+
+def get_facade_time_series_point_for_var_and_coords_dataframe(ds, variable_name: str, coords: list[float]):
+    point_data = get_facade_point_data(ds, variable_name, coords)
+    point_data = point_data.copy(data=as_compute_dtype(point_data.values, variable_name))
+    return time_series_dataframe(point_data, point_data.name)
+
+def get_facade_point_data(ds, variable_name: str, coords: list[float]):
+    x = coords[0] + 1.0 if coords[0] % 2 != 0 else coords[0]
+    y = coords[1] + 1.0 if coords[1] % 2 != 0 else coords[1]
 
-    df = point_data.to_dataframe().reset_index().rename(columns={variable_name: "v"}).drop(columns=columns_to_drop)
+    # The façade index picks the X/Y/Z variant of the wall at the point and its nearest valid node
+    orientation, (k, j, i) = get_facade_index(ds).resolve([x, y, coords[2]])
+    variable = get_data_variable(ds, variable_name.replace("$", orientation))
+
+    return variable.isel(GridsK=k, GridsJ=j, GridsI=i)
+
+def time_series_dataframe(point_data, variable_name: str):
+    # Same true coordinates as the point series
+    true_coords = point_true_coords(point_data)
+
+    df = point_data.to_dataframe().reset_index()[["Time", variable_name]].rename(columns={variable_name: "v"})
     df["t"] = df["Time"].dt.strftime('%H:%M:%S')
     df.drop(columns=["Time"], inplace=True)
 
     return df, true_coords
 
-def export_depth_series_for_time_series_points(scenario: str, ds, points, output_directory: str):
-    for point in points:
-        coords = point["c"]
-        depth_variables = point["d"]
-        for variable_name in depth_variables:
-            print(f"Exporting depth series for {variable_name} at {coords}")
-            record = get_depth_series_for_var_coords_and_time_dataframe(ds, variable_name, coords)
-            save_json_for_scenario(record, output_directory, scenario, f"{variable_name}/depthSeries", point["s"])
+# Consolidated point series: every variable of a point in one columnar file, with the time axis stored once
 
-def get_depth_series_for_var_coords_and_time_dataframe(ds, variable_name: str, coords: list[float], filter_nan: bool = False):
-    x = coords[0] + 1.0 if coords[0] % 2 != 0 else coords[0]
-    y = coords[1] + 1.0 if coords[1] % 2 != 0 else coords[1]
+def export_point_series(scenario: str, ds, points, output_directory: str):
+    times = point_series_times(ds)
+    records = {
+        point["s"]: {
+            "requested_coords": {"x": point["c"][0], "y": point["c"][1], "z": point["c"][2]},
+            "times": times,
+            "variables": {},
+        }
+        for point in points
+    }
 
-    variable = ds.data_vars[variable_name]
+    for variable_name in dict.fromkeys(variable_name for point in points for variable_name in point["v"]):
+        variable_points = [point for point in points if variable_name in point["v"]]
+        print(f"Extracting point series for {variable_name} at {len(variable_points)} points")
+        series = get_scenario(scenario, ds).series_at(variable_name, variable_points)
+        for point, (values, true_coords) in zip(variable_points, series):
+            records[point["s"]]["variables"][variable_name] = {
+                "true_coords": true_coords,
+                "v": to_json_compatible(values.tolist()),
+            }
 
-    selection = {"GridsI": x, "GridsJ": y}
-    columns_to_drop = ["GridsI", "GridsJ"]
+    for point in points:
+        save_json_for_scenario(records[point["s"]], output_directory, scenario, "pointSeries", point["s"])
+
+def point_series_times(ds):
+    return [str(t) for t in pd.DatetimeIndex(ds["Time"].values).strftime('%H:%M:%S')]
+
+def get_point_series_for_var_and_points(ds, variable_name: str, coords_list: list[list[float]]):
+    # List of (values over time, true coords), in the order of coords_list
+    if variable_name in building_data_variables:
+        return [
+            (as_compute_dtype(point_data.values, variable_name), point_true_coords(point_data))
+            for point_data in (get_facade_point_data(ds, variable_name, coords) for coords in coords_list)
+        ]
 
-    filtered = variable.where(variable.notnull(), drop=True) if filter_nan else variable
-    point_data = filtered.sel(method="nearest", **selection)
-    true_coords = {
+    variable = get_data_variable(ds, variable_name)
+    x_indices, y_indices = nearest_grid_indices(ds, coords_list)
+    selection = {"GridsI": xr.DataArray(x_indices, dims="point"), "GridsJ": xr.DataArray(y_indices, dims="point")}
+    if "GridsK" in variable.dims:
+        k_indices = ds.indexes["GridsK"].get_indexer([coords[2] for coords in coords_list], method="nearest")
+        selection["GridsK"] = xr.DataArray(k_indices, dims="point")
+    elif "SoilLevels" in variable.dims:
+        depth_indices = ds.indexes["SoilLevels"].get_indexer([abs(coords[2]) for coords in coords_list], method="nearest")
+        selection["SoilLevels"] = xr.DataArray(depth_indices, dims="point")
+
+    # One vectorized read of a (point, time) block instead of a sel/to_dataframe round trip per point
+    points_data = variable.isel(**selection).transpose("point", "Time")
+    block = as_compute_dtype(points_data.values, variable_name)
+    return [(block[n], point_true_coords(points_data.isel(point=n))) for n in range(len(coords_list))]
+
+def point_true_coords(point_data):
+    return {
         "x": float(point_data["GridsI"].values),
         "y": float(point_data["GridsJ"].values),
-        "z": float(point_data["GridsK"].values) if "GridsK" in point_data else None,
+        "z": float(point_data["GridsK"].values) if "GridsK" in point_data.coords else None,
     }
 
-    df = point_data.to_dataframe().reset_index().rename(columns={variable_name: "v"}).drop(columns=columns_to_drop)
-    depths = sorted(df["SoilLevels"].unique())
-    result = {
+# Parquet export of the point series, one file per scenario laid out as a dataset partitioned by scenario. pyarrow is
+# optional, only the analytics users need it.
+
+def parquet_output_path(scenario: str):
+    # Relative to the output directory, pd.read_parquet("<output>/parquet") loads every scenario with a scenario column
+    return Path("parquet") / f"scenario={get_scenario_slug(scenario)}" / "series.parquet"
+
+def export_points_parquet(scenario: str, ds, points, output_directory: str):
+    times = ds["Time"].values
+    frames = []
+    for variable_name in dict.fromkeys(variable_name for point in points for variable_name in point["v"]):
+        variable_points = [point for point in points if variable_name in point["v"]]
+        series = get_scenario(scenario, ds).series_at(variable_name, variable_points)
+        for point, (values, true_coords) in zip(variable_points, series):
+            frames.append(pd.DataFrame({
+                "point": point["s"],
+                "variable": variable_name,
+                "time": times,
+                "value": as_compute_dtype(values, variable_name),
+                "x": true_coords["x"],
+                "y": true_coords["y"],
+                "z": np.nan if true_coords["z"] is None else true_coords["z"],
+            }))
+
+    table = pd.concat(frames, ignore_index=True)
+    table["point"] = table["point"].astype("category")
+    table["variable"] = table["variable"].astype("category")
+    print(f"Writing {len(table)} rows to Parquet")
+    save_parquet(table, Path(output_directory) / parquet_output_path(scenario))
+
+def export_depth_series_and_temporal_variations(scenario: str, ds, points, output_directory: str):
+    depth_variables = list(dict.fromkeys(variable_name for point in points for variable_name in point["d"]))
+    for variable_name in depth_variables:
+        export_depth_series_and_temporal_variations_for_var(scenario, ds, variable_name, points, output_directory)
+
+def export_depth_series_and_temporal_variations_for_var(scenario: str, ds, variable_name: str, points, output_directory: str):
+    variable_points = [point for point in points if variable_name in point["d"]]
+    print(f"Extracting depth block for {variable_name} at {len(variable_points)} points")
+    block, true_coords, times, depths = get_scenario(scenario, ds).depth_at(variable_name, variable_points)
+
+    for point_index, point in enumerate(variable_points):
+        coords = point["c"]
+        print(f"Exporting depth series for {variable_name} at {coords}")
+        record = depth_series_record(block[point_index], coords, true_coords[point_index], times, depths)
+        save_json_for_scenario(record, output_directory, scenario, f"{variable_name}/depthSeries", point["s"])
+
+        if has_depth_temporal_variations(point):
+            print(f"Exporting depth temporal variations for {variable_name} at {coords}")
+            record = depth_temporal_variations_record(block[point_index], coords, true_coords[point_index], times, depths)
+            save_json_for_scenario(record, output_directory, scenario, f"{variable_name}/depthTemporalVariations", point["s"])
+
+def has_depth_temporal_variations(point):
+    return point["c"][2] > -0.5
+
+def get_depth_block_for_var_and_points(ds, variable_name: str, coords_list: list[list[float]]):
+    return get_column_block_for_var_and_points(ds, variable_name, coords_list, "SoilLevels")
+
+def get_column_block_for_var_and_points(ds, variable_name: str, coords_list: list[list[float]], column_dimension: str):
+    variable = get_data_variable(ds, variable_name)
+    x_indices, y_indices = nearest_grid_indices(ds, coords_list)
+
+    # One vectorized read of a (point, time, level) block instead of a sel/to_dataframe round trip per point
+    points_data = variable.isel(GridsI=xr.DataArray(x_indices, dims="point"), GridsJ=xr.DataArray(y_indices, dims="point"))
+    block = as_compute_dtype(points_data.transpose("point", "Time", column_dimension).values, variable_name)
+
+    grid_x = ds["GridsI"].values
+    grid_y = ds["GridsJ"].values
+    true_coords = [
+        {"x": float(grid_x[x_index]), "y": float(grid_y[y_index]), "z": None}
+        for x_index, y_index in zip(x_indices, y_indices)
+    ]
+    times = pd.DatetimeIndex(variable["Time"].values)
+    levels = [float(level) for level in variable[column_dimension].values]
+
+    return block, true_coords, times, levels
+
+def nearest_grid_indices(ds, coords_list: list[list[float]]):
+    x_values = [coords[0] + 1.0 if coords[0] % 2 != 0 else coords[0] for coords in coords_list]
+    y_values = [coords[1] + 1.0 if coords[1] % 2 != 0 else coords[1] for coords in coords_list]
+    x_indices = ds.indexes["GridsI"].get_indexer(x_values, method="nearest")
+    y_indices = ds.indexes["GridsJ"].get_indexer(y_values, method="nearest")
+    return x_indices, y_indices
+
+def depth_series_record(point_block, coords: list[float], true_coords: dict, times, depths: list[float]):
+    # point_block is (time, depth), the first time step is skipped as in the original export
+    return {
         "requested_coords": {"x": coords[0], "y": coords[1]},
         "true_coords": true_coords,
-        "depths_m": [float(d) for d in depths],
+        "depths_m": depths,
         "data": [
             {
                 "t": str(time).replace("23:59", "24:00"),
-                "v": group["v"].tolist()
+                "v": to_json_compatible(values.tolist())
             }
-            for time, group in islice(df.groupby("Time"), 1, None)
+            for time, values in islice(zip(times, point_block), 1, None)
         ]
     }
-    
-    return result
 
+def depth_temporal_variations_record(point_block, coords: list[float], true_coords: dict, times, depths: list[float]):
+    return {
+        "requested_coords": {"x": coords[0], "y": coords[1]},
+        "true_coords": true_coords,
+        "times": [str(t) for t in times],
+        "data": [
+            {
+                "d": depth,
+                "v": to_json_compatible(values.tolist())
+            }
+            for depth, values in zip(depths, point_block.T)
+        ]
+    }
 
-def export_depth_temporal_variations_for_time_series_points(scenario: str, ds, points, output_directory: str):
-    for point in points:
-        coords = point["c"]
-        depth_variables = point["d"]
-        for variable_name in depth_variables:
-            print(f"Exporting depth temporal variations for {variable_name} at {coords}")
-            record = get_depth_temporal_variations_for_var_and_coords_dataframe(ds, variable_name, coords)
-            save_json_for_scenario(record, output_directory, scenario, f"{variable_name}/depthTemporalVariations", point["s"])
 
-def get_depth_temporal_variations_for_var_and_coords_dataframe(ds, variable_name: str, coords: list[float], filter_nan: bool = False):
-    x = coords[0] + 1.0 if coords[0] % 2 != 0 else coords[0]
-    y = coords[1] + 1.0 if coords[1] % 2 != 0 else coords[1]
+# Vertical profiles: the whole GridsK column of the atmospheric variables at each point, the analogue of depthSeries
 
-    variable = ds.data_vars[variable_name]
+def get_vertical_profile_variables(ds, point):
+    return [
+        variable_name for variable_name in point["v"]
+        if variable_name not in building_data_variables and "GridsK" in ds[variable_name].dims
+    ]
 
-    selection = {"GridsI": x, "GridsJ": y}
-    columns_to_drop = ["GridsI", "GridsJ"]
+def export_vertical_profiles_for_var(scenario: str, ds, variable_name: str, points, output_directory: str):
+    variable_points = [point for point in points if variable_name in get_vertical_profile_variables(ds, point)]
+    print(f"Extracting vertical profiles for {variable_name} at {len(variable_points)} points")
+    block, true_coords, times, heights = get_column_block_for_var_and_points(ds, variable_name, [point["c"] for point in variable_points], "GridsK")
 
-    filtered = variable.where(variable.notnull(), drop=True) if filter_nan else variable
-    point_data = filtered.sel(method="nearest", **selection)
-    true_coords = {
-        "x": float(point_data["GridsI"].values),
-        "y": float(point_data["GridsJ"].values),
-        "z": float(point_data["GridsK"].values) if "GridsK" in point_data else None,
-    }
+    for point_index, point in enumerate(variable_points):
+        record = vertical_profile_record(block[point_index], point["c"], true_coords[point_index], times, heights)
+        save_json_for_scenario(record, output_directory, scenario, f"{variable_name}/verticalProfiles", point["s"])
 
-    df = point_data.to_dataframe().reset_index().rename(columns={variable_name: "v"}).drop(columns=columns_to_drop)
-    times = sorted(df["Time"].unique())
-    result = {
+def vertical_profile_record(point_block, coords: list[float], true_coords: dict, times, heights: list[float]):
+    # point_block is (time, height), every time step is kept, unlike depthSeries
+    return {
         "requested_coords": {"x": coords[0], "y": coords[1]},
         "true_coords": true_coords,
-        "times": [str(t) for t in times],
+        "heights_m": heights,
         "data": [
             {
-                "d": float(depth),
-                "v": group["v"].tolist()
+                "t": str(time).replace("23:59", "24:00"),
+                "v": to_json_compatible(values.tolist())
             }
-            for depth, group in df.groupby("SoilLevels")
+            for time, values in zip(times, point_block)
         ]
     }
 
-    return result
+
+# Scenario API: the products of a scenario computed on demand and memoized, shared by the exports of a run, the
+# query server and interactive analysis, e.g. in a notebook:
+#   scenario = Scenario("S1_1_Tall_Canyon_Scenario", "raw_data")
+#   scenario.plane("T", "horizontal_human_height", 12)  # 2-D grid, rows by increasing y, or {"z": 9.0} / {"x": 99.0}
+#   scenario.series("T", [118.0, 100.0, human_height])  # (values over time, true coords)
+#   scenario.depth("SoilTemp", [118.0, 100.0, -0.25])   # ((time, depth) block, true coords, times, depths)
+#   scenario.maps()                                      # building, soil and objects maps
+
+class Scenario:
+    def __init__(self, name: str, input_directory: str = None, ds=None, max_cached_mb: float = 512.0):
+        self.name = name
+        self.ds = ds if ds is not None else open_scenario_dataset(name, input_directory)
+        self.max_cached_bytes = int(max_cached_mb * 1024 ** 2)
+        self.products = OrderedDict()  # key -> (result, bytes), least recently used first
+        self.lock = threading.Lock()
+
+    def memoized(self, key, compute):
+        with self.lock:
+            if key in self.products:
+                self.products.move_to_end(key)
+                return self.products[key][0]
+        # Computed outside the lock, two threads asking for the same product at once may both compute it
+        result = compute()
+        with self.lock:
+            self.products[key] = (result, product_bytes(result))
+            total_bytes = sum(size for _, size in self.products.values())
+            while total_bytes > self.max_cached_bytes and len(self.products) > 1:
+                _, (_, size) = self.products.popitem(last=False)
+                total_bytes -= size
+        return result
+
+    def slicers(self, variable_name: str):
+        return get_underground_plane_slicers_for_scenario(self.name) if variable_name in underground_level_variables else get_plane_slicers_for_scenario(self.name)
+
+    def planes(self, variable_name: str, time_index: int):
+        # Every configured plane of a time step, from a single read of the time slice. The grids are copied so that
+        # they do not keep the whole time slice alive, and read-only as they are shared.
+        def compute():
+            variable_at_time = get_variable_at_time(self.ds, variable_name, time_index)
+            return {
+                slicer["slug"]: read_only_copy(slice_to_grid(slicer["slicer"](variable_at_time), index_column=slicer.get("index_column", "y"), columns=slicer.get("columns", "x")))
+                for slicer in self.slicers(variable_name)
+            }
+        return self.memoized(("planes", variable_name, time_index), compute)
+
+    def plane(self, variable_name: str, slicer, time_index: int):
+        if isinstance(slicer, str):
+            return self.planes(variable_name, time_index)[slicer]
+
+        (axis, value), = slicer.items()
+        def compute():
+            variable_at_time = get_variable_at_time(self.ds, variable_name, time_index)
+            if axis == "z":
+                return read_only_copy(slice_to_grid(slice_xy_plane_at_z(variable_at_time, value), index_column="y", columns="x"))
+            return read_only_copy(slice_to_grid(slice_yz_plane_at_x(variable_at_time, value), index_column="y", columns="z"))
+        return self.memoized(("plane", variable_name, axis, value, time_index), compute)
+
+    def series(self, variable_name: str, point):
+        return self.series_at(variable_name, [point])[0]
+
+    def series_at(self, variable_name: str, points):
+        # Points are coordinates or time series points, read in one vectorized block
+        coords_list = [point_coords(point) for point in points]
+        return self.memoized(("series", variable_name, coords_key(coords_list)), lambda: get_point_series_for_var_and_points(self.ds, variable_name, coords_list))
+
+    def depth(self, variable_name: str, point):
+        block, true_coords, times, depths = self.depth_at(variable_name, [point])
+        return block[0], true_coords[0], times, depths
+
+    def depth_at(self, variable_name: str, points):
+        coords_list = [point_coords(point) for point in points]
+        return self.memoized(("depth", variable_name, coords_key(coords_list)), lambda: get_depth_block_for_var_and_points(self.ds, variable_name, coords_list))
+
+    def maps(self):
+        return self.memoized(("maps",), lambda: scenario_maps(self.name, self.ds))
+
+def read_only_copy(array):
+    array = array.copy()
+    array.flags.writeable = False
+    return array
+
+def point_coords(point):
+    return point["c"] if isinstance(point, dict) else list(point)
+
+def coords_key(coords_list: list[list[float]]):
+    return tuple(tuple(coords) for coords in coords_list)
+
+def product_bytes(result):
+    if hasattr(result, "nbytes"):
+        return int(result.nbytes)
+    if isinstance(result, dict):
+        return sum(product_bytes(value) for value in result.values())
+    if isinstance(result, (list, tuple)):
+        return sum(product_bytes(value) for value in result)
+    return 0
+
+# Scenarios of the datasets being processed, so that the stages of a run (planes, cog and plane_stats) share products
+open_scenarios = OrderedDict()
+max_open_scenarios = 2
+
+def get_scenario(scenario_name: str, ds):
+    key = (scenario_name, dataset_key(ds))
+    if key not in open_scenarios:
+        open_scenarios[key] = Scenario(scenario_name, ds=ds)
+        while len(open_scenarios) > max_open_scenarios:
+            open_scenarios.popitem(last=False)
+    open_scenarios.move_to_end(key)
+    return open_scenarios[key]
+
+
+# Intermediate cache of decoded variables, shared by the stages and by the worker processes
+
+class VariableCache:
+    # Each variable is decoded once into a .npy file of its compute dtype, later reads memory-map it instead of decompressing
+    # the NetCDF chunks again. The least recently used files are evicted when the cache grows over max_bytes.
+    def __init__(self, cache_directory: str, max_bytes: int):
+        self.cache_directory = Path(cache_directory)
+        self.max_bytes = max_bytes
+        self.cache_directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, ds, variable_name: str):
+        variable = ds.data_vars[variable_name]
+        path = self.cache_directory / f"{self.cache_key(ds, variable_name)}.npy"
+        try:
+            data = np.load(path, mmap_mode="r")
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            data = self.store(path, variable, compute_dtype(variable_name))
+
+        return xr.DataArray(data, coords=variable.coords, dims=variable.dims, attrs=variable.attrs, name=variable_name)
+
+    def store(self, path: Path, variable, dtype: str):
+        tmp_path = path.with_name(f"{path.stem}.{socket.gethostname()}-{os.getpid()}.tmp.npy")
+        np.save(tmp_path, variable.values.astype(dtype, copy=False))
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+        return np.load(path, mmap_mode="r")
+
+    def evict(self, keep: Path):
+        entries = []
+        for path in self.cache_directory.glob("*.npy"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # evicted by another process meanwhile
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            # Processes that already mapped the file keep their view of it
+            path.unlink(missing_ok=True)
+            total_bytes -= size
+
+    @staticmethod
+    def cache_key(ds, variable_name: str):
+        sources = [Path(source) for source in dataset_sources(ds)]
+        identity = "|".join(f"{source.resolve()}|{source.stat().st_size}|{source.stat().st_mtime_ns}" for source in sources)
+        identity += f"|{variable_name}|{compute_dtype(variable_name)}"
+        return hashlib.sha1(identity.encode()).hexdigest()
+
+class MemoryVariableCache:
+    # Decoded variables kept in memory by the query server and shared by its request threads. Series read every time
+    # step of a variable, so the whole variable is the hyperslab worth keeping. The least recently used variables are
+    # dropped when the cache grows over max_bytes.
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.variables = OrderedDict()  # (sources, variable name) -> DataArray
+        self.lock = threading.Lock()
+        self.loading_locks = {}
+
+    def get(self, ds, variable_name: str):
+        key = (tuple(dataset_sources(ds)), variable_name)
+        with self.lock:
+            if key in self.variables:
+                self.variables.move_to_end(key)
+                return self.variables[key]
+            loading_lock = self.loading_locks.setdefault(key, threading.Lock())
+
+        # Concurrent requests for the same variable wait for a single read
+        with loading_lock:
+            with self.lock:
+                if key in self.variables:
+                    return self.variables[key]
+            variable = ds.data_vars[variable_name]
+            loaded = xr.DataArray(as_compute_dtype(variable.values, variable_name), coords=variable.coords, dims=variable.dims, attrs=variable.attrs, name=variable_name)
+            with self.lock:
+                self.variables[key] = loaded
+                self.loading_locks.pop(key, None)
+                self.evict()
+        return loaded
+
+    def evict(self):
+        total_bytes = sum(variable.nbytes for variable in self.variables.values())
+        while total_bytes > self.max_bytes and len(self.variables) > 1:
+            _, variable = self.variables.popitem(last=False)
+            total_bytes -= variable.nbytes
+
+# Set by configure_variable_cache, None means that variables are read from the NetCDF file directly
+variable_cache = None
+
+def configure_variable_cache(cache_directory: str = None, cache_max_gb: float = 20.0):
+    global variable_cache
+    variable_cache = None if cache_directory is None else VariableCache(cache_directory, int(cache_max_gb * 1024 ** 3))
+
+def configure_memory_variable_cache(cache_max_gb: float):
+    global variable_cache
+    variable_cache = MemoryVariableCache(int(cache_max_gb * 1024 ** 3))
+
+def get_data_variable(ds, variable_name: str):
+    if variable_cache is None:
+        return ds.data_vars[variable_name]
+    return variable_cache.get(ds, variable_name)
+
+
+# Cross-scenario series: each (variable, point) of every processed scenario in one file, merged from the pointSeries files.
+# Each scenario of a file records the content hash of the pointSeries file it was merged from, its "source", so that
+# readers can tell when the scenario was processed again since and its series is out of date.
+
+comparisons_slug = "comparisons"  # written as a pseudo scenario, so that it gets a manifest like the others
+
+def export_scenario_comparisons(output_directory: str):
+    scenarios_path = Path(output_directory) / "scenarios"
+    scenario_paths = sorted(path for path in scenarios_path.iterdir() if (path / "pointSeries").is_dir())
+    point_slugs = sorted({
+        path.stem
+        for scenario_path in scenario_paths
+        for path in (scenario_path / "pointSeries").glob("*.json")
+        if is_manifest_entry(path)
+    })
+    print(f"Merging the series of {len(point_slugs)} points across {len(scenario_paths)} scenarios")
+
+    for point_slug in point_slugs:
+        # Only the series of one point are held in memory at a time
+        records = {}
+        sources = {}
+        for scenario_path in scenario_paths:
+            path = scenario_path / "pointSeries" / f"{point_slug}.json"
+            if path.exists():
+                with open(path) as f:
+                    records[scenario_path.name] = json.load(f)
+                sources[scenario_path.name] = content_hash(path)
+
+        for variable_name in dict.fromkeys(variable_name for record in records.values() for variable_name in record["variables"]):
+            record = scenario_comparison_record(records, variable_name, sources)
+            save_json_for_scenario(record, output_directory, comparisons_slug, variable_name, point_slug)
+
+    write_scenario_manifest(comparisons_slug, output_directory)
+    remove_unreferenced_blobs(output_directory)
+
+def scenario_comparison_record(records: dict, variable_name: str, sources: dict):
+    times = None
+    scenarios = {}
+    for scenario_slug, record in records.items():
+        series = record["variables"].get(variable_name)
+        if series is None:
+            continue
+        times = times or record["times"]
+        scenarios[scenario_slug] = {
+            "requested_coords": record["requested_coords"],
+            "true_coords": series["true_coords"],
+            "v": series["v"],
+            "source": sources[scenario_slug],
+        }
+        if record["times"] != times:
+            scenarios[scenario_slug]["times"] = record["times"]  # only when it differs from the shared time axis
+    return {"times": times, "scenarios": scenarios}
+
+
+# Content manifest: hash and size of every output of a scenario, so that clients only revalidate the manifest.
+# Every listed file is also hard-linked into a blob store shared by the whole output tree, blobs/<hh>/<hash>.json, so
+# that identical files (the maps of variants of one geometry, unaffected variables) are stored and fetched once.
+
+manifest_hash_length = 16
+
+def content_hash(path: Path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()[:manifest_hash_length]
+
+def is_manifest_entry(path: Path):
+    return path.name != "manifest.json"
+
+def write_scenario_manifest(scenario_name: str, output_directory: str):
+    scenario_path = Path(output_directory) / "scenarios" / get_scenario_slug(scenario_name)
+    files = {}
+    shared_count = 0
+    for path in sorted(scenario_path.rglob("*.json")):
+        if not is_manifest_entry(path):
+            continue
+        file_hash = content_hash(path)
+        files[path.relative_to(scenario_path).as_posix()] = {"hash": file_hash, "size": path.stat().st_size}
+        shared_count += link_blob(path, blob_path(output_directory, file_hash))
+
+    if shared_count:
+        print(f"{shared_count} of the {len(files)} files of {get_scenario_slug(scenario_name)} are shared with other outputs")
+    manifest = {"blobs": True, "files": files}
+    save_json(manifest, scenario_path / "manifest.json")
+    return manifest
+
+def blob_path(output_directory: str, file_hash: str):
+    return Path(output_directory) / "blobs" / file_hash[:2] / f"{file_hash}.json"
+
+def link_blob(path: Path, blob: Path):
+    # The first file with a content becomes its blob, the later ones are replaced by hard links to it. Outputs are
+    # always rewritten through os.replace, never in place, so rewriting one of them does not change the others.
+    # Returns whether the file was deduplicated.
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        try:
+            os.link(path, blob)
+            return False
+        except FileExistsError:
+            pass
+        tmp_path = path.with_name(f"{path.name}.{socket.gethostname()}-{os.getpid()}.tmp")
+        try:
+            if os.path.samefile(path, blob):
+                return False
+            if not filecmp.cmp(path, blob, shallow=False):
+                raise RuntimeError(f"{path} and {blob} have the same hash but different contents")
+            os.link(blob, tmp_path)
+        except FileNotFoundError:
+            continue  # the blob was removed as unreferenced meanwhile
+        os.replace(tmp_path, path)
+        return True
+
+def remove_unreferenced_blobs(output_directory: str):
+    # A blob that is its file's only link is not used by any output anymore
+    removed_count = 0
+    for blob in (Path(output_directory) / "blobs").glob("*/*.json"):
+        if blob.stat().st_nlink == 1:
+            blob.unlink()
+            removed_count += 1
+    return removed_count
+
+def check_scenario_manifest(scenario_name: str, output_directory: str):
+    # Names of the files that changed, appeared or disappeared since the manifest was written
+    scenario_path = Path(output_directory) / "scenarios" / get_scenario_slug(scenario_name)
+    with open(scenario_path / "manifest.json") as f:
+        files = json.load(f)["files"]
+    current = {path.relative_to(scenario_path).as_posix(): path for path in scenario_path.rglob("*.json") if is_manifest_entry(path)}
+    stale = sorted(set(files) ^ set(current))
+    stale += sorted(name for name in set(files) & set(current) if content_hash(current[name]) != files[name]["hash"])
+    return stale
+
+
+# Publication: the frontend fetches every file listed in a scenario manifest from the blob store, so the published copy
+# of the output holds the blobs, the manifests and the other files (shared JSON files, GeoTIFFs, Parquet tables), but
+# not the JSON files of the scenarios, which would double the upload
+
+def is_published_file(output_path: Path, relative_path: Path):
+    if relative_path.parts[0] == ".stamps" or relative_path.name.endswith(".tmp"):
+        return False
+    if relative_path.parts[0] == "scenarios" and len(relative_path.parts) > 2 and relative_path.suffix == ".json":
+        # A scenario without a manifest is still fetched by file name
+        has_manifest = (output_path / "scenarios" / relative_path.parts[1] / "manifest.json").exists()
+        return relative_path.name == "manifest.json" or not has_manifest
+    return True
+
+# Files copied by the last publication, only those are removed from the publish directory when they are not published
+# anymore, the other files of the directory (assets placed by hand) are left alone
+publish_index_name = ".published.json"
+
+def publish(output_directory: str, publish_directory: str):
+    # Mirror the published files of the output into publish_directory. Returns the number of copied and removed files.
+    output_path, publish_path = Path(output_directory), Path(publish_directory)
+    index_path = publish_path / publish_index_name
+    previously_published = set()
+    if index_path.exists():
+        with open(index_path) as f:
+            previously_published = {Path(name) for name in json.load(f)}
+    published = set()
+    copied_count = 0
+    for path in sorted(output_path.rglob("*")):
+        relative_path = path.relative_to(output_path)
+        if not path.is_file() or not is_published_file(output_path, relative_path):
+            continue
+        published.add(relative_path)
+        target = publish_path / relative_path
+        source_stat = path.stat()
+        if target.exists() and target.stat().st_size == source_stat.st_size and target.stat().st_mtime_ns == source_stat.st_mtime_ns:
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(f"{target.name}.{socket.gethostname()}-{os.getpid()}.tmp")
+        shutil.copy2(path, tmp_path)
+        os.replace(tmp_path, target)
+        copied_count += 1
+
+    removed_count = 0
+    for relative_path in sorted(previously_published - published):
+        if (publish_path / relative_path).exists():
+            (publish_path / relative_path).unlink()
+            removed_count += 1
+    save_json(sorted(path.as_posix() for path in published), index_path, pretty=True)
+    return copied_count, removed_count
+
+
+# Processing store: every scenario rewritten once as float32 NetCDF4, chunked for our reads, where the raw files often
+# hold a whole variable in a single chunk. Each chunk is one time step of a store_tile_size² tile of the horizontal grid,
+# over all the levels: a plane at one time step decompresses only its time step, and a series at one point only the
+# tile holding the point at each time step, instead of the whole grid.
+
+store_format_version = 2
+store_tile_size = 64  # cells along GridsI and GridsJ
+
+# Set by configure_processing_store, None means that the raw NetCDF files are read directly
+processing_store_directory = None
+
+def configure_processing_store(store_directory: str = None):
+    global processing_store_directory
+    processing_store_directory = None if store_directory is None else Path(store_directory)
+
+def open_scenario_dataset(scenario_name: str, input_directory: str):
+    if processing_store_directory is None:
+        return open_raw_scenario_dataset(scenario_name, input_directory)
+
+    input_paths = scenario_input_paths(scenario_name, input_directory)
+    path = processing_store_path(scenario_name, input_paths)
+    if not path.exists():
+        convert_to_processing_store(scenario_name, input_directory, path)
+        remove_stale_processing_stores(scenario_name, path)
+    return xr.open_dataset(path)
+
+def open_raw_scenario_dataset(scenario_name: str, input_directory: str):
+    input_paths = scenario_input_paths(scenario_name, input_directory)
+    if len(input_paths) == 1:
+        return xr.open_dataset(input_paths[0])
+
+    # The parts are opened lazily, their headers in parallel, and concatenated along Time or merged by variable
+    # depending on how the run was split. The variables become dask arrays, read from the right part on access.
+    if importlib.util.find_spec("dask") is None:
+        raise ModuleNotFoundError(f"Scenario {scenario_name} is split in {len(input_paths)} files, combining them needs dask (pip install dask)")
+    ds = xr.open_mfdataset(input_paths, combine="by_coords", parallel=True, data_vars="minimal", coords="minimal", compat="override")
+    ds.encoding["sources"] = [str(path) for path in input_paths]
+    return ds
+
+def dataset_sources(ds):
+    # Files a dataset was read from, identifies it in the caches
+    return ds.encoding.get("sources") or [ds.encoding["source"]]
+
+def dataset_key(ds):
+    return tuple((source, os.stat(source).st_mtime_ns) for source in dataset_sources(ds))
+
+def release_dataset(ds):
+    # Drops the memoized products and the façade index of a dataset, and closes it
+    key = dataset_key(ds)
+    for scenario_key in [scenario_key for scenario_key in open_scenarios if scenario_key[1] == key]:
+        del open_scenarios[scenario_key]
+    facade_indices.pop(key, None)
+    ds.close()
+
+def processing_store_path(scenario_name: str, input_paths: list[Path]):
+    input_hash = scenario_input_hash(input_paths, processing_store_directory)
+    return processing_store_directory / f"{scenario_name}-{input_hash[:16]}-v{store_format_version}.nc"
+
+def convert_to_processing_store(scenario_name: str, input_directory: str, path: Path):
+    # Also where the parts of a split scenario are merged, once, into a single file
+    input_size, _ = scenario_input_stat(scenario_name, input_directory)
+    print(f"Converting {scenario_name} into the processing store {path}")
+    started_at = time.time()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{socket.gethostname()}-{os.getpid()}.tmp")
+    with open_raw_scenario_dataset(scenario_name, input_directory) as ds:
+        encoding = {}
+        for name, variable in ds.data_vars.items():
+            variable.encoding.clear()  # drop the chunking and compression of the raw file
+            encoding[name] = {
+                "zlib": True,
+                "complevel": 1,  # fast, the shuffle filter does most of the work on float data
+                "shuffle": True,
+                "chunksizes": [store_chunk_size(dim, size) for dim, size in variable.sizes.items()] if variable.ndim else None,
+            }
+            if np.issubdtype(variable.dtype, np.floating):
+                encoding[name]["dtype"] = compute_dtype(name)
+            if not variable.ndim:
+                del encoding[name]["chunksizes"]
+        ds.to_netcdf(tmp_path, format="NETCDF4", encoding=encoding)
+    os.replace(tmp_path, path)
+    print(f"Converted in {time.time() - started_at:.1f} s ({format_bytes(input_size)} -> {format_bytes(path.stat().st_size)})")
+
+def store_chunk_size(dim: str, size: int):
+    if dim == "Time":
+        return 1
+    if dim in ("GridsI", "GridsJ"):
+        return min(size, store_tile_size)
+    return size
+
+def remove_stale_processing_stores(scenario_name: str, path: Path):
+    # Stores of previous versions of the input file
+    store_pattern = re.compile(rf"{re.escape(scenario_name)}-[0-9a-f]{{16}}-v\d+\.nc")
+    for other_path in path.parent.glob(f"{scenario_name}-*.nc"):
+        if other_path != path and store_pattern.fullmatch(other_path.name):
+            print(f"Removing stale processing store {other_path}")
+            other_path.unlink()
 
 
 # Utility functions
@@ -1145,9 +2560,19 @@ def prettify_unit(unit: str) -> str:
     }
     return unit_mappings.get(unit, unit)
 
-def slice_to_array_of_arrays(df, index_column="y", columns="x", value_column="value"):
-    to_2d = df.pivot(index=index_column, columns=columns, values=value_column)
-    return to_2d.where(pd.notna(to_2d), None).values.tolist()
+def slice_to_grid(sliced, index_column="y", columns="x"):
+    # The sliced dimension has a single coordinate, or none, which gives an empty grid
+    sliced_dimension = next(dim for dim in sliced.dims if dim not in (index_column, columns))
+    if sliced.sizes[sliced_dimension] == 0:
+        return np.empty((0, 0), dtype=sliced.dtype)
+    return sliced.isel({sliced_dimension: 0}).transpose(index_column, columns).values
+
+def compute_dtype(variable_name: str):
+    # The X/Y/Z façade variables follow their $Fac_ name
+    return "float64" if re.sub(r"^[XYZ]Fac_", "$Fac_", variable_name) in float64_variables else "float32"
+
+def as_compute_dtype(values, variable_name: str):
+    return values.astype(compute_dtype(variable_name), copy=False)
 
 def to_json_compatible(value):
     """Recursively convert numpy types and arrays to JSON-compatible types."""
@@ -1170,17 +2595,58 @@ def to_json_compatible(value):
 def save_json(dict, path, pretty=False):
     path = Path(path)
     path.parent.mkdir(parents=True, exist_ok=True)  # ensure output dirs exist
-    with open(path, "w") as f:
+    # Write to a temporary file and rename it, so that readers and concurrent workers never see a partial file
+    tmp_path = path.with_name(f"{path.name}.{socket.gethostname()}-{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
         if pretty:
             json.dump(dict, f, indent=4)
         else:
             json.dump(dict, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
 
-def save_json_for_scenario(dict, output_dir, scenario, dir_path, filename, pretty=False):
+def save_parquet(df, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Same temporary file and rename as save_json
+    tmp_path = path.with_name(f"{path.name}.{socket.gethostname()}-{os.getpid()}.tmp")
+    df.to_parquet(tmp_path, engine="pyarrow", index=False)
+    os.replace(tmp_path, path)
+
+def save_cog(bands, x, y, band_names, path):
+    # bands is (band, row, column) with rows from north to south, x and y are the cell centres of the uniform grid
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    dx, dy = float(x[1] - x[0]), float(y[1] - y[0])
+    profile = {
+        "driver": "GTiff",
+        "count": bands.shape[0],
+        "height": bands.shape[1],
+        "width": bands.shape[2],
+        "dtype": "float32",
+        "nodata": cog_nodata,
+        "transform": rasterio_transform.from_origin(float(x[0]) - dx / 2, float(y[-1]) + dy / 2, dx, dy),
+    }
+    tmp_path = path.with_name(f"{path.name}.{socket.gethostname()}-{os.getpid()}.tmp")
+    with rasterio_io.MemoryFile() as memory_file:
+        with memory_file.open(**profile) as raster:
+            raster.write(bands)
+            for band_index, band_name in enumerate(band_names, start=1):
+                raster.set_band_description(band_index, band_name)
+        # The COG driver tiles, compresses and adds the overviews while copying
+        with memory_file.open() as raster:
+            rasterio_shutil.copy(raster, tmp_path, driver="COG", compress="DEFLATE", predictor="3", blocksize=128, overview_resampling="average")
+    os.replace(tmp_path, path)
+
+def get_scenario_slug(scenario):
     match = re.match(r"^(S\d+(?:_\d+)?)(?:_.*)?", scenario)
-    scenario_slug = match.group(1) if match else scenario
-    output_dir = Path(f"./{output_dir}/scenarios/{scenario_slug}/{dir_path}")
-    save_json(dict, output_dir / f"{filename}.json", pretty=pretty)
+    return match.group(1) if match else scenario
+
+def scenario_output_path(scenario, dir_path, filename):
+    # Path of a scenario output relative to the output directory
+    return Path("scenarios") / get_scenario_slug(scenario) / dir_path / f"{filename}.json"
+
+def save_json_for_scenario(dict, output_dir, scenario, dir_path, filename, pretty=False):
+    save_json(dict, Path(f"./{output_dir}") / scenario_output_path(scenario, dir_path, filename), pretty=pretty)
 
 def save_slice_to_json(scenario, output_dir, variable_slug, time_index, slicer_slug, dict):
     save_json_for_scenario(dict, output_dir, scenario, f"{variable_slug}/time_{time_index}", slicer_slug)
@@ -1189,21 +2655,799 @@ def save_slice_to_json(scenario, output_dir, variable_slug, time_index, slicer_s
 
 
 
-if __name__ == "__main__":
+# Serve mode: keep imports and worker pool warm, watch the raw data folder and process new or changed scenarios
+
+def serve(input_directory: str, output_directory: str, max_workers: int = 2, poll_interval: float = 2.0, status_file: str = "serve_status.json", cache_directory: str = None, cache_max_gb: float = 20.0, store_directory: str = None):
+    print(f"Watching {input_directory} for NetCDF files (max {max_workers} concurrent jobs, status in {status_file})")
+
+    # Import the scientific stack once so that forked workers start warm
+    import_scientific_stack()
+
+    status = load_serve_status(status_file)
+    running = {}  # scenario_name -> future
+    seen_signatures = {}  # scenario_name -> signature seen at the previous poll, to wait for files still being copied
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            while True:
+                for scenario_name, future in list(running.items()):
+                    if future.done():
+                        del running[scenario_name]
+                        finish_serve_job(status[scenario_name], future)
+                        save_serve_status(status, status_file)
+
+                for scenario_name, signature in scan_input_directory(input_directory).items():
+                    is_stable = seen_signatures.get(scenario_name) == signature
+                    seen_signatures[scenario_name] = signature
+                    job = status.get(scenario_name, {})
+                    # Failed jobs are only retried once the file changes again
+                    is_up_to_date = job.get("signature") == signature and job.get("state") in ("done", "failed")
+                    if not is_stable or is_up_to_date or scenario_name in running:
+                        continue
+
+                    print(f"Queueing scenario: {scenario_name}")
+                    future = executor.submit(run_serve_job, scenario_name, input_directory, output_directory, cache_directory, cache_max_gb, store_directory)
+                    running[scenario_name] = future
+                    status[scenario_name] = {
+                        "state": "queued",
+                        "signature": signature,
+                        "queued_at": time.time(),
+                    }
+                    save_serve_status(status, status_file)
+
+                for scenario_name, future in running.items():
+                    if future.running() and status[scenario_name]["state"] == "queued":
+                        status[scenario_name]["state"] = "running"
+                        status[scenario_name]["started_at"] = time.time()
+                        save_serve_status(status, status_file)
+
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            print("Stopping, waiting for running jobs to finish...")
+
+def run_serve_job(scenario_name: str, input_directory: str, output_directory: str, cache_directory: str = None, cache_max_gb: float = 20.0, store_directory: str = None):
+    started_at = time.time()
+    process_netcdf(scenario_name, input_directory, output_directory, cache_directory, cache_max_gb, store_directory=store_directory)
+    return {"started_at": started_at, "finished_at": time.time()}
+
+def scan_input_directory(input_directory: str):
+    signatures = {}
+    for scenario_name in list_scenarios(input_directory):
+        signatures[scenario_name] = list(scenario_input_stat(scenario_name, input_directory))
+    return signatures
+
+def finish_serve_job(job: dict, future):
+    error = future.exception()
+    if error is None:
+        job.update(future.result())
+        job["state"] = "done"
+        job.pop("error", None)
+    else:
+        job["finished_at"] = time.time()
+        job["state"] = "failed"
+        job["error"] = repr(error)
+    job["duration_s"] = round(job["finished_at"] - job.get("started_at", job["queued_at"]), 3)
+    print(f"Scenario job {job['state']} in {job['duration_s']}s")
+
+def load_serve_status(status_file: str):
+    path = Path(status_file)
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        status = json.load(f)
+    # Jobs interrupted by a previous shutdown have to be picked up again
+    return {name: job for name, job in status.items() if job.get("state") in ("done", "failed")}
+
+def save_serve_status(status: dict, status_file: str):
+    save_json(status, status_file, pretty=True)
+
+
+# Work mode: shard the jobs of many scenarios across processes and machines sharing a queue directory
+
+def work(input_directory: str, output_directory: str, queue_directory: str, scenario_names: list[str] = None, lease_seconds: float = 900.0, max_attempts: int = 3, poll_interval: float = 10.0, worker_id: str = None, cache_directory: str = None, cache_max_gb: float = 20.0, store_directory: str = None):
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    configure_variable_cache(cache_directory, cache_max_gb)
+    configure_processing_store(store_directory)
+    queue_path = Path(queue_directory)
+    queue_path.mkdir(parents=True, exist_ok=True)
+    scenario_names = scenario_names or list_scenarios(input_directory)
+    units = plan_work_units(scenario_names, input_directory)
+    print(f"Worker {worker_id}: {len(units)} work units in {queue_directory}")
+
+    datasets = {}  # scenario_name -> (ds, points), kept open between units of the same scenario
+    try:
+        while True:
+            pending = 0
+            for unit in units:
+                state = claim_pending_work_unit(unit, queue_path, input_directory, worker_id, lease_seconds, max_attempts)
+                if state in ("done", "given_up"):
+                    continue
+                pending += 1
+                if state == "claimed":
+                    run_work_unit(unit, queue_path, input_directory, output_directory, worker_id, lease_seconds, datasets)
+
+            if pending == 0:
+                break
+            # The remaining units are leased by other workers, wait in case one of them dies
+            time.sleep(poll_interval)
+    finally:
+        for ds, _ in datasets.values():
+            release_dataset(ds)
+
+    finish_work(units, scenario_names, queue_path, output_directory, worker_id, lease_seconds)
+    print(f"Worker {worker_id}: no work left")
+
+def finish_work(units: list[dict], scenario_names: list[str], queue_path: Path, output_directory: str, worker_id: str, lease_seconds: float):
+    # The manifests and comparisons are written once all the units are done or given up, by a single worker: the
+    # first one to claim the finish unit. finish.done records the done files it saw, the workers that end later
+    # (or a new run with nothing left to do) find it up to date and do nothing.
+    signature = work_signature(units, queue_path)
+    done_path = queue_path / "finish.done"
+    if done_path.exists():
+        with open(done_path) as f:
+            if json.load(f)["signature"] == signature:
+                return
+    finish_unit = {"id": "finish"}
+    if not claim_work_unit(finish_unit, queue_path, worker_id, lease_seconds):
+        return
+    lease = WorkLease(queue_path / "finish.lease", worker_id, lease_seconds)
+    try:
+        with lease:
+            print(f"Worker {worker_id}: writing the manifests and comparisons")
+            for scenario_name in scenario_names:
+                write_scenario_manifest(scenario_name, output_directory)
+            export_scenario_comparisons(output_directory)
+            save_json({"worker": worker_id, "signature": signature}, done_path, pretty=True)
+    finally:
+        lease.release()
+
+def work_signature(units: list[dict], queue_path: Path):
+    # Changes whenever a unit is done again or given up
+    stats = []
+    for unit in units:
+        for suffix in ("done", "failed"):
+            path = queue_path / f"{unit['id']}.{suffix}"
+            if path.exists():
+                stats.append(f"{path.name}:{path.stat().st_mtime_ns}")
+    return hashlib.sha1("\n".join(stats).encode()).hexdigest()
+
+def plan_work_units(scenario_names: list[str], input_directory: str):
+    # One unit per (scenario, variable), the jobs without variable (maps, attributes, points list) form their own unit
+    units = {}
+    for scenario_name in scenario_names:
+        for job in plan_scenario(scenario_name, read_scenario_header(scenario_name, input_directory)):
+            unit_id = f"{scenario_name}--{job['variable'] or 'common'}".replace("$", "_")
+            unit = units.setdefault(unit_id, {"id": unit_id, "scenario": scenario_name, "jobs": [], "estimated_bytes": 0})
+            unit["jobs"].append(job)
+            unit["estimated_bytes"] += job["estimated_bytes"]
+
+    # Biggest units first so that a large one does not end up as the tail of the run
+    return sorted(units.values(), key=lambda unit: unit["estimated_bytes"], reverse=True)
+
+def get_work_unit_state(unit: dict, queue_path: Path, input_directory: str, lease_seconds: float, max_attempts: int):
+    done_path = queue_path / f"{unit['id']}.done"
+    if done_path.exists():
+        with open(done_path) as f:
+            # Outputs produced from an older input file or script do not count
+            if json.load(f)["stamp"] == processing_stamp(unit["scenario"], input_directory):
+                return "done"
+
+    failed_path = queue_path / f"{unit['id']}.failed"
+    if failed_path.exists():
+        with open(failed_path) as f:
+            if json.load(f)["attempts"] >= max_attempts:
+                return "given_up"
+
+    lease_path = queue_path / f"{unit['id']}.lease"
+    try:
+        if time.time() - lease_path.stat().st_mtime < lease_seconds:
+            return "leased"
+        return "expired"
+    except FileNotFoundError:
+        return "free"
+
+def claim_pending_work_unit(unit: dict, queue_path: Path, input_directory: str, worker_id: str, lease_seconds: float, max_attempts: int):
+    # State of the unit, "claimed" when this worker claimed it and has to run it
+    state = get_work_unit_state(unit, queue_path, input_directory, lease_seconds, max_attempts)
+    if state in ("done", "given_up", "leased") or not claim_work_unit(unit, queue_path, worker_id, lease_seconds):
+        return state
+    # Another worker may have run the unit and released its lease between the state check and the claim
+    state = get_work_unit_state(unit, queue_path, input_directory, lease_seconds, max_attempts)
+    if state in ("done", "given_up"):
+        WorkLease(queue_path / f"{unit['id']}.lease", worker_id, lease_seconds).release()
+        return state
+    return "claimed"
+
+def claim_work_unit(unit: dict, queue_path: Path, worker_id: str, lease_seconds: float):
+    lease_path = queue_path / f"{unit['id']}.lease"
+    try:
+        if time.time() - lease_path.stat().st_mtime >= lease_seconds:
+            # Only one worker can rename the expired lease away, the others get FileNotFoundError
+            os.rename(lease_path, queue_path / f"{unit['id']}.lease.expired-{worker_id}")
+            os.remove(queue_path / f"{unit['id']}.lease.expired-{worker_id}")
+            print(f"Worker {worker_id}: lease of {unit['id']} expired, retrying it")
+    except FileNotFoundError:
+        pass
+
+    try:
+        fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        json.dump({"worker": worker_id, "claimed_at": time.time()}, f)
+    return True
+
+class LeaseLostError(Exception):
+    pass
+
+class WorkLease:
+    # The lease file of a unit claimed by this worker. While the unit runs, it is renewed in the background every
+    # third of lease_seconds, so a single long job does not let it expire. A lease that expired anyway (a paused
+    # machine) and was taken over by another worker names that worker: this one then stops renewing it, its jobs
+    # stop at the next check and it does not remove the lease of the other worker.
+    def __init__(self, path: Path, worker_id: str, lease_seconds: float):
+        self.path = path
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+        self.heartbeat = threading.Thread(target=self.renew_until_stopped, daemon=True)
+
+    def __enter__(self):
+        self.heartbeat.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.heartbeat.join()
+
+    def is_owned(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)["worker"] == self.worker_id
+        except (FileNotFoundError, ValueError):  # removed, or being written by the worker taking it over
+            return False
+
+    def renew(self):
+        if not self.is_owned():
+            return False
+        os.utime(self.path)
+        return True
+
+    def renew_until_stopped(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            if not self.renew():
+                print(f"Worker {self.worker_id}: lost the lease {self.path.name}")
+                return
+
+    def check(self):
+        if not self.is_owned():
+            raise LeaseLostError(f"{self.path.name} was taken over by another worker")
+
+    def release(self):
+        # The lease is renewed until this point, so no other worker can have taken it over meanwhile
+        if self.is_owned():
+            self.path.unlink(missing_ok=True)
+
+def run_work_unit(unit: dict, queue_path: Path, input_directory: str, output_directory: str, worker_id: str, lease_seconds: float, datasets: dict):
+    scenario_name = unit["scenario"]
+    lease = WorkLease(queue_path / f"{unit['id']}.lease", worker_id, lease_seconds)
+    print(f"Worker {worker_id}: running {unit['id']} ({len(unit['jobs'])} jobs)")
+    started_at = time.time()
+    try:
+        with lease:
+            if scenario_name not in datasets:
+                ds = open_scenario_dataset(scenario_name, input_directory)
+                datasets[scenario_name] = (ds, get_time_series_points_list(scenario_name, get_variable_names()))
+            ds, points = datasets[scenario_name]
+            run_jobs(unit["jobs"], ds, points, input_directory, output_directory, lease=lease)
+            lease.check()
+    except LeaseLostError as error:
+        # The worker that took the unit over records its outcome
+        print(f"Worker {worker_id}: stopped {unit['id']} ({error})")
+    except Exception as error:
+        failed_path = queue_path / f"{unit['id']}.failed"
+        attempts = 1
+        if failed_path.exists():
+            with open(failed_path) as f:
+                attempts += json.load(f)["attempts"]
+        save_json({"attempts": attempts, "worker": worker_id, "error": repr(error)}, failed_path, pretty=True)
+        print(f"Worker {worker_id}: {unit['id']} failed ({error!r}), attempt {attempts}")
+    else:
+        save_json({
+            "worker": worker_id,
+            "stamp": processing_stamp(scenario_name, input_directory),
+            "duration_s": round(time.time() - started_at, 3),
+        }, queue_path / f"{unit['id']}.done", pretty=True)
+    finally:
+        lease.release()
+
+def run_local_workers(worker_count: int, **work_kwargs):
+    # Several workers on one machine, each one behaves exactly as a worker started on another host
+    with ProcessPoolExecutor(max_workers=worker_count) as executor:
+        futures = [executor.submit(work, **work_kwargs) for _ in range(worker_count)]
+        for future in futures:
+            future.result()
+
+
+# Query mode: a local HTTP server answering plane, series and depth queries on demand, for any cell and time step,
+# from the scenario files (or their processing store) opened read-only. Responses have the shape of the exported
+# files, so the frontend stores can read them unchanged:
+#   /scenarios/<slug>                                            times, variables, grid coordinates and plane slugs
+#   /scenarios/<slug>/<variable>/plane?time=<index>&plane=<slug>  like <variable>/time_<t>/<plane>.json, or with
+#                                                                 z=<m> (horizontal) or x=<m> (vertical) instead of plane
+#   /scenarios/<slug>/masks/<hash>.json                           masks of the planes served so far
+#   /scenarios/<slug>/<variable>/timeSeries?x=&y=&z=              like <variable>/timeSeries/<point>.json
+#   /scenarios/<slug>/pointSeries?x=&y=&z=[&variable=...]         like pointSeries/<point>.json
+#   /scenarios/<slug>/<variable>/depthSeries?x=&y=                also depthTemporalVariations and verticalProfiles
+
+max_query_masks = 1024  # masks of the planes served so far kept for /masks/<hash>.json, least recently used dropped
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, input_directory: str):
+        super().__init__(address, QueryRequestHandler)
+        self.input_directory = input_directory
+        self.scenarios = {get_scenario_slug(scenario_name): scenario_name for scenario_name in list_scenarios(input_directory)}
+        self.opened = {}  # scenario slug -> Scenario
+        self.opening_locks = {}  # scenario slug -> lock held while the scenario is opened
+        self.masks = OrderedDict()  # mask hash -> mask
+        self.lock = threading.Lock()  # only guards the dictionaries above, never held while reading data
+
+    def scenario(self, scenario_slug: str):
+        with self.lock:
+            if scenario_slug in self.opened:
+                return self.opened[scenario_slug]
+            scenario_name = self.scenarios[scenario_slug]
+            opening_lock = self.opening_locks.setdefault(scenario_slug, threading.Lock())
+
+        # Opening a scenario can take seconds, requests to the scenarios already opened are answered meanwhile and
+        # concurrent requests to this one wait for it instead of opening it again
+        with opening_lock:
+            with self.lock:
+                if scenario_slug in self.opened:
+                    return self.opened[scenario_slug]
+            scenario = Scenario(scenario_name, self.input_directory)
+            with self.lock:
+                self.opened[scenario_slug] = scenario
+            return scenario
+
+    def add_mask(self, mask_hash: str, mask: dict):
+        with self.lock:
+            self.masks[mask_hash] = mask
+            self.masks.move_to_end(mask_hash)
+            while len(self.masks) > max_query_masks:
+                self.masks.popitem(last=False)
+
+    def mask(self, mask_hash: str):
+        with self.lock:
+            self.masks.move_to_end(mask_hash)
+            return self.masks[mask_hash]
+
+class QueryRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = [unquote(part) for part in url.path.strip("/").split("/")]
+        try:
+            status, body = 200, answer_query(self.server, path, parse_qs(url.query))
+        except LookupError as error:
+            status, body = 404, {"error": f"Not found: {error}"}
+        except ValueError as error:
+            status, body = 400, {"error": str(error)}
+        except Exception as error:
+            # Any other failure is still answered with a JSON body, the traceback goes to the server log
+            traceback.print_exc()
+            status, body = 500, {"error": f"{type(error).__name__}: {error}"}
+
+        content = json.dumps(body, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(content)
+
+def answer_query(server: QueryServer, path: list[str], params: dict):
+    if path == ["scenarios"]:
+        return server.scenarios
+    if len(path) < 2 or path[0] != "scenarios":
+        raise KeyError("/".join(path))
+
+    scenario = server.scenario(path[1])
+    ds = scenario.ds
+    if len(path) == 2:
+        return scenario_query_info(scenario.name, ds)
+    if len(path) == 4 and path[2] == "masks":
+        return server.mask(Path(path[3]).stem)
+    if path[2:] == ["pointSeries"]:
+        return point_series_query(scenario, query_coords(params), params.get("variable"))
+    if len(path) != 4:
+        raise KeyError("/".join(path))
+
+    variable_name, product = path[2:]
+    if variable_name not in get_queryable_variable_names(ds):
+        raise KeyError(variable_name)
+    if product == "plane":
+        mask_hash, mask, record = masked_plane(plane_query_grid(scenario, variable_name, params))
+        server.add_mask(mask_hash, mask)
+        return record
+    if product == "timeSeries":
+        return time_series_record(ds, variable_name, query_coords(params))
+    if product in ["depthSeries", "depthTemporalVariations"]:
+        coords = query_coords(params, with_z=False)
+        point_block, true_coords, times, depths = scenario.depth(variable_name, coords)
+        record_function = depth_series_record if product == "depthSeries" else depth_temporal_variations_record
+        return record_function(point_block, coords, true_coords, times, depths)
+    if product == "verticalProfiles":
+        coords = query_coords(params, with_z=False)
+        block, true_coords, times, heights = get_column_block_for_var_and_points(ds, variable_name, [coords], "GridsK")
+        return vertical_profile_record(block[0], coords, true_coords[0], times, heights)
+    raise KeyError(product)
+
+def get_queryable_variable_names(ds):
+    # The façade variables are stored per orientation, as X/Y/Z<name>
+    return [
+        variable_name for variable_name in get_variable_names()
+        if variable_name in ds.data_vars or (variable_name in building_data_variables and any(variable_name.replace("$", orientation) in ds.data_vars for orientation in facade_orientations))
+    ]
+
+def scenario_query_info(scenario: str, ds):
+    return to_json_compatible({
+        "scenario": scenario,
+        "times": point_series_times(ds),
+        "variables": get_queryable_variable_names(ds),
+        "grid": {"x": ds["GridsI"].values, "y": ds["GridsJ"].values, "z": ds["GridsK"].values, "depths": ds["SoilLevels"].values},
+        "planes": [slicer["slug"] for slicer in get_plane_slicers_for_scenario(scenario) + get_underground_plane_slicers_for_scenario(scenario)],
+    })
+
+def query_coords(params: dict, with_z: bool = True):
+    try:
+        return [float(params[name][-1]) for name in (["x", "y", "z"] if with_z else ["x", "y"])] + ([] if with_z else [0.0])
+    except KeyError as error:
+        raise ValueError(f"Missing parameter {error}")
+
+def plane_query_grid(scenario: Scenario, variable_name: str, params: dict):
+    time_index = int(params.get("time", ["0"])[-1])
+    if not 0 <= time_index < scenario.ds.sizes["Time"]:
+        raise IndexError(f"time {time_index}")
+
+    if "plane" in params:
+        grid = scenario.plane(variable_name, params["plane"][-1], time_index)
+    elif "z" in params or "x" in params:
+        axis = "z" if "z" in params else "x"
+        grid = scenario.plane(variable_name, {axis: float(params[axis][-1])}, time_index)
+    else:
+        raise ValueError("Missing parameter plane, z or x")
+    if grid.size == 0:
+        raise KeyError("no grid coordinate at the requested plane")
+    return grid
+
+def point_series_query(scenario: Scenario, coords: list[float], variable_names: list[str] = None):
+    # By default the variables that make sense at the height of the point, as for the exported points
+    if variable_names is None:
+        variable_names = underground_level_variables if coords[2] < 0 else [
+            variable_name for variable_name in get_variable_names()
+            if variable_name not in underground_level_variables and variable_name not in building_data_variables
+        ]
+    queryable_variable_names = get_queryable_variable_names(scenario.ds)
+    record = {"requested_coords": {"x": coords[0], "y": coords[1], "z": coords[2]}, "times": point_series_times(scenario.ds), "variables": {}}
+    for variable_name in variable_names:
+        if variable_name not in queryable_variable_names:
+            continue
+        values, true_coords = scenario.series(variable_name, coords)
+        record["variables"][variable_name] = {"true_coords": true_coords, "v": to_json_compatible(values.tolist())}
+    return record
+
+def query(input_directory: str, host: str = "127.0.0.1", port: int = 8765, store_directory: str = None, cache_max_gb: float = 4.0):
+    configure_processing_store(store_directory)
+    configure_memory_variable_cache(cache_max_gb)
+    server = QueryServer((host, port), input_directory)
+    print(f"Answering queries for {len(server.scenarios)} scenarios on http://{host}:{port}/scenarios")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping")
+    finally:
+        server.server_close()
+
+
+def main(argv: list[str]):
+    if argv and argv[0] == "serve":
+        return serve_main(argv[1:])
+    if argv and argv[0] == "plan":
+        return plan_main(argv[1:])
+    if argv and argv[0] == "work":
+        return work_main(argv[1:])
+    if argv and argv[0] == "manifest":
+        return manifest_main(argv[1:])
+    if argv and argv[0] == "compare":
+        return compare_main(argv[1:])
+    if argv and argv[0] == "publish":
+        return publish_main(argv[1:])
+    if argv and argv[0] == "query":
+        return query_main(argv[1:])
+
     parser = argparse.ArgumentParser(
-        description="Process a NetCDF file into JSON output maps."
+        description="Process a NetCDF file into JSON output maps. See also `%(prog)s plan --help`, `%(prog)s work --help`, `%(prog)s manifest --help`, `%(prog)s compare --help`, `%(prog)s publish --help`, `%(prog)s query --help` and `%(prog)s serve --help`."
     )
     parser.add_argument(
-        "scenario_name", type=str, help="The name of the scenario (without .nc)"
+        "scenario_name", type=str, nargs="?", help="The name of the scenario (without .nc, or the name of its directory of .nc parts)"
     )
     parser.add_argument(
-        "input_directory", type=str, help="Path to the directory containing the .nc file"
+        "input_directory", type=str, nargs="?", help="Path to the directory containing the .nc file (or the directory of its parts)"
     )
     parser.add_argument(
+        "output_directory",
+        type=str,
+        nargs="?",
+        help="Path to the directory where the processed JSON files will be saved",
+    )
+    parser.add_argument(
+        "--list-scenarios", type=str, metavar="INPUT_DIRECTORY", help="List the scenarios found in INPUT_DIRECTORY and exit"
+    )
+    parser.add_argument(
+        "--skip-unchanged", action="store_true", help="Do nothing if the scenario was already processed from the same input file and script"
+    )
+    parser.add_argument(
+        "--cache-dir", type=str, help="Directory of the intermediate cache of decoded variables, shared between stages and worker processes (disabled by default)"
+    )
+    parser.add_argument(
+        "--cache-max-gb", type=float, default=20.0, help="Size above which the least recently used cached variables are evicted"
+    )
+    parser.add_argument(
+        "--store-dir", type=str, help="Directory where each scenario is converted once into float32 NetCDF chunked per time step, and read from afterwards (disabled by default)"
+    )
+    parser.add_argument(
+        "--baseline", type=str, help="Store the planes as their differences with the planes of this scenario, processed beforehand into the same output directory"
+    )
+    parser.add_argument(
+        "--baseline-epsilon", type=float, default=0.01, help="With --baseline, cells that differ from the baseline by at most this much take the baseline value"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only print the jobs, output files and estimated sizes that processing would produce"
+    )
+    parser.add_argument(
+        "--plan-output", type=str, help="With --dry-run, also write the full job plan as JSON to this path"
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.list_scenarios is not None:
+        for scenario_name in list_scenarios(args.list_scenarios):
+            print(scenario_name)
+        return
+
+    if args.output_directory is None:
+        parser.error("scenario_name, input_directory and output_directory are required")
+
+    if args.dry_run:
+        configure_baseline(args.baseline, args.baseline_epsilon)
+        plan_scenarios([args.scenario_name], args.input_directory, args.output_directory, args.plan_output)
+        if args.skip_unchanged and is_scenario_up_to_date(args.scenario_name, args.input_directory, args.output_directory, args.baseline):
+            print(f"Scenario {args.scenario_name} is up to date, it would be skipped")
+        return
+
+    if args.skip_unchanged and is_scenario_up_to_date(args.scenario_name, args.input_directory, args.output_directory, args.baseline):
+        print(f"Skipping scenario {args.scenario_name}, already up to date")
+        return
+
+    process_netcdf(args.scenario_name, args.input_directory, args.output_directory, args.cache_dir, args.cache_max_gb, args.store_dir, args.baseline, args.baseline_epsilon)
+
+def plan_main(argv: list[str]):
+    plan_parser = argparse.ArgumentParser(
+        prog=f"{Path(sys.argv[0]).name} plan",
+        description="Print every job and output file that processing the scenarios would produce, without reading variable data."
+    )
+    plan_parser.add_argument(
+        "input_directory", type=str, help="Path to the directory containing the .nc files (or directories of .nc parts)"
+    )
+    plan_parser.add_argument(
+        "output_directory",
+        type=str,
+        help="Path to the directory where the processed JSON files would be saved",
+    )
+    plan_parser.add_argument(
+        "--scenario", type=str, action="append", dest="scenario_names", help="Only plan this scenario, can be repeated (default: all scenarios of the input directory)"
+    )
+    plan_parser.add_argument(
+        "--plan-output", type=str, help="Also write the full job plan as JSON to this path"
+    )
+
+    plan_args = plan_parser.parse_args(argv)
+    scenario_names = plan_args.scenario_names or list_scenarios(plan_args.input_directory)
+    plan_scenarios(scenario_names, plan_args.input_directory, plan_args.output_directory, plan_args.plan_output)
+
+def work_main(argv: list[str]):
+    work_parser = argparse.ArgumentParser(
+        prog=f"{Path(sys.argv[0]).name} work",
+        description="Process (scenario, variable) work units claimed from a queue directory shared by any number of workers, on any number of machines."
+    )
+    work_parser.add_argument(
+        "input_directory", type=str, help="Path to the directory containing the .nc files (or directories of .nc parts)"
+    )
+    work_parser.add_argument(
         "output_directory",
         type=str,
         help="Path to the directory where the processed JSON files will be saved",
     )
+    work_parser.add_argument(
+        "queue_directory", type=str, help="Shared directory holding the lease and done files of the work units"
+    )
+    work_parser.add_argument(
+        "--scenario", type=str, action="append", dest="scenario_names", help="Only process this scenario, can be repeated (default: all scenarios of the input directory)"
+    )
+    work_parser.add_argument(
+        "--workers", type=int, default=1, help="Number of worker processes to start on this machine"
+    )
+    work_parser.add_argument(
+        "--lease-seconds", type=float, default=900.0, help="A unit whose lease was not renewed for this long is considered abandoned and retried"
+    )
+    work_parser.add_argument(
+        "--max-attempts", type=int, default=3, help="Number of failed attempts after which a unit is given up"
+    )
+    work_parser.add_argument(
+        "--cache-dir", type=str, help="Directory of the intermediate cache of decoded variables, shared between stages and worker processes (disabled by default)"
+    )
+    work_parser.add_argument(
+        "--cache-max-gb", type=float, default=20.0, help="Size above which the least recently used cached variables are evicted"
+    )
+    work_parser.add_argument(
+        "--store-dir", type=str, help="Directory where each scenario is converted once into float32 NetCDF chunked per time step, and read from afterwards (disabled by default)"
+    )
+    work_parser.add_argument(
+        "--poll-interval", type=float, default=10.0, help="Seconds to wait before checking again for abandoned units"
+    )
+
+    work_args = work_parser.parse_args(argv)
+    work_kwargs = {
+        "input_directory": work_args.input_directory,
+        "output_directory": work_args.output_directory,
+        "queue_directory": work_args.queue_directory,
+        "scenario_names": work_args.scenario_names,
+        "lease_seconds": work_args.lease_seconds,
+        "max_attempts": work_args.max_attempts,
+        "poll_interval": work_args.poll_interval,
+        "cache_directory": work_args.cache_dir,
+        "cache_max_gb": work_args.cache_max_gb,
+        "store_directory": work_args.store_dir,
+    }
+    if work_args.workers > 1:
+        run_local_workers(work_args.workers, **work_kwargs)
+    else:
+        work(**work_kwargs)
+
+def manifest_main(argv: list[str]):
+    manifest_parser = argparse.ArgumentParser(
+        prog=f"{Path(sys.argv[0]).name} manifest",
+        description="Write, or check, the manifest listing the content hash and size of every output file of each processed scenario, and deduplicate identical files through the blob store."
+    )
+    manifest_parser.add_argument(
+        "output_directory", type=str, help="Path to the directory containing the processed JSON files"
+    )
+    manifest_parser.add_argument(
+        "--scenario", type=str, action="append", dest="scenario_names", help="Only this scenario, can be repeated (default: every scenario of the output directory)"
+    )
+    manifest_parser.add_argument(
+        "--check", action="store_true", help="Do not write anything, exit with an error if a manifest is missing or out of date"
+    )
+
+    manifest_args = manifest_parser.parse_args(argv)
+    scenarios_path = Path(manifest_args.output_directory) / "scenarios"
+    scenario_names = manifest_args.scenario_names or sorted(path.name for path in scenarios_path.iterdir() if path.is_dir())
+
+    stale_count = 0
+    for scenario_name in scenario_names:
+        if not manifest_args.check:
+            manifest = write_scenario_manifest(scenario_name, manifest_args.output_directory)
+            print(f"{get_scenario_slug(scenario_name)}: {len(manifest['files'])} files")
+        elif not (scenarios_path / get_scenario_slug(scenario_name) / "manifest.json").exists():
+            print(f"{get_scenario_slug(scenario_name)}: no manifest")
+            stale_count += 1
+        else:
+            for name in check_scenario_manifest(scenario_name, manifest_args.output_directory):
+                print(f"{get_scenario_slug(scenario_name)}: {name} is out of date")
+                stale_count += 1
+    if not manifest_args.check:
+        print(f"Removed {remove_unreferenced_blobs(manifest_args.output_directory)} unreferenced blobs")
+    if stale_count:
+        sys.exit(1)
+
+def publish_main(argv: list[str]):
+    publish_parser = argparse.ArgumentParser(
+        prog=f"{Path(sys.argv[0]).name} publish",
+        description="Copy the processed output to the directory served to the frontend, with the blob store and the manifests instead of the JSON files of the scenarios."
+    )
+    publish_parser.add_argument(
+        "output_directory", type=str, help="Path to the directory containing the processed JSON files"
+    )
+    publish_parser.add_argument(
+        "publish_directory", type=str, help="Directory served as /simulation, files of a previous publication that are not published anymore are removed from it"
+    )
+
+    publish_args = publish_parser.parse_args(argv)
+    copied_count, removed_count = publish(publish_args.output_directory, publish_args.publish_directory)
+    print(f"Published {publish_args.output_directory} to {publish_args.publish_directory}: {copied_count} files copied, {removed_count} removed")
 
-    args = parser.parse_args()
-    process_netcdf(args.scenario_name, args.input_directory, args.output_directory)
\ No newline at end of file
+def compare_main(argv: list[str]):
+    compare_parser = argparse.ArgumentParser(
+        prog=f"{Path(sys.argv[0]).name} compare",
+        description="Merge the series of every processed scenario into one file per (variable, point), to run once all the scenarios are processed."
+    )
+    compare_parser.add_argument(
+        "output_directory", type=str, help="Path to the directory containing the processed JSON files"
+    )
+
+    compare_args = compare_parser.parse_args(argv)
+    export_scenario_comparisons(compare_args.output_directory)
+
+def query_main(argv: list[str]):
+    query_parser = argparse.ArgumentParser(
+        prog=f"{Path(sys.argv[0]).name} query",
+        description="Answer plane, series and depth queries over HTTP for any cell and time step, with the shapes of the exported files."
+    )
+    query_parser.add_argument(
+        "input_directory", type=str, help="Path to the directory containing the .nc files (or directories of .nc parts)"
+    )
+    query_parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help="Address to listen on"
+    )
+    query_parser.add_argument(
+        "--port", type=int, default=8765, help="Port to listen on"
+    )
+    query_parser.add_argument(
+        "--store-dir", type=str, help="Directory where each scenario is converted once into float32 NetCDF chunked per time step, and read from afterwards (disabled by default)"
+    )
+    query_parser.add_argument(
+        "--cache-max-gb", type=float, default=4.0, help="Memory kept for the most recently queried variables"
+    )
+
+    query_args = query_parser.parse_args(argv)
+    query(query_args.input_directory, host=query_args.host, port=query_args.port, store_directory=query_args.store_dir, cache_max_gb=query_args.cache_max_gb)
+
+def plan_scenarios(scenario_names: list[str], input_directory: str, output_directory: str, plan_output: str = None):
+    jobs = []
+    for scenario_name in scenario_names:
+        jobs += plan_scenario(scenario_name, read_scenario_header(scenario_name, input_directory))
+
+    print_plan(jobs, input_directory, output_directory)
+    if plan_output is not None:
+        save_json(jobs, plan_output, pretty=True)
+
+def serve_main(argv: list[str]):
+    serve_parser = argparse.ArgumentParser(
+        prog=f"{Path(sys.argv[0]).name} serve",
+        description="Watch a directory for NetCDF files and process new or changed scenarios as they appear."
+    )
+    serve_parser.add_argument(
+        "input_directory", type=str, help="Path to the directory containing the .nc files (or directories of .nc parts)"
+    )
+    serve_parser.add_argument(
+        "output_directory",
+        type=str,
+        help="Path to the directory where the processed JSON files will be saved",
+    )
+    serve_parser.add_argument(
+        "--max-workers", type=int, default=2, help="Maximum number of scenarios processed concurrently"
+    )
+    serve_parser.add_argument(
+        "--poll-interval", type=float, default=2.0, help="Seconds between two scans of the input directory"
+    )
+    serve_parser.add_argument(
+        "--cache-dir", type=str, help="Directory of the intermediate cache of decoded variables, shared between stages and worker processes (disabled by default)"
+    )
+    serve_parser.add_argument(
+        "--cache-max-gb", type=float, default=20.0, help="Size above which the least recently used cached variables are evicted"
+    )
+    serve_parser.add_argument(
+        "--store-dir", type=str, help="Directory where each scenario is converted once into float32 NetCDF chunked per time step, and read from afterwards (disabled by default)"
+    )
+    serve_parser.add_argument(
+        "--status-file", type=str, default="serve_status.json", help="Path of the JSON file where job status and timings are written"
+    )
+
+    serve_args = serve_parser.parse_args(argv)
+    serve(serve_args.input_directory, serve_args.output_directory, max_workers=serve_args.max_workers, poll_interval=serve_args.poll_interval, status_file=serve_args.status_file, cache_directory=serve_args.cache_dir, cache_max_gb=serve_args.cache_max_gb, store_directory=serve_args.store_dir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,78 @@
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import process_netcdf  # noqa: E402
+
+plane_path = "T/time_12/horizontal_human_height.json"
+
+
+class BaselineDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.output_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.output_directory.cleanup)
+        self.addCleanup(process_netcdf.configure_baseline, None)
+        process_netcdf.configure_baseline("S0_Baseline", epsilon=0.01)
+
+        rng = np.random.default_rng(0)
+        self.baseline = rng.normal(25, 2, (20, 30)).astype(np.float32)
+        self.baseline[5:8, 10:15] = np.nan  # a building
+        self.write_plane("S0", process_netcdf.masked_plane_record("S0", self.baseline, self.output_directory.name))
+
+    def write_plane(self, scenario_slug: str, record: dict):
+        process_netcdf.save_json(record, Path(self.output_directory.name) / "scenarios" / scenario_slug / plane_path)
+
+    def read_plane(self, scenario_slug: str):
+        return process_netcdf.read_plane(self.output_directory.name, scenario_slug, plane_path)
+
+    def test_delta_round_trip(self):
+        variant = self.baseline.copy()
+        variant[0, 0] += 1.5  # changed cell
+        variant[1, 1] += 0.001  # within epsilon, read back as the baseline value
+        variant[2, 2] = np.nan  # cell that became null
+        variant[6, 11] = 30.0  # null cell that became valid
+
+        record = process_netcdf.delta_plane_record(variant, self.output_directory.name, plane_path)
+        self.assertEqual(record["baseline"]["scenario"], "S0")
+        self.assertEqual(record["shape"], [20, 30])
+        self.assertEqual(record["cells"], [0, 2 * 30 + 2, 6 * 30 + 11])
+        self.write_plane("S4_2", record)
+
+        expected = variant.copy()
+        expected[1, 1] = self.baseline[1, 1]
+        np.testing.assert_allclose(self.read_plane("S4_2"), expected, rtol=0, atol=1e-6)
+
+    def test_large_changes_are_stored_in_full(self):
+        self.assertIsNone(process_netcdf.delta_plane_record(self.baseline + 1.0, self.output_directory.name, plane_path))
+
+    def test_changed_baseline_is_rejected(self):
+        variant = self.baseline.copy()
+        variant[0, 0] += 1.5
+        self.write_plane("S4_2", process_netcdf.delta_plane_record(variant, self.output_directory.name, plane_path))
+
+        self.baseline[0, 1] += 1.0  # the baseline is processed again
+        self.write_plane("S0", process_netcdf.masked_plane_record("S0", self.baseline, self.output_directory.name))
+        with self.assertRaisesRegex(ValueError, "another version"):
+            self.read_plane("S4_2")
+
+    def test_shape_mismatch_is_rejected(self):
+        variant = self.baseline.copy()
+        variant[0, 0] += 1.5
+        record = process_netcdf.delta_plane_record(variant, self.output_directory.name, plane_path)
+        record["shape"] = [30, 20]
+        self.write_plane("S4_2", record)
+        with self.assertRaisesRegex(ValueError, "shape"):
+            self.read_plane("S4_2")
+
+    def test_missing_baseline_plane_is_stored_in_full(self):
+        record = process_netcdf.delta_plane_record(self.baseline, self.output_directory.name, "T/time_0/horizontal_ground.json")
+        self.assertIsNone(record)
+
+
+if __name__ == "__main__":
+    unittest.main()
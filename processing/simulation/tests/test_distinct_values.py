@@ -0,0 +1,72 @@
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from investigate_netdcf import DistinctValues, iter_blocks  # noqa: E402
+
+
+class DistinctValuesTest(unittest.TestCase):
+    def test_exact_below_k(self):
+        distinct = DistinctValues(k=1024)
+        values = np.arange(300, dtype=np.float32) / 10
+        for block in np.array_split(np.concatenate([values, values[::-1], values[:50]]), 7):
+            distinct.add(block)
+        self.assertTrue(distinct.is_exact())
+        self.assertEqual(distinct.count(), 300)
+
+    def test_exact_at_k(self):
+        distinct = DistinctValues(k=64)
+        distinct.add(np.arange(64, dtype=np.int32))
+        distinct.add(np.arange(64, dtype=np.int32))
+        self.assertTrue(distinct.is_exact())
+        self.assertEqual(distinct.count(), 64)
+
+        distinct.add(np.array([64], dtype=np.int32))
+        self.assertFalse(distinct.is_exact())
+
+    def test_negative_zero_counts_once(self):
+        distinct = DistinctValues(k=16)
+        distinct.add(np.array([0.0, -0.0, 1.0, -1.0], dtype=np.float32))
+        self.assertEqual(distinct.count(), 3)
+
+    def test_estimated_above_k(self):
+        rng = np.random.default_rng(0)
+        values = rng.permutation(100_000).astype(np.float64) * 0.25
+        distinct = DistinctValues(k=1024)
+        for block in np.array_split(np.concatenate([values, values[:20_000]]), 40):
+            distinct.add(block)
+        self.assertFalse(distinct.is_exact())
+        # Relative error around 1 / sqrt(k), about 3 %
+        self.assertAlmostEqual(distinct.count() / 100_000, 1, delta=0.1)
+
+
+class IterBlocksTest(unittest.TestCase):
+    def setUp(self):
+        values = np.arange(4 * 300 * 300, dtype=np.float32).reshape(4, 300, 300)
+        self.variable = xr.DataArray(values, dims=("Time", "GridsJ", "GridsI"))
+
+    def assert_blocks(self, block_mb: float, max_values: int):
+        blocks = list(iter_blocks(self.variable, block_mb))
+        self.assertTrue(all(block.size <= max_values for block in blocks))
+        np.testing.assert_array_equal(np.concatenate([block.ravel() for block in blocks]), self.variable.values.ravel())
+        return blocks
+
+    def test_whole_rows(self):
+        blocks = self.assert_blocks(block_mb=0.7, max_values=2 * 300 * 300)
+        self.assertEqual(len(blocks), 2)
+
+    def test_rows_larger_than_a_block_are_split(self):
+        # A time step holds 90 000 values, the blocks 26 214
+        blocks = self.assert_blocks(block_mb=0.1, max_values=26214)
+        self.assertEqual(len(blocks), 4 * 4)
+        self.assertEqual(blocks[0].shape, (87, 300))
+
+        self.assert_blocks(block_mb=0.0001, max_values=300)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import process_netcdf  # noqa: E402
+
+
+def facade_index_on_grid(grid):
+    # Only the grid is needed to search nearest cells
+    facade_index = process_netcdf.FacadeIndex.__new__(process_netcdf.FacadeIndex)
+    facade_index.grid = grid
+    return facade_index
+
+
+class FacadeIndexNearestTest(unittest.TestCase):
+    def assert_nearest(self, facade_index, cells, candidates, **kwargs):
+        distances = ((facade_index.positions(cells)[:, None, :] - facade_index.positions(candidates)[None, :, :]) ** 2).sum(axis=2)
+        np.testing.assert_array_equal(facade_index.nearest(cells, candidates, **kwargs), distances.argmin(axis=1))
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        shape = (12, 40, 30)
+        # Telescoping vertical axis, as in ENVI-met grids
+        grid = [np.cumsum(rng.uniform(0.5, 3, shape[0])), np.arange(shape[1]) * 2.0, np.arange(shape[2]) * 2.0]
+        facade_index = facade_index_on_grid(grid)
+        cells = np.stack([rng.integers(0, n, 2000) for n in shape], axis=1)
+        candidates = np.stack([rng.integers(0, n, 50) for n in shape], axis=1)
+        self.assert_nearest(facade_index, cells, candidates, block_size=4)
+        # Pairs processed a few at a time give the same result
+        self.assert_nearest(facade_index, cells, candidates, block_size=4, max_pairs=64)
+
+    def test_ties_go_to_the_lowest_index(self):
+        facade_index = facade_index_on_grid([np.arange(n) * 1.0 for n in (4, 20, 20)])
+        cells = np.array([[0, 10, 10]])
+        candidates = np.array([[0, 10, 18], [0, 10, 2], [0, 2, 10], [0, 18, 10]])
+        np.testing.assert_array_equal(facade_index.nearest(cells, candidates, block_size=2), [0])
+
+    def test_no_candidates(self):
+        facade_index = facade_index_on_grid([np.arange(n) * 1.0 for n in (4, 20, 20)])
+        cells = np.array([[0, 10, 10], [3, 0, 0]])
+        np.testing.assert_array_equal(facade_index.nearest(cells, np.empty((0, 3), dtype=np.int64)), [-1, -1])
+
+
+if __name__ == "__main__":
+    unittest.main()
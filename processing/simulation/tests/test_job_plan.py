@@ -0,0 +1,123 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import process_netcdf  # noqa: E402
+
+scenario_name = "S1_1_Test"
+
+
+def scenario_header():
+    # Header of a small scenario with every processed variable, as read_scenario_header returns it
+    sizes = {"Time": 25, "GridsK": 8, "GridsJ": 70, "GridsI": 70, "SoilLevels": 5}
+    variable_dims = {}
+    for variable_name in process_netcdf.get_variable_names():
+        if variable_name in process_netcdf.building_data_variables:
+            for orientation in process_netcdf.facade_orientations:
+                variable_dims[variable_name.replace("$", orientation)] = ("Time", "GridsK", "GridsJ", "GridsI")
+        elif variable_name in process_netcdf.underground_level_variables:
+            variable_dims[variable_name] = ("Time", "SoilLevels", "GridsJ", "GridsI")
+        elif variable_name in process_netcdf.surface_level_variables:
+            variable_dims[variable_name] = ("Time", "GridsJ", "GridsI")
+        else:
+            variable_dims[variable_name] = ("Time", "GridsK", "GridsJ", "GridsI")
+    return process_netcdf.DatasetHeader(sizes, variable_dims)
+
+
+class JobPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.jobs = process_netcdf.plan_scenario(scenario_name, scenario_header())
+
+    def test_plan(self):
+        self.assertEqual(self.jobs, process_netcdf.plan_scenario(scenario_name, scenario_header()))
+        self.assertEqual(len({job["id"] for job in self.jobs}), len(self.jobs))
+        outputs = [output for job in self.jobs for output in job["outputs"]]
+        self.assertEqual(len(set(outputs)), len(outputs))  # every output is written by a single job
+
+        plane_jobs = [job for job in self.jobs if job["stage"] == "planes"]
+        plane_variables = {job["variable"] for job in plane_jobs}
+        self.assertEqual(len(plane_jobs), len(plane_variables) * len(process_netcdf.plane_time_indices))
+        self.assertFalse(plane_variables & set(process_netcdf.surface_level_variables))
+        for job in plane_jobs:
+            self.assertTrue(all(output.startswith(f"scenarios/S1_1/{job['variable']}/time_{job['time_index']}/") for output in job["outputs"]))
+
+        facade_jobs = [job for job in self.jobs if job["stage"] == "facade_planes"]
+        self.assertEqual({job["variable"] for job in facade_jobs}, set(process_netcdf.building_data_variables))
+        self.assertEqual({job["requires"] for job in self.jobs if job["stage"] in ("cog", "parquet")}, {"rasterio", "pyarrow"})
+
+
+class JobCacheTest(unittest.TestCase):
+    def setUp(self):
+        input_directory = tempfile.TemporaryDirectory()
+        output_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(input_directory.cleanup)
+        self.addCleanup(output_directory.cleanup)
+        self.input_directory = input_directory.name
+        self.output_directory = output_directory.name
+        self.input_path = Path(self.input_directory) / f"{scenario_name}.nc"
+        self.input_path.write_bytes(b"netcdf")
+        # A few jobs of different stages are enough
+        self.jobs = [job for job in process_netcdf.plan_scenario(scenario_name, scenario_header()) if job["stage"] in ("maps", "points_list", "point_series")]
+
+    def run_jobs(self, jobs, failing_job_id: str = None):
+        def run_job(job, ds, points, output_directory):
+            if job["id"] == failing_job_id:
+                raise RuntimeError("interrupted")
+            for output in job["outputs"]:
+                process_netcdf.save_json({"job": job["stage"]}, Path(output_directory) / output)
+
+        with mock.patch.object(process_netcdf, "run_job", run_job), contextlib.redirect_stdout(io.StringIO()):
+            process_netcdf.run_jobs(jobs, None, [], self.input_directory, self.output_directory)
+
+    def cached_jobs(self):
+        return [job["id"] for job in self.jobs if process_netcdf.is_job_cached(job, self.input_directory, self.output_directory)]
+
+    def test_jobs_are_cached_once_run(self):
+        self.assertEqual(self.cached_jobs(), [])
+        self.run_jobs(self.jobs)
+        self.assertEqual(self.cached_jobs(), [job["id"] for job in self.jobs])
+
+    def test_interrupted_run_resumes(self):
+        with self.assertRaises(RuntimeError):
+            self.run_jobs(self.jobs, failing_job_id=self.jobs[1]["id"])
+        self.assertEqual(self.cached_jobs(), [self.jobs[0]["id"]])
+
+    def test_changed_input_makes_jobs_stale(self):
+        self.run_jobs(self.jobs)
+        self.input_path.write_bytes(b"netcdf, processed again")
+        self.assertEqual(self.cached_jobs(), [])
+
+    def test_removed_output_makes_its_job_stale(self):
+        self.run_jobs(self.jobs)
+        os.remove(Path(self.output_directory) / self.jobs[-1]["outputs"][0])
+        self.assertEqual(self.cached_jobs(), [job["id"] for job in self.jobs[:-1]])
+
+    def test_deduplicated_outputs_stay_cached(self):
+        # The outputs are identical to blobs of a scenario processed before this input file was written
+        self.run_jobs(self.jobs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            process_netcdf.write_scenario_manifest(scenario_name, self.output_directory)
+        for blob in (Path(self.output_directory) / "blobs").glob("*/*.json"):
+            os.utime(blob, (0, 0))
+        self.assertEqual(self.cached_jobs(), [job["id"] for job in self.jobs])
+
+    def test_changed_baseline_makes_jobs_stale(self):
+        self.addCleanup(process_netcdf.configure_baseline, None)
+        process_netcdf.configure_baseline("S0_Baseline")
+        baseline_manifest_path = Path(self.output_directory) / "scenarios" / "S0" / "manifest.json"
+        process_netcdf.save_json({"files": {}}, baseline_manifest_path)
+        self.run_jobs(self.jobs)
+        self.assertEqual(len(self.cached_jobs()), len(self.jobs))
+
+        process_netcdf.save_json({"files": {"T/time_0/horizontal_ground.json": {"hash": "0", "size": 1}}}, baseline_manifest_path)
+        self.assertEqual(self.cached_jobs(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import process_netcdf  # noqa: E402
+
+
+class ScenarioManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.output_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.output_directory.cleanup)
+        self.write_file("S1_1", "T/time_12/horizontal_human_height.json", {"mask": "0123", "values": [25.0]})
+        self.write_file("S1_1", "map.json", {"buildings": [[0, 1]]})
+        self.write_file("S1_2", "map.json", {"buildings": [[0, 1]]})  # same geometry as S1_1
+        self.write_file("S1_2", "T/time_12/horizontal_human_height.json", {"mask": "0123", "values": [26.0]})
+
+    def scenario_path(self, scenario_slug: str):
+        return Path(self.output_directory.name) / "scenarios" / scenario_slug
+
+    def write_file(self, scenario_slug: str, name: str, dict: dict):
+        process_netcdf.save_json(dict, self.scenario_path(scenario_slug) / name)
+
+    def manifest(self, *args: str):
+        # Exit code of the manifest subcommand
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                process_netcdf.manifest_main([self.output_directory.name, *args])
+            except SystemExit as e:
+                return e.code
+        return 0
+
+    def test_written_manifest_is_up_to_date(self):
+        manifest = process_netcdf.write_scenario_manifest("S1_1", self.output_directory.name)
+        self.assertTrue(manifest["blobs"])
+        self.assertEqual(sorted(manifest["files"]), ["T/time_12/horizontal_human_height.json", "map.json"])
+        entry = manifest["files"]["map.json"]
+        self.assertEqual(entry["hash"], process_netcdf.content_hash(self.scenario_path("S1_1") / "map.json"))
+        self.assertEqual(entry["size"], (self.scenario_path("S1_1") / "map.json").stat().st_size)
+        self.assertEqual(process_netcdf.check_scenario_manifest("S1_1", self.output_directory.name), [])
+
+    def test_changes_make_the_manifest_stale(self):
+        process_netcdf.write_scenario_manifest("S1_1", self.output_directory.name)
+        self.write_file("S1_1", "map.json", {"buildings": [[0, 2]]})
+        self.write_file("S1_1", "T/timeSeries/p1.json", {"v": [25.0]})
+        os.remove(self.scenario_path("S1_1") / "T/time_12/horizontal_human_height.json")
+        self.assertEqual(
+            process_netcdf.check_scenario_manifest("S1_1", self.output_directory.name),
+            ["T/timeSeries/p1.json", "T/time_12/horizontal_human_height.json", "map.json"],
+        )
+
+    def test_check(self):
+        self.assertEqual(self.manifest("--check"), 1)  # no manifest yet
+        self.assertEqual(self.manifest(), 0)
+        self.assertEqual(self.manifest("--check"), 0)
+
+        self.write_file("S1_2", "map.json", {"buildings": [[0, 2]]})
+        self.assertEqual(self.manifest("--check"), 1)
+        self.assertEqual(self.manifest("--check", "--scenario", "S1_1"), 0)
+        self.assertEqual(self.manifest("--scenario", "S1_2"), 0)
+        self.assertEqual(self.manifest("--check"), 0)
+
+    def test_identical_files_share_a_blob(self):
+        self.assertEqual(self.manifest(), 0)
+        map_1, map_2 = self.scenario_path("S1_1") / "map.json", self.scenario_path("S1_2") / "map.json"
+        self.assertTrue(os.path.samefile(map_1, map_2))
+        blob = process_netcdf.blob_path(self.output_directory.name, process_netcdf.content_hash(map_1))
+        self.assertTrue(os.path.samefile(map_1, blob))
+
+        blobs = sorted((Path(self.output_directory.name) / "blobs").glob("*/*.json"))
+        self.assertEqual(len(blobs), 3)
+
+        # Rewriting the file of one scenario leaves the other one unchanged
+        self.write_file("S1_2", "map.json", {"buildings": [[0, 2]]})
+        self.assertEqual(self.manifest(), 0)
+        self.assertTrue(os.path.samefile(map_1, blob))
+        self.assertFalse(os.path.samefile(map_1, map_2))
+
+        # The old blob is removed once no output links it anymore
+        self.write_file("S1_1", "map.json", {"buildings": [[0, 2]]})
+        self.assertEqual(self.manifest(), 0)
+        self.assertFalse(blob.exists())
+        self.assertTrue(os.path.samefile(map_1, map_2))
+        self.assertEqual(len(sorted((Path(self.output_directory.name) / "blobs").glob("*/*.json"))), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import process_netcdf  # noqa: E402
+
+plane_path = "T/time_12/horizontal_human_height.json"
+
+
+class MaskedPlaneTest(unittest.TestCase):
+    def setUp(self):
+        self.output_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.output_directory.cleanup)
+
+    def round_trip(self, grid):
+        record = process_netcdf.masked_plane_record("S1_1", grid, self.output_directory.name)
+        process_netcdf.save_json(record, Path(self.output_directory.name) / "scenarios" / "S1_1" / plane_path)
+        return record, process_netcdf.read_plane(self.output_directory.name, "S1_1", plane_path)
+
+    def mask_paths(self):
+        return sorted((Path(self.output_directory.name) / "scenarios" / "S1_1" / "masks").iterdir())
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+        grid = rng.normal(25, 2, (20, 30)).astype(np.float32)
+        grid[5:8, 10:15] = np.nan  # a building
+        grid[19, 29] = np.nan  # trailing null cell
+
+        record, decoded = self.round_trip(grid)
+        self.assertEqual(len(record["values"]), grid.size - 16)
+        np.testing.assert_array_equal(decoded, grid)
+
+    def test_runs(self):
+        valid = np.array([[False, False, True], [True, False, True]])
+        self.assertEqual(process_netcdf.mask_runs(valid), [2, 2, 1, 1])
+        # The first run is a null run, empty when the first cell is valid
+        self.assertEqual(process_netcdf.mask_runs(~valid), [0, 2, 2, 1, 1])
+        self.assertEqual(process_netcdf.mask_runs(np.ones((2, 3), dtype=bool)), [0, 6])
+        self.assertEqual(process_netcdf.mask_runs(np.zeros((2, 3), dtype=bool)), [6])
+
+    def test_leading_null_run(self):
+        grid = np.arange(12, dtype=np.float32).reshape(3, 4)
+        grid[0, :3] = np.nan
+        _, decoded = self.round_trip(grid)
+        np.testing.assert_array_equal(decoded, grid)
+
+    def test_all_valid_and_all_null_planes(self):
+        grid = np.arange(12, dtype=np.float32).reshape(3, 4)
+        _, decoded = self.round_trip(grid)
+        np.testing.assert_array_equal(decoded, grid)
+
+        record, decoded = self.round_trip(np.full((3, 4), np.nan, dtype=np.float32))
+        self.assertEqual(record["values"], [])
+        self.assertEqual(decoded.shape, (3, 4))
+        self.assertTrue(np.isnan(decoded).all())
+
+    def test_mask_is_shared(self):
+        grid = np.arange(12, dtype=np.float32).reshape(3, 4)
+        grid[1, 1:3] = np.nan
+        first, _ = self.round_trip(grid)
+        second, _ = self.round_trip(grid * 2)
+        self.assertEqual(first["mask"], second["mask"])
+        self.assertEqual([path.stem for path in self.mask_paths()], [first["mask"]])
+
+        # Same null cells in another shape, another mask
+        third, _ = self.round_trip(grid.reshape(4, 3))
+        self.assertNotEqual(third["mask"], first["mask"])
+        self.assertEqual(len(self.mask_paths()), 2)
+        with open(self.mask_paths()[0]) as f:
+            self.assertEqual(set(json.load(f)), {"shape", "runs"})
+
+
+if __name__ == "__main__":
+    unittest.main()
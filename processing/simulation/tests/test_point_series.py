@@ -0,0 +1,68 @@
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import process_netcdf  # noqa: E402
+
+coords_list = [[8.0, 10.0, 1.4], [13.0, 4.0, 0.3]]
+
+
+def scenario_dataset():
+    # A small ENVI-met like dataset, with a telescoping vertical grid
+    rng = np.random.default_rng(0)
+    heights = np.array([0.1, 0.3, 0.5, 0.7, 0.9, 1.4, 2.5, 4.0], dtype=np.float32)
+    coords = {
+        "Time": pd.date_range("2024-07-01", periods=25, freq="h"),
+        "GridsK": heights,
+        "GridsJ": np.arange(0, 40, 2, dtype=np.float32),
+        "GridsI": np.arange(0, 40, 2, dtype=np.float32),
+    }
+    return xr.Dataset(
+        {
+            "T": (("Time", "GridsK", "GridsJ", "GridsI"), rng.normal(25, 2, (25, 8, 20, 20)).astype(np.float32)),
+            "TSurf": (("Time", "GridsJ", "GridsI"), rng.normal(30, 2, (25, 20, 20)).astype(np.float32)),
+        },
+        coords=coords,
+    )
+
+
+class PointSeriesTest(unittest.TestCase):
+    def setUp(self):
+        self.ds = scenario_dataset()
+
+    def test_point_series_values(self):
+        series = process_netcdf.get_point_series_for_var_and_points(self.ds, "T", coords_list)
+        # x and y rounded up to even coordinates, z to the nearest height
+        np.testing.assert_array_equal(series[0][0], self.ds["T"].values[:, 5, 5, 4])
+        np.testing.assert_array_equal(series[1][0], self.ds["T"].values[:, 1, 2, 7])
+        self.assertEqual(series[0][1], {"x": 8.0, "y": 10.0, "z": float(np.float32(1.4))})
+
+    def test_point_series_match_time_series(self):
+        for variable_name in ["T", "TSurf"]:
+            series = process_netcdf.get_point_series_for_var_and_points(self.ds, variable_name, coords_list)
+            for coords, (values, true_coords) in zip(coords_list, series):
+                record = process_netcdf.time_series_record(self.ds, variable_name, coords)
+                self.assertEqual(record["true_coords"], true_coords)
+                self.assertEqual([row["t"] for row in record["data"]], process_netcdf.point_series_times(self.ds))
+                np.testing.assert_array_equal([row["v"] for row in record["data"]], values)
+                self.assertEqual(true_coords["z"] is None, variable_name == "TSurf")
+
+    def test_vertical_profiles_hold_the_point_series(self):
+        block, true_coords, times, heights = process_netcdf.get_column_block_for_var_and_points(self.ds, "T", coords_list, "GridsK")
+        self.assertEqual(block.shape, (2, 25, 8))
+        self.assertEqual(heights, [float(height) for height in self.ds["GridsK"].values])
+        self.assertEqual(len(times), 25)
+
+        series = process_netcdf.get_point_series_for_var_and_points(self.ds, "T", coords_list)
+        for point_block, point_true_coords, (values, series_true_coords) in zip(block, true_coords, series):
+            self.assertEqual({"x": point_true_coords["x"], "y": point_true_coords["y"]}, {"x": series_true_coords["x"], "y": series_true_coords["y"]})
+            np.testing.assert_array_equal(point_block[:, heights.index(series_true_coords["z"])], values)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import process_netcdf  # noqa: E402
+
+
+class PublishTest(unittest.TestCase):
+    def setUp(self):
+        output_directory = tempfile.TemporaryDirectory()
+        publish_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(output_directory.cleanup)
+        self.addCleanup(publish_directory.cleanup)
+        self.output_path = Path(output_directory.name)
+        self.publish_path = Path(publish_directory.name)
+
+        process_netcdf.save_json({"buildings": []}, self.output_path / "scenarios" / "S1_1" / "map.json")
+        process_netcdf.save_json({"v": [25.0]}, self.output_path / "scenarios" / "S1_1" / "T/timeSeries/p1.json")
+        process_netcdf.save_json([], self.output_path / "scenarios" / "scenarios.json")
+        process_netcdf.write_scenario_manifest("S1_1", self.output_path)
+
+    def published_files(self):
+        return sorted(path.relative_to(self.publish_path).as_posix() for path in self.publish_path.rglob("*") if path.is_file())
+
+    def test_publish_blobs_and_manifests(self):
+        self.assertEqual(process_netcdf.publish(self.output_path, self.publish_path), (4, 0))
+        published = [name for name in self.published_files() if not name.startswith("blobs/")]
+        self.assertEqual(published, [".published.json", "scenarios/S1_1/manifest.json", "scenarios/scenarios.json"])
+        self.assertEqual(len(self.published_files()), 5)
+
+        # Nothing changed, nothing is copied again
+        self.assertEqual(process_netcdf.publish(self.output_path, self.publish_path), (0, 0))
+
+    def test_only_previously_published_files_are_removed(self):
+        (self.publish_path / "README.txt").write_text("placed by hand")
+        process_netcdf.publish(self.output_path, self.publish_path)
+
+        (self.output_path / "scenarios" / "scenarios.json").unlink()
+        self.assertEqual(process_netcdf.publish(self.output_path, self.publish_path), (0, 1))
+        self.assertFalse((self.publish_path / "scenarios" / "scenarios.json").exists())
+        self.assertTrue((self.publish_path / "README.txt").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
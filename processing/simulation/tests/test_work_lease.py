@@ -0,0 +1,132 @@
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import process_netcdf  # noqa: E402
+
+lease_seconds = 60.0
+
+
+def race_worker(queue_directory: str, input_directory: str, worker_id: str, units: list[dict], start):
+    # The loop of a work mode worker, with jobs that only record which unit ran
+    queue_path = Path(queue_directory)
+
+    def run_jobs(jobs, ds, points, input_directory, output_directory, lease=None):
+        with open(queue_path / "runs.log", "a") as f:
+            f.write(f"{jobs[0]['id']}\n")
+
+    process_netcdf.run_jobs = run_jobs
+    datasets = {"S1_1_Test": (None, [])}
+    start.wait()
+    for unit in units:
+        if process_netcdf.claim_pending_work_unit(unit, queue_path, input_directory, worker_id, lease_seconds, max_attempts=3) == "claimed":
+            process_netcdf.run_work_unit(unit, queue_path, input_directory, None, worker_id, lease_seconds, datasets)
+
+
+class WorkLeaseTest(unittest.TestCase):
+    def setUp(self):
+        queue_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(queue_directory.cleanup)
+        self.queue_path = Path(queue_directory.name)
+        self.unit = {"id": "S1_1__T", "scenario": "S1_1_Test", "jobs": []}
+        self.lease_path = self.queue_path / f"{self.unit['id']}.lease"
+
+    def claim(self, worker_id: str, seconds: float = lease_seconds):
+        return process_netcdf.claim_work_unit(self.unit, self.queue_path, worker_id, seconds)
+
+    def state(self, seconds: float = lease_seconds):
+        return process_netcdf.get_work_unit_state(self.unit, self.queue_path, None, seconds, max_attempts=3)
+
+    def lease_owner(self):
+        with open(self.lease_path) as f:
+            return json.load(f)["worker"]
+
+    def expire_lease(self):
+        expired_at = time.time() - 2 * lease_seconds
+        os.utime(self.lease_path, (expired_at, expired_at))
+
+    def test_acquire(self):
+        self.assertEqual(self.state(), "free")
+        self.assertTrue(self.claim("a"))
+        self.assertFalse(self.claim("b"))
+        self.assertEqual(self.state(), "leased")
+        self.assertEqual(self.lease_owner(), "a")
+
+    def test_expired_lease_is_taken_over(self):
+        self.assertTrue(self.claim("a"))
+        self.expire_lease()
+        self.assertEqual(self.state(), "expired")
+
+        self.assertTrue(self.claim("b"))
+        self.assertEqual(self.lease_owner(), "b")
+        self.assertEqual(self.state(), "leased")
+        self.assertEqual(sorted(path.name for path in self.queue_path.iterdir()), [self.lease_path.name])
+
+    def test_previous_owner_stops_after_takeover(self):
+        self.assertTrue(self.claim("a"))
+        lease_a = process_netcdf.WorkLease(self.lease_path, "a", lease_seconds)
+        lease_a.check()
+        self.expire_lease()
+        self.assertTrue(self.claim("b"))
+        claimed_at = self.lease_path.stat().st_mtime
+
+        self.assertFalse(lease_a.renew())
+        self.assertEqual(self.lease_path.stat().st_mtime, claimed_at)
+        with self.assertRaises(process_netcdf.LeaseLostError):
+            lease_a.check()
+        lease_a.release()
+        self.assertEqual(self.lease_owner(), "b")
+
+        lease_b = process_netcdf.WorkLease(self.lease_path, "b", lease_seconds)
+        lease_b.release()
+        self.assertEqual(self.state(), "free")
+
+    def test_running_lease_is_renewed(self):
+        short_lease_seconds = 0.3
+        self.assertTrue(self.claim("a", short_lease_seconds))
+        with process_netcdf.WorkLease(self.lease_path, "a", short_lease_seconds):
+            time.sleep(3 * short_lease_seconds)
+            self.assertEqual(self.state(short_lease_seconds), "leased")
+            self.assertFalse(self.claim("b", short_lease_seconds))
+        time.sleep(2 * short_lease_seconds)
+        self.assertEqual(self.state(short_lease_seconds), "expired")
+
+
+class WorkUnitRaceTest(unittest.TestCase):
+    def test_each_unit_runs_once(self):
+        queue_directory = tempfile.TemporaryDirectory()
+        input_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(queue_directory.cleanup)
+        self.addCleanup(input_directory.cleanup)
+        (Path(input_directory.name) / "S1_1_Test.nc").write_bytes(b"")
+        units = [{"id": f"S1_1_Test--{n}", "scenario": "S1_1_Test", "jobs": [{"id": f"S1_1_Test/{n}"}]} for n in range(200)]
+
+        context = multiprocessing.get_context("spawn")
+        start = context.Event()
+        workers = [
+            context.Process(target=race_worker, args=(queue_directory.name, input_directory.name, f"w{n}", units, start))
+            for n in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        start.set()
+        for worker in workers:
+            worker.join(timeout=60)
+            self.assertEqual(worker.exitcode, 0)
+
+        with open(Path(queue_directory.name) / "runs.log") as f:
+            runs = f.read().split()
+        self.assertEqual(sorted(runs), sorted(unit["jobs"][0]["id"] for unit in units))
+        for unit in units:
+            self.assertTrue((Path(queue_directory.name) / f"{unit['id']}.done").exists())
+            self.assertFalse((Path(queue_directory.name) / f"{unit['id']}.lease").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()